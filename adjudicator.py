@@ -0,0 +1,77 @@
+from schemas import generate_structured, AdjudicatorOutput
+from context_builder import build_archivist_context, context_prompt
+from director import clamp_director_output
+
+DIRECTOR_FIELDS = ("current_objective", "narrative_direction", "global_tension", "world_events")
+
+ADJUDICATOR_INSTRUCTION = """
+    You are the Adjudicator. You manage the Game Logic and Physics AND the Pacing and Objectives of the game.
+
+    YOUR JOB (LOGIC):
+    1. Analyze the 'Player Action' for Feasibility.
+       - "I throw my ship" -> IMPOSSIBLE. Result: Failure.
+       - "I rob him" -> POSSIBLE. Result: Combat/Hostility.
+    2. Update NPC Attitudes.
+       - If player attacks/robs -> Set NPC attitude to 'hostile'.
+       - If player helps -> Set NPC attitude to 'friendly'.
+
+    CRITICAL RULE - LOGIC CHECK:
+    If the action is physically impossible, return a result indicating failure and mockery. Do NOT allow the action to succeed.
+
+    CRITICAL RULE - EMOTIONAL PERMANENCE:
+    If an NPC becomes 'hostile', they DO NOT help the player in the same turn.
+
+    YOUR JOB (PACING), judged on the outcome you just decided:
+    1. Decide if the action has ADVANCED or CHANGED the Current Objective.
+    2. If the player is asking questions ("Who is here?", "Look around"), set the 'narrative_direction' to REVEAL details.
+    3. If the player is acting ("Attack", "Run"), set 'narrative_direction' to RESOLVE action.
+    - If the player fulfilled the current objective -> CREATE A NEW OBJECTIVE immediately.
+    - If the player is ignoring the objective -> ADAPT the objective to the players intent.
+
+    OUTPUT SCHEMA:
+    {
+  "narrative_cue": "Description of outcome",
+  "npc_updates": { "npc_id": { "status": "dead", "attitude": "fearful" } },
+  "location_updates": {
+       "loc_id": {
+           "description": "The tavern is now a smoldering ruin.",
+           "remove_exits": ["upstairs"]
+       }
+   },
+  "item_updates": {
+       "old_map": { "state": "torn", "description": "A map torn in half." }
+   },
+  "current_objective": "Updated short-term goal (Max 10 words)",
+  "narrative_direction": "Instruction for the Narrator (e.g. 'Describe the monster appearing', 'Reveal a hidden door')",
+  "global_tension": Integer (1-10),
+  "world_events": []
+    }
+    """
+
+def get_adjudication(current_state, user_action):
+    """
+    The Archivist and the Director in one call: rules on the action and
+    re-plans the story from the same context. Returns the Archivist's updates
+    with the Director's fields alongside.
+    """
+    context, context_report = build_archivist_context(current_state, user_action)
+
+    prompt = f"""
+    {context_prompt(context)}
+    PLAYER ACTION: "{user_action}"
+    """
+
+    try:
+        updates = generate_structured("adjudicator", prompt, AdjudicatorOutput, system_instruction=ADJUDICATOR_INSTRUCTION)
+    except Exception as e:
+        print(f"Adjudicator Error: {e}")
+        updates = {"narrative_cue": "The action fails to take hold on reality."}
+    updates["context_report"] = context_report
+    return updates
+
+def split_director_output(updates):
+    """
+    The Director's part of a fused response, or None if the model left it out.
+    """
+    director_output = clamp_director_output({k: updates[k] for k in DIRECTOR_FIELDS if k in updates})
+    return director_output if "narrative_direction" in director_output else None
@@ -1,49 +1,18 @@
+import uuid
+import itertools
 import streamlit as st
-import json
-import base64
-from utils import load_game, save_game
-from archivist import get_archivist_response, update_world_state
-from narrator import narrate_scene
-from gtts import gTTS
-from io import BytesIO
-from director import update_story_state 
-from creator import create_new_entity, generate_full_scenario, generate_random_scenario_idea
-from scribe import scan_story_for_entities
-
-# --- CONSTANTS: DEFAULT STATE ---
-DEFAULT_STATE = {
-  "session_id": "new_game",
-  "player": {
-    "name": "Traveler",
-    "hp": 20,
-    "max_hp": 20,
-    "inventory": [
-        {"name": "Old Map", "description": "A faded, brittle map fragment.", "state": "default"},
-        {"name": "Dagger", "description": "A simple iron blade.", "state": "dull"}
-    ],
-    "journal": [] # NEW: Stores Lore/Clues
-  },
-  "current_location_id": "loc_start",
-  "world_flags": {
-    "game_started": False 
-  },
-  "locations": {
-    "loc_start": {
-      "name": "The Void",
-      "description": "The unformed nothingness before creation.",
-      "exits": []
-    }
-  },
-  "npcs": {},
-  "story_state": {
-    "current_act": 1,
-    "global_tension": 1,
-    "genre": "adaptive",
-    "current_objective": "Establish the setting.",
-    "narrative_direction": "Observe the player's tone to determine the genre."
-  },
-  "world_events": []
-}
+from engine import GameEngine
+from creator import generate_random_scenario_idea
+from dreamer import get_dream_stats
+from neighborhood import get_forge_stats
+from scribe import get_scribe_stats
+from pipeline import ADJUDICATOR_MODE
+from tracing import get_trace_summary
+from schemas import get_parse_stats
+from world_map import render_map, NEIGHBORHOOD_THRESHOLD, DEFAULT_HOPS
+from tts import audio_path, audio_segments, audio_timing, is_audio_pending
+
+MESSAGE_HISTORY = 100  # Older turns live on as summaries in the world's memory
 
 # --- UI CONFIGURATION ---
 st.set_page_config(page_title="The Dungeon Master", layout="wide")
@@ -55,10 +24,18 @@ if "messages" not in st.session_state:
 if "scenario_input" not in st.session_state:
     st.session_state["scenario_input"] = ""
 
-current_state = load_game()
-if not current_state:
-    current_state = DEFAULT_STATE
-    save_game(current_state)
+@st.cache_resource
+def get_engine():
+    return GameEngine()
+
+# One world per browser session; the id lives in the URL so a reload resumes the game
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
+
+engine = get_engine()
+session_id = st.session_state.session_id
+current_state = engine.get_state(session_id)
 
 # ==========================================
 #  GENESIS MODE
@@ -87,34 +64,9 @@ if not current_state.get("world_flags", {}).get("game_started", False):
             st.warning("Please enter a prompt.")
         else:
             with st.spinner("The World Architect is building your reality..."):
-                scenario_data = generate_full_scenario(scenario_prompt)
-                if scenario_data:
-                    start_id = "loc_genesis_start" 
-                    new_state = {
-                        "session_id": "custom_game",
-                        "player": {
-                            "name": scenario_data["player"]["name"],
-                            "hp": 20, "max_hp": 20,
-                            "inventory": scenario_data["player"]["inventory"],
-                            "journal": [] # Ensure Journal is initialized
-                        },
-                        "current_location_id": start_id,
-                        "world_flags": {"game_started": True},
-                        "locations": {
-                            start_id: scenario_data["location"]
-                        },
-                        "npcs": {},
-                        "story_state": {
-                            "current_act": 1,
-                            "global_tension": 1,
-                            "genre": scenario_data["genre"],
-                            "current_objective": "Survive and explore.",
-                            "narrative_direction": "Begin the adventure."
-                        },
-                        "world_events": []
-                    }
-                    save_game(new_state)
-                    st.session_state.messages = [{"role": "assistant", "content": scenario_data["intro_text"]}]
+                intro_text = engine.start_scenario(session_id, scenario_prompt)
+                if intro_text:
+                    st.session_state.messages = [{"role": "assistant", "content": intro_text}]
                     st.rerun()
                 else:
                     st.error("Generation Failed.")
@@ -128,7 +80,7 @@ else:
     # --- SIDEBAR ---
     st.sidebar.header("🛡️ Character Sheet")
     if st.sidebar.button("🔄 New Adventure", type="primary"):
-        save_game(DEFAULT_STATE)
+        engine.reset(session_id)
         st.session_state.messages = []
         st.session_state["scenario_input"] = ""
         st.rerun()
@@ -163,6 +115,18 @@ else:
     story_data = current_state.get("story_state", {})
     st.sidebar.info(f"**Goal:** {story_data.get('current_objective', 'Explore')}")
     st.sidebar.caption(f"**Tension:** {story_data.get('global_tension', 1)}/10")
+    dream_stats = get_dream_stats()
+    if dream_stats["hits"] + dream_stats["misses"]:
+        st.sidebar.caption(f"**Foresight:** {dream_stats['hit_rate']:.0%} of discoveries pre-dreamed, ~{dream_stats['latency_saved']:.1f}s saved")
+    forge_stats = get_forge_stats()
+    if forge_stats["hits"]:
+        st.sidebar.caption(f"**Forged ahead:** {forge_stats['hits']} moves into pre-built places, ~{forge_stats['latency_saved']:.1f}s saved")
+    scribe_stats = get_scribe_stats()
+    if scribe_stats["local"] + scribe_stats["llm"]:
+        st.sidebar.caption(f"**Scribe:** {scribe_stats['local_rate']:.0%} of scenes read locally, {scribe_stats['llm_calls_avoided']} LLM calls avoided")
+    fused_mode = st.sidebar.toggle(
+        "⚡ Fused adjudicator", value=ADJUDICATOR_MODE == "fused",
+        help="Rule on the action and re-plan the story in one LLM call instead of two.")
     
     # DM Tools / Database
     st.sidebar.divider()
@@ -197,19 +161,38 @@ else:
             else:
                 st.caption("No lore discovered.")
 
+    with st.sidebar.expander("📈 Performance", expanded=False):
+        trace_summary = get_trace_summary()
+        if trace_summary:
+            st.dataframe([
+                {"Span": name, "Calls": t["count"], "Avg (s)": t["avg"], "p95 (s)": t["p95"],
+                 "Total (s)": t["total"], "Errors": t["errors"], "Retries": t["retries"],
+                 "Cache hits": t["cache_hits"], "Tokens": t["prompt_tokens"] + t["response_tokens"],
+                 "Cached tokens": t["cached_tokens"]}
+                for name, t in trace_summary.items()
+            ], hide_index=True)
+        else:
+            st.caption("No turns traced yet.")
+        parse_stats = get_parse_stats()
+        if parse_stats:
+            st.caption("Structured replies (repaired locally / re-asked / lost):")
+            st.dataframe([
+                {"Agent": agent, "Clean": p["ok"], "Repaired": p["repaired"], "Retried": p["retried"], "Failed": p["failed"]}
+                for agent, p in parse_stats.items()
+            ], hide_index=True)
+
     # Map
     st.sidebar.subheader("🗺️ Map")
     if "locations" in current_state:
         try:
-            import graphviz
-            graph = graphviz.Digraph()
-            graph.attr(rankdir='LR', size='10', bgcolor='transparent')
-            for loc_id, loc_data in current_state["locations"].items():
-                if loc_id == current_state.get("current_location_id"):
-                    graph.node(loc_id, label=loc_data["name"], style='filled', fillcolor='#ffcccc', shape='box')
-                else:
-                    graph.node(loc_id, label=loc_data["name"], shape='ellipse', style='filled', fillcolor='#f0f2f6')
-            st.sidebar.graphviz_chart(graph)
+            local_view = st.sidebar.toggle(
+                "Nearby only", value=len(current_state["locations"]) > NEIGHBORHOOD_THRESHOLD,
+                help=f"Show locations within {DEFAULT_HOPS} exits of you.")
+            dot_source, svg = render_map(current_state, DEFAULT_HOPS if local_view else None)
+            if svg:
+                st.sidebar.markdown(svg, unsafe_allow_html=True)
+            else:
+                st.sidebar.graphviz_chart(dot_source)
         except ImportError:
             pass
 
@@ -219,154 +202,47 @@ else:
             if "debug_log" in message:
                 with st.expander("🤖 Archivist Logic"):
                     st.json(message["debug_log"])
+            if "timings" in message:
+                with st.expander("⏱️ Turn Timings"):
+                    st.json(dict(message["timings"], audio=audio_timing(message.get("audio_key"))))
             st.markdown(message["content"])
-            if "audio_b64" in message and message["audio_b64"]:
-                audio_html = f"""
-                    <audio controls style="width: 100%;">
-                    <source src="data:audio/mp3;base64,{message['audio_b64']}" type="audio/mp3">
-                    </audio>
-                """
-                st.markdown(audio_html, unsafe_allow_html=True)
+            if message.get("audio_key"):
+                clip = audio_path(message["audio_key"])
+                if clip:
+                    st.audio(clip, format="audio/mp3")
+                elif is_audio_pending(message["audio_key"]):
+                    # Play the sentences that are ready while the rest are synthesized
+                    for segment in audio_segments(message["audio_key"]):
+                        st.audio(segment, format="audio/mp3")
+                    st.caption("🔊 The narrator is clearing their throat...")
 
     # --- INPUT ---
     if prompt := st.chat_input("What do you do?"):
         st.chat_message("user").markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
 
-        # 1. ARCHIVIST
-        with st.spinner("The Archivist is thinking..."):
-            updates = get_archivist_response(current_state, prompt)
-            
-            # Creator Logic (Discovery)
-            if "error" in updates and updates["error"] == "target_missing":
-                missing_name = updates.get("target_name", "Unknown Area")
-                if missing_name.lower() in ["outside", "exit", "door", "leave", "out"]:
-                    missing_name = "The Surrounding Area" 
-                with st.spinner(f"⚠️ Discovering '{missing_name}'..."):
-                    curr_loc = current_state.get("current_location_id", "unknown")
-                    new_entity = create_new_entity(missing_name, curr_loc, current_state)
-                    if new_entity:
-                        if new_entity["type"] == "location":
-                            loc_id = new_entity["id"]
-                            loc_data = new_entity["data"]
-                            clean_exits = [e for e in loc_data.get("exits", []) if e.lower() != loc_data["name"].lower()]
-                            loc_data["exits"] = clean_exits
-                            current_state["locations"][loc_id] = loc_data
-                            
-                            old_loc_id = current_state["current_location_id"]
-                            old_loc = current_state["locations"].get(old_loc_id)
-                            if old_loc:
-                                if "exits" not in old_loc: old_loc["exits"] = []
-                                if loc_data["name"] not in old_loc["exits"]:
-                                    old_loc["exits"].append(loc_data["name"])
-                                loc_data["exits"].append(f"Back to {old_loc['name']}")
-                            
-                            current_state["current_location_id"] = loc_id
-                            if "suggested_exits" in loc_data:
-                                suggestions = "; ".join(loc_data["suggested_exits"])
-                                updates["narrative_cue"] = f"You arrive at {loc_data['name']}. {loc_data['description']} Visible paths: {suggestions}."
-                            st.toast(f"✨ Discovered: {loc_data['name']}")
-                        
-                        elif new_entity["type"] == "npc":
-                             current_state["npcs"][new_entity["id"]] = new_entity["data"]
-                             st.toast(f"✨ Met NPC: {new_entity['data']['name']}")
-                        
-                        elif new_entity["type"] == "item":
-                             item_obj = {"name": new_entity["item_name"], "description": "Discovered.", "state": "found"}
-                             current_state["player"]["inventory"].append(item_obj)
-                             updates["narrative_cue"] = f"You found a {new_entity['item_name']}."
-                             st.toast(f"✨ Found Item: {new_entity['item_name']}")
-                        
-                        save_game(current_state)
-                        if "narrative_cue" not in updates:
-                            updates = get_archivist_response(current_state, prompt)
-            
-            log_msg = updates.get("narrative_cue", "Events unfold...")
-            new_state = update_world_state(updates)
-
-        # 2. DIRECTOR
-        with st.spinner("The Director is adapting the plot..."):
-            director_output = update_story_state(new_state, prompt, log_msg)
-            if "story_state" not in new_state: new_state["story_state"] = {}
-            new_state["story_state"]["narrative_direction"] = director_output.get("narrative_direction")
-            new_state["story_state"]["global_tension"] = director_output.get("global_tension", 1)
-            if "current_objective" in director_output:
-                new_state["story_state"]["current_objective"] = director_output["current_objective"]
-            if "world_events" in director_output:
-                new_state["world_events"] = director_output["world_events"]
-            save_game(new_state)
-
-        # 3. NARRATOR
-        with st.spinner("The Narrator is writing..."):
-            story = narrate_scene(new_state, prompt, log_msg)
-
-        # 4. SCRIBE (Sync)
-        if story:
-            new_entities = scan_story_for_entities(story, new_state)
-            
-            # Items
-            if "new_items" in new_entities and new_entities["new_items"]:
-                for item_name in new_entities["new_items"]:
-                    existing_names = [i["name"].lower() if isinstance(i, dict) else str(i).lower() for i in new_state["player"]["inventory"]]
-                    if item_name.lower() not in existing_names:
-                        new_state["player"]["inventory"].append({"name": item_name, "description": "Added by Scribe.", "state": "acquired"})
-                        st.toast(f"📝 Scribe added item: {item_name}")
-            
-            # NPCs
-            if "new_npcs" in new_entities and new_entities["new_npcs"]:
-                for npc in new_entities["new_npcs"]:
-                    if npc.get("presence") == "physical":
-                        nid = f"scribe_npc_{npc['name'].lower().replace(' ', '_')}"
-                        if nid not in new_state["npcs"]:
-                            new_state["npcs"][nid] = {
-                                "name": npc['name'], 
-                                "location_id": new_state["current_location_id"], 
-                                "status": npc.get("status", "alive"), 
-                                "attitude": "unknown"
-                            }
-                            st.toast(f"📝 Scribe recorded NPC: {npc['name']}")
-
-            # Locations
-            if "new_locations" in new_entities and new_entities["new_locations"]:
-                for loc in new_entities["new_locations"]:
-                    lid = f"scribe_loc_{loc['name'].lower().replace(' ', '_')}"
-                    if lid not in new_state["locations"]:
-                        new_state["locations"][lid] = {"name": loc['name'], "description": loc.get("description", "A location."), "exits": []}
-                        curr_id = new_state.get("current_location_id")
-                        if curr_id in new_state["locations"]:
-                            if loc["name"] not in new_state["locations"][curr_id]["exits"]:
-                                new_state["locations"][curr_id]["exits"].append(loc["name"])
-                        st.toast(f"📝 Scribe mapped: {loc['name']}")
-            
-            # --- NEW: JOURNAL LOGIC ---
-            if "new_lore" in new_entities and new_entities["new_lore"]:
-                if "journal" not in new_state["player"]:
-                    new_state["player"]["journal"] = []
-                for entry in new_entities["new_lore"]:
-                    # Check for duplicates (simple check)
-                    is_dupe = any(e['topic'] == entry['topic'] for e in new_state["player"]["journal"])
-                    if not is_dupe:
-                        new_state["player"]["journal"].append(entry)
-                        st.toast(f"📖 Journal Updated: {entry['topic']}")
-
-            save_game(new_state)
-
-        # 5. AUDIO
-        audio_b64 = None
-        if story:
-            try:
-                tts = gTTS(text=story, lang='en', slow=False)
-                audio_bytes = BytesIO()
-                tts.write_to_fp(audio_bytes)
-                audio_bytes.seek(0)
-                audio_b64 = base64.b64encode(audio_bytes.read()).decode()
-            except Exception:
-                pass
+        # Archivist -> (Director || Narrator) -> (Scribe || Audio)
+        pending_turn = engine.start_turn(session_id, prompt, mode="fused" if fused_mode else "split")
+        with st.chat_message("assistant"):
+            with st.spinner("The Archivist is thinking..."):
+                narration = pending_turn.stream_narration()
+                first_chunk = next(narration, "")
+            st.write_stream(itertools.chain([first_chunk], narration))
+            # Each sentence is playable as soon as it is voiced; the first starts on its own
+            for i, segment_key in enumerate(pending_turn.stream_audio()):
+                st.audio(audio_path(segment_key), format="audio/mp3", autoplay=i == 0)
+        with st.spinner("The Scribe is updating the records..."):
+            turn = pending_turn.result()
+
+        for notice in turn["notices"]:
+            st.toast(notice)
 
         st.session_state.messages.append({
             "role": "assistant", 
-            "content": story,
-            "audio_b64": audio_b64, 
-            "debug_log": updates
+            "content": turn["story"],
+            "audio_key": turn["audio_key"], 
+            "debug_log": turn["updates"],
+            "timings": turn["timings"]
         })
+        del st.session_state.messages[:-MESSAGE_HISTORY]
         st.rerun()
\ No newline at end of file
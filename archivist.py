@@ -1,22 +1,8 @@
-import os
-import json
-import google.generativeai as genai
-from dotenv import load_dotenv
-from utils import load_game, save_game
+from schemas import generate_structured, ArchivistOutput
+from context_builder import build_archivist_context, context_prompt
+from world import WorldState
 
-load_dotenv()
-model_name = 'models/gemini-2.5-flash' 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-def get_archivist_response(current_state, user_action):
-    model = genai.GenerativeModel(model_name,
-        generation_config={"response_mime_type": "application/json"})
-
-    # Extract relevant NPC data for context
-    loc_id = current_state.get("current_location_id")
-    local_npcs = {k:v for k,v in current_state.get("npcs", {}).items() if v.get("location_id") == loc_id}
-
-    system_prompt = """
+ARCHIVIST_INSTRUCTION = """
     You are the Archivist. You manage the Game Logic and Physics.
     
     YOUR JOB:
@@ -49,23 +35,30 @@ def get_archivist_response(current_state, user_action):
     }
     """
 
+def get_archivist_response(current_state, user_action):
+    # Only the slice of the world this action can touch
+    context, context_report = build_archivist_context(current_state, user_action)
+
     prompt = f"""
-    {system_prompt}
-    CURRENT STATE: {json.dumps(current_state)}
-    LOCAL NPCS: {json.dumps(local_npcs)}
+    {context_prompt(context)}
     PLAYER ACTION: "{user_action}"
     """
 
-    response = model.generate_content(prompt)
-    
     try:
-        return json.loads(response.text)
-    except json.JSONDecodeError:
-        return {"narrative_cue": "The action fails to take hold on reality."}
+        updates = generate_structured("archivist", prompt, ArchivistOutput, system_instruction=ARCHIVIST_INSTRUCTION)
+    except Exception as e:
+        # Unparseable or unreachable: the action simply doesn't take, and the turn goes on
+        print(f"Archivist Error: {e}")
+        updates = {"narrative_cue": "The action fails to take hold on reality."}
+    updates["context_report"] = context_report
+    return updates
 
-def update_world_state(updates):
-    state = load_game()
-    
+def update_world_state(state, updates):
+    """
+    Applies the Archivist's updates to the live state in place and returns it.
+    Persisting is left to the caller.
+    """
+    state = WorldState.wrap(state)
     if "player_update" in updates:
         pass
     if "narrative_cue" in updates:
@@ -74,11 +67,12 @@ def update_world_state(updates):
     
     if "player" in updates:
         for k, v in updates['player'].items(): state['player'][k] = v
+        state.invalidate()  # May have swapped the inventory or journal wholesale
     if "player_update" in updates:
         p = updates['player_update']
         if "hp" in p: state['player']['hp'] = p['hp']
         if "inventory_add" in p: 
-            for i in p['inventory_add']: state['player']['inventory'].append(i)
+            for i in p['inventory_add']: state.add_item(i, dedupe=False)
     if "location_updates" in updates:
         for loc_id, mutations in updates["location_updates"].items():
             # Handle "Current Location" alias
@@ -89,6 +83,7 @@ def update_world_state(updates):
                 # Update description if provided
                 if "description" in mutations:
                     state["locations"][loc_id]["description"] = mutations["description"]
+                    state.mark_changed("location", loc_id)
                 # Handle exits changes
                 if "remove_exits" in mutations:
                     state["locations"][loc_id]["exits"] = [
@@ -100,8 +95,6 @@ def update_world_state(updates):
     npc_source = updates.get("npcs") or updates.get("npc_updates")
     if npc_source:
         for nid, ndata in npc_source.items():
-            if nid in state['npcs']:
-                for k, v in ndata.items(): state['npcs'][nid][k] = v
+            state.update_npc(nid, ndata)
 
-    save_game(state)
     return state
\ No newline at end of file
@@ -0,0 +1,266 @@
+"""
+End-to-end turn benchmark. Drives scripted turns through the same pipeline
+app.py uses, against the offline stub backend by default. The JSON report
+is the only thing written to stdout; the agents' diagnostics go to stderr.
+
+    python benchmark.py --turns 50 --latency 0.2
+    python benchmark.py --mode compare   # split vs fused adjudicator
+    python benchmark.py --prefix compare # prompts inlined vs system instructions
+    python benchmark.py --world-size 500 # save formats on a world padded to 500 locations
+"""
+import os
+import sys
+import copy
+import json
+import time
+import math
+import shutil
+import argparse
+import tempfile
+import llm
+import tts
+import snapshot
+import semantic_index
+from scheduler import Scheduler, set_scheduler, get_scheduler, RATE_LIMIT
+from tracing import get_trace_summary, reset_traces
+from stub_backend import StubBackend
+from utils import DEFAULT_STATE, load_game, save_game, get_store, write_atomic
+from pipeline import run_turn, ADJUDICATOR_MODE
+from scribe import get_scribe_stats
+from neighborhood import refresh_neighborhood, get_forge_stats
+from schemas import get_parse_stats
+
+SCRIPT = [
+    "Look around",
+    "Go to the old watchtower",
+    "Walk to the narrow stair going down",
+    "Talk to the stranger by the fire",
+    "Search the room for anything useful",
+    "I pick up the lantern",
+    "Enter the cellar",
+    "Ask about the missing caravan",
+]
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+def measure(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def pad_world(state, size):
+    """
+    Adds synthetic locations, NPCs and journal entries until the world has 'size' locations.
+    """
+    state = copy.deepcopy(state)
+    for i in range(len(state["locations"]), size):
+        state["locations"][f"bench_loc_{i}"] = {
+            "name": f"Bench Hall {i}",
+            "description": f"A draughty hall, number {i}, lined with faded banners and cold braziers.",
+            "exits": [f"Bench Hall {(i * 7 + k) % size}" for k in range(1, 4)],
+            "suggested_exits": ["a crumbling archway", "a spiral stair"]
+        }
+        if i % 2 == 0:
+            state["npcs"][f"bench_npc_{i}"] = {
+                "name": f"Warden {i}", "location_id": f"bench_loc_{i}", "status": "alive", "attitude": "neutral"
+            }
+        state["player"]["journal"].append({"topic": f"Bench Lore {i}", "entry": f"Hall {i} was sealed after the flood."})
+    return state
+
+def compare_formats(state, workdir):
+    """
+    Size, full save/load time and a 'locations'-only load for the JSON save
+    and each snapshot codec available here.
+    """
+    results = {}
+    json_path = os.path.join(workdir, "formats.json")
+
+    def load_json():
+        with open(json_path) as f:
+            return json.load(f)
+
+    results["json"] = {
+        "bytes": len(json.dumps(state, indent=4)),
+        "save": measure(lambda: write_atomic(json_path, json.dumps(state, indent=4))),
+        "load": measure(load_json)
+    }
+    results["json"]["load_locations_only"] = results["json"]["load"]
+    codecs = ["json"] + (["msgpack"] if snapshot.msgpack else [])
+    for codec in codecs:
+        for intern in (False, True):
+            path = os.path.join(workdir, f"formats_{codec}_{intern}.snap")
+            size = snapshot.write_snapshot(path, state, codec, intern)
+            results[f"snapshot_{codec}" + ("_interned" if intern else "")] = {
+                "bytes": size,
+                "save": measure(lambda: snapshot.write_snapshot(path, state, codec, intern)),
+                "load": measure(lambda: snapshot.read_snapshot(path)),
+                "load_locations_only": measure(lambda: snapshot.SnapshotReader(path)["locations"])
+            }
+    return {name: {k: round(v, 5) if isinstance(v, float) else v for k, v in r.items()} for name, r in results.items()}
+
+def run_benchmark(turns, latency, use_stub=True, mode=None, rate=None, malformed=0.0, forge=True, world_size=0):
+    if use_stub:
+        llm.set_backend(StubBackend(latency=latency, malformed_rate=malformed))
+    # The stub has no quota to protect, so it runs unthrottled unless a rate is being tested
+    set_scheduler(Scheduler(rate=rate if rate is not None else (0 if use_stub else RATE_LIMIT)))
+    llm.CACHE_ENABLED = False  # Measure the pipeline, not the response cache
+    llm.reset_metrics()
+    reset_traces()
+
+    workdir = tempfile.mkdtemp(prefix="dungeon_bench_")
+    save_path = os.path.join(workdir, "world_state.json")
+    semantic_index.set_index(semantic_index.SemanticIndex(os.path.join(workdir, "embeddings")))
+    # No network TTS and no clips left behind in audio_cache/
+    tts.set_audio_cache(tts.AudioCache(os.path.join(workdir, "audio"), backend="none"))
+
+    state = copy.deepcopy(DEFAULT_STATE)
+    state["world_flags"]["game_started"] = True
+    save_game(state, save_path)
+
+    stage_times = {}
+    walls, serials, ttfts, sizes = [], [], [], []
+    for i in range(turns):
+        turn = run_turn(state, SCRIPT[i % len(SCRIPT)], save_path, mode=mode)
+        state = turn["state"]
+        timings = turn["timings"]
+        for stage, t in timings["stages"].items():
+            stage_times.setdefault(stage, []).append(t["duration"])
+        walls.append(timings["wall"])
+        serials.append(timings["serial"])
+        if "time_to_first_token" in timings:
+            ttfts.append(timings["time_to_first_token"])
+        sizes.append(len(json.dumps(state)))
+        if forge:
+            refresh_neighborhood(state)  # What the engine does in the background while the player reads
+
+    # Persistence cost at the final world size
+    store = get_store(save_path)
+
+    def small_change_save():
+        state["player"]["hp"] = state["player"].get("hp", 0) + 1
+        save_game(state, save_path)
+
+    incremental_save = measure(small_change_save)
+    full_save = measure(lambda: store._compact(state))
+    load = measure(lambda: load_game(save_path))
+    formats = compare_formats(pad_world(state, world_size) if world_size else state, workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "turns": turns,
+        "stub_latency": latency if use_stub else None,
+        "mode": mode or ADJUDICATOR_MODE,
+        "stages": {
+            stage: {"p50": round(percentile(v, 0.5), 4), "p95": round(percentile(v, 0.95), 4)}
+            for stage, v in stage_times.items()
+        },
+        "turn_wall": {"p50": round(percentile(walls, 0.5), 4), "p95": round(percentile(walls, 0.95), 4)},
+        "turn_serial": {"p50": round(percentile(serials, 0.5), 4), "p95": round(percentile(serials, 0.95), 4)},
+        "time_to_first_token": {"p50": round(percentile(ttfts, 0.5), 4), "p95": round(percentile(ttfts, 0.95), 4)},
+        "state_bytes": {"first_turn": sizes[0] if sizes else 0, "last_turn": sizes[-1] if sizes else 0},
+        "persistence_seconds": {
+            "incremental_save": round(incremental_save, 5),
+            "full_snapshot_save": round(full_save, 5),
+            "load": round(load, 5)
+        },
+        "save_formats": formats,
+        "scribe": get_scribe_stats(),
+        "forge": get_forge_stats(),
+        "parsing": get_parse_stats(),
+        "scheduler": get_scheduler().get_stats(),
+        "traces": get_trace_summary(),
+        "llm": llm.get_metrics()
+    }
+
+def llm_totals(report):
+    metrics = report["llm"].values()
+    return {
+        "calls": sum(m["calls"] for m in metrics),
+        "prompt_tokens": sum(m["prompt_tokens"] for m in metrics),
+        "cached_tokens": sum(m["cached_tokens"] for m in metrics),
+        "response_tokens": sum(m["response_tokens"] for m in metrics)
+    }
+
+def compare_modes(turns, latency, use_stub=True):
+    """
+    Runs the same script with split and fused adjudication and sets the
+    per-turn latency and token cost side by side.
+    """
+    reports = {mode: run_benchmark(turns, latency, use_stub, mode) for mode in ("split", "fused")}
+    summary = {}
+    for mode, report in reports.items():
+        totals = llm_totals(report)
+        summary[mode] = {
+            "turn_wall_p50": report["turn_wall"]["p50"],
+            "turn_wall_p95": report["turn_wall"]["p95"],
+            "llm_calls_per_turn": round(totals["calls"] / turns, 2),
+            "tokens_per_turn": round((totals["prompt_tokens"] + totals["response_tokens"]) / turns, 1)
+        }
+    return {"summary": summary, "runs": reports}
+
+def compare_prefix(turns, latency, use_stub=True, mode=None):
+    """
+    Runs the script with the static prompts inlined in every request (the old
+    layout) and then sent as system instructions, and compares per-turn input
+    tokens, the share of them served from a cached prefix, and narrator TTFT.
+    """
+    reports = {}
+    original = llm.SYSTEM_INSTRUCTIONS
+    try:
+        for label, enabled in (("before", False), ("after", True)):
+            llm.SYSTEM_INSTRUCTIONS = enabled
+            reports[label] = run_benchmark(turns, latency, use_stub, mode)
+    finally:
+        llm.SYSTEM_INSTRUCTIONS = original
+    summary = {}
+    for label, report in reports.items():
+        totals = llm_totals(report)
+        summary[label] = {
+            "input_tokens_per_turn": round(totals["prompt_tokens"] / turns, 1),
+            "uncached_input_tokens_per_turn": round((totals["prompt_tokens"] - totals["cached_tokens"]) / turns, 1),
+            "cached_share": round(totals["cached_tokens"] / totals["prompt_tokens"], 3) if totals["prompt_tokens"] else 0.0,
+            "ttft_p50": report["time_to_first_token"]["p50"],
+            "ttft_p95": report["time_to_first_token"]["p95"],
+            "turn_wall_p50": report["turn_wall"]["p50"]
+        }
+    return {"summary": summary, "runs": reports}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the turn pipeline.")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub seconds per LLM call")
+    parser.add_argument("--live", action="store_true", help="Use the configured backend instead of the stub")
+    parser.add_argument("--rate", type=float, help="Scheduler requests/second (default: unlimited)")
+    parser.add_argument("--malformed", type=float, default=0.0, help="Share of stub JSON replies to mangle")
+    parser.add_argument("--mode", choices=["split", "fused", "compare"], help="Adjudicator mode (default: ADJUDICATOR_MODE)")
+    parser.add_argument("--no-forge", action="store_true", help="Don't forge neighborhoods between turns")
+    parser.add_argument("--world-size", type=int, default=0, help="Pad the world to this many locations when comparing save formats")
+    parser.add_argument("--prefix", choices=["compare"], help="Compare inlined prompts with system instructions")
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Agents (and their background workers) print as they go; keep stdout for the report alone
+    report_stream, sys.stdout = sys.stdout, sys.stderr
+    if args.prefix == "compare":
+        report = compare_prefix(args.turns, args.latency, use_stub=not args.live,
+                                mode=None if args.mode == "compare" else args.mode)
+    elif args.mode == "compare":
+        report = compare_modes(args.turns, args.latency, use_stub=not args.live)
+    else:
+        report = run_benchmark(args.turns, args.latency, use_stub=not args.live, mode=args.mode, rate=args.rate,
+                               malformed=args.malformed, forge=not args.no_forge, world_size=args.world_size)
+    print(json.dumps(report, indent=2), file=report_stream, flush=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
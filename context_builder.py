@@ -0,0 +1,124 @@
+import json
+import re
+from world import WorldState
+from memory import memory_context
+from semantic_index import relevant_facts
+
+TOKEN_BUDGET = 1200    # Rough ceiling for the world portion of the Archivist prompt
+JOURNAL_TOP_K = 5
+CHARS_PER_TOKEN = 4    # Close enough to Gemini's tokenizer for budgeting
+STABLE_KEYS = ("current_location_id", "current_location", "exits", "local_npcs")  # Change only when the player moves or the scene does
+
+STOPWORDS = {
+    "a", "an", "the", "i", "to", "of", "and", "or", "in", "on", "at", "with", "my",
+    "me", "it", "is", "up", "for", "into", "from", "his", "her", "their", "this", "that"
+}
+
+def estimate_tokens(obj):
+    text = obj if isinstance(obj, str) else json.dumps(obj)
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def stable_json(obj):
+    """
+    Canonical JSON: the same world always serializes to the same text, so
+    consecutive prompts share as long a prefix as possible.
+    """
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"))
+
+def context_prompt(context):
+    """
+    A built context as prompt text, the slowly-changing scene ahead of the
+    per-turn state, so a cached prefix still matches after most turns.
+    """
+    scene = {k: context[k] for k in STABLE_KEYS if k in context}
+    turn = {k: v for k, v in context.items() if k not in STABLE_KEYS}
+    return f"SCENE: {stable_json(scene)}\n    CURRENT STATE: {stable_json(turn)}"
+
+def _words(text):
+    return set(re.findall(r"[a-z0-9']+", str(text).lower())) - STOPWORDS
+
+def _relevance(obj, action_words):
+    return len(_words(json.dumps(obj)) & action_words)
+
+def _resolve_exits(location, world):
+    """
+    Exits are stored as names; attach the location id when the name is a known place.
+    """
+    exits = []
+    for exit_name in location.get("exits", []):
+        target = exit_name[len("Back to "):] if exit_name.startswith("Back to ") else exit_name
+        ref = world.find("location", target)
+        exits.append({"exit": exit_name, "location_id": ref.id} if ref else {"exit": exit_name})
+    return exits
+
+def build_archivist_context(current_state, user_action, token_budget=TOKEN_BUDGET, journal_k=JOURNAL_TOP_K):
+    """
+    Picks the slice of the world the Archivist needs to judge one action:
+    the current location and its exits, NPCs standing there, the inventory
+    (full records only for items the action mentions), the journal entries
+    that best match the action and the bounded story memory.
+
+    Returns (context, report) where report compares the pruned context with
+    sending the whole state.
+    """
+    world = WorldState.wrap(current_state)
+    action_words = _words(user_action)
+    locations = current_state.get("locations", {})
+    loc_id = current_state.get("current_location_id")
+    location = locations.get(loc_id, {})
+    player = current_state.get("player", {})
+
+    local_npcs = world.npcs_at(loc_id)
+
+    inventory = []
+    for item in player.get("inventory", []):
+        if isinstance(item, dict):
+            inventory.append(item if _relevance(item, action_words) else {"name": item.get("name")})
+        else:
+            inventory.append({"name": str(item)})
+
+    # Most relevant first: by embedding similarity, else by shared words with the newest breaking ties
+    entries = player.get("journal", [])
+    by_text = {f"{e.get('topic')}: {e.get('entry', '')}": e for e in entries}
+    journal = [by_text[t] for t in relevant_facts(current_state, user_action, journal_k, kinds=("journal",)) if t in by_text]
+    if entries and not journal:
+        journal = list(enumerate(entries))
+        journal.sort(key=lambda pair: (_relevance(pair[1], action_words), pair[0]), reverse=True)
+        journal = [entry for _, entry in journal[:journal_k]]
+
+    context = {
+        "player": {
+            "name": player.get("name"),
+            "hp": player.get("hp"),
+            "max_hp": player.get("max_hp"),
+            "inventory": inventory
+        },
+        "current_location_id": loc_id,
+        "current_location": {
+            "name": location.get("name"),
+            "description": location.get("description")
+        },
+        "exits": _resolve_exits(location, world),
+        "local_npcs": local_npcs,
+        "journal": journal,
+        "story_state": current_state.get("story_state", {}),
+        "story_so_far": memory_context(current_state),
+        "active_events": [e for e in current_state.get("world_events", []) if e.get("status") == "active"]
+    }
+
+    # Over budget: shed the least relevant lore first, then older memory, then item details
+    while estimate_tokens(context) > token_budget and context["journal"]:
+        context["journal"].pop()
+    while estimate_tokens(context) > token_budget and context["story_so_far"]["chapters"]:
+        context["story_so_far"]["chapters"].pop(0)
+    if estimate_tokens(context) > token_budget:
+        context["player"]["inventory"] = [{"name": i.get("name")} for i in inventory]
+
+    full_tokens = estimate_tokens(current_state)
+    context_tokens = estimate_tokens(context)
+    report = {
+        "full_state_tokens": full_tokens,
+        "context_tokens": context_tokens,
+        "saved_tokens": full_tokens - context_tokens
+    }
+    return context, report
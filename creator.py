@@ -1,59 +1,64 @@
-import os
+import re
 import json
-import google.generativeai as genai
-from dotenv import load_dotenv
+from llm import generate, get_metrics
+from schemas import generate_structured, CreatorOutput, ScenarioOutput, NeighborhoodOutput
+from semantic_index import relevant_facts
 
-load_dotenv()
-MODEL_NAME = 'models/gemini-2.5-flash' 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+DEFAULT_LATENCY = 3.0  # Seconds; used until we have measured real Creator calls
 
-def create_new_entity(target_name, current_location, current_state=None):
+def expected_latency():
     """
-    Generates a new specific entity (Location, NPC, or Item) during gameplay.
+    What a Creator call costs on average, i.e. the wait a pre-built discovery saves.
     """
-    genre = "High Fantasy"
-    if current_state:
-        genre = current_state.get("story_state", {}).get("genre", "adaptive")
-
-    model = genai.GenerativeModel(MODEL_NAME, 
-        generation_config={"response_mime_type": "application/json"})
+    return get_metrics().get("creator", {}).get("latency_avg") or DEFAULT_LATENCY
 
-    prompt = f"""
+CREATOR_INSTRUCTION = """
     You are the World Forger.
     
-    CURRENT GENRE: {genre}
-    CONTEXT: Player is at {current_location}.
-    TARGET: Player wants to go to/interact with '{target_name}'.
-    
     RULES:
     1. **MATCH THE GENRE:** Ensure the creation fits the current setting.
     2. **SPATIAL LOGIC:** Ensure locations make physical sense.
     3. **VISUAL EXITS:** For locations, 'suggested_exits' must be visual descriptions, not names.
+    4. **OUTCOME:** 'narrative_cue' tells the Narrator what just happened: the player arriving, meeting or finding it (1-2 sentences).
     
     OUTPUT SCHEMA:
-    {{
+    {
       "type": "location" | "npc" | "item",
       "id": "gen_...",
       "item_name": "...", 
-      "data": {{ ... }}
-    }}
+      "data": { ... },
+      "narrative_cue": "..."
+    }
     """
-    
-    try:
-        response = model.generate_content(prompt)
-        return json.loads(response.text)
-    except Exception as e:
-        print(f"Creator Error: {e}")
-        return None
 
-def generate_full_scenario(user_prompt):
-    """
-    Generates a complete starting state based on a user concept.
+FORGER_INSTRUCTION = """
+    You are the World Forger, building ahead of the player.
+    
+    YOUR JOB:
+    For EACH exit listed in EXITS, create the location it leads to, and the NPCs (0-2) found there.
+    
+    RULES:
+    1. **MATCH THE GENRE:** Ensure every creation fits the current setting.
+    2. **SPATIAL LOGIC:** Each location must make sense on the other side of its exit.
+    3. **VISUAL EXITS:** 'suggested_exits' must be visual descriptions, not names. Include a way back.
+    4. **OUTCOME:** 'narrative_cue' describes the player arriving there (1-2 sentences).
+    5. Copy each exit text exactly into 'exit'.
+    
+    OUTPUT SCHEMA:
+    {
+      "locations": [
+        {
+          "exit": "the exit text, verbatim",
+          "id": "gen_...",
+          "data": { "name": "...", "description": "...", "exits": [], "suggested_exits": ["..."] },
+          "narrative_cue": "...",
+          "npcs": [{ "name": "...", "description": "...", "attitude": "neutral" }]
+        }
+      ]
+    }
     """
-    model = genai.GenerativeModel(MODEL_NAME, 
-        generation_config={"response_mime_type": "application/json"})
 
-    system_prompt = """
+ARCHITECT_INSTRUCTION = """
     You are the World Architect. 
     Your job is to initialize a text-adventure game state based on a theme.
     
@@ -84,15 +89,85 @@ def generate_full_scenario(user_prompt):
       "intro_text": "String"
     }
     """
+
+def create_new_entity(target_name, current_location, current_state=None):
+    """
+    Generates a new specific entity (Location, NPC, or Item) during gameplay.
+    """
+    genre = "High Fantasy"
+    related = []
+    if current_state:
+        genre = current_state.get("story_state", {}).get("genre", "adaptive")
+        related = relevant_facts(current_state, target_name, 3)
+
+    prompt = f"""
+    CURRENT GENRE: {genre}
+    CONTEXT: Player is at {current_location}.
+    RELATED LORE (stay consistent with it): {related}
+    TARGET: Player wants to go to/interact with '{target_name}'.
+    """
     
+    try:
+        entity = generate_structured("creator", prompt, CreatorOutput, cache=True, system_instruction=CREATOR_INSTRUCTION)
+    except Exception as e:
+        print(f"Creator Error: {e}")
+        return None
+    # Fill what the model is allowed to leave out
+    entity["data"]["name"] = entity["data"]["name"] or entity["item_name"] or target_name
+    entity["item_name"] = entity["item_name"] or entity["data"]["name"]
+    entity["id"] = entity["id"] or "gen_" + re.sub(r"[^a-z0-9]+", "_", entity["data"]["name"].lower()).strip("_")
+    return entity
+
+def forge_neighborhood(current_state, exits):
+    """
+    Generates the locations behind several exits of the current location,
+    with their NPCs, in one call. Returns Creator-shaped entities (plus the
+    'exit' they belong to and their 'npcs'), or [] on failure.
+    """
+    location = current_state.get("locations", {}).get(current_state.get("current_location_id"), {})
+    genre = current_state.get("story_state", {}).get("genre", "adaptive")
+
+    prompt = f"""
+    CURRENT GENRE: {genre}
+    RELATED LORE (stay consistent with it): {relevant_facts(current_state, location.get("name", ""), 3)}
+    CURRENT LOCATION: {location.get("name", "Unknown")} ({location.get("description", "")})
+    EXITS: {json.dumps(exits)}
+    """
+
+    try:
+        forged = generate_structured("forger", prompt, NeighborhoodOutput, cache=True, system_instruction=FORGER_INSTRUCTION)
+    except Exception as e:
+        print(f"Forger Error: {e}")
+        return []
+    wanted = {e.lower(): e for e in exits}
+    entities = []
+    for loc in forged["locations"]:
+        exit_name = wanted.get(loc["exit"].lower())
+        if not exit_name:
+            continue  # Something we didn't ask for
+        data = loc["data"]
+        data["name"] = data["name"] or exit_name
+        entities.append({
+            "type": "location",
+            "id": loc["id"] or "gen_" + re.sub(r"[^a-z0-9]+", "_", data["name"].lower()).strip("_"),
+            "item_name": data["name"],
+            "data": data,
+            "narrative_cue": loc.get("narrative_cue"),
+            "npcs": loc["npcs"],
+            "exit": exit_name
+        })
+    return entities
+
+def generate_full_scenario(user_prompt):
+    """
+    Generates a complete starting state based on a user concept.
+    """
     prompt = f"""
-    {system_prompt}
     USER SCENARIO IDEA: "{user_prompt}"
     """
     
     try:
-        response = model.generate_content(prompt)
-        return json.loads(response.text)
+        return generate_structured("architect", prompt, ScenarioOutput, cache=True, system_instruction=ARCHITECT_INSTRUCTION)
     except Exception as e:
         print(f"Genesis Error: {e}")
         return None
@@ -101,7 +176,6 @@ def generate_random_scenario_idea():
     """
     Asks the AI for a creative, unique premise for a game.
     """
-    model = genai.GenerativeModel(MODEL_NAME)
     prompt = """
     Generate a creative, intriguing, and specific premise for a text adventure game. 
     It can be sci-fi, fantasy, horror, or weird fiction.
@@ -109,7 +183,6 @@ def generate_random_scenario_idea():
     Example: "A noir detective searching for a stolen memory in a city floating on Venus."
     """
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return generate("muse", prompt).strip()
     except Exception:
         return "A time-traveler stuck in a loop during the fall of Rome."
\ No newline at end of file
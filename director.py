@@ -1,31 +1,9 @@
-import os
-import json
-import google.generativeai as genai
-from dotenv import load_dotenv
+from schemas import generate_structured, DirectorOutput
+from memory import memory_text
 
-load_dotenv()
-MODEL_NAME = 'models/gemini-2.5-flash' 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-def update_story_state(current_state, player_action, archivist_log):
-    model = genai.GenerativeModel(MODEL_NAME, 
-        generation_config={"response_mime_type": "application/json"})
-
-    story = current_state.get("story_state", {})
-    current_objective = story.get("current_objective", "Explore")
-    
-    system_prompt = f"""
+DIRECTOR_INSTRUCTION = """
     You are the Narrative Director. You control the Pacing and Objectives of the game.
     
-    CURRENT STATE:
-    - Objective: "{current_objective}"
-    - Genre: {story.get("genre", "Unknown")}
-    - Tension Level: {story.get("global_tension", 1)}/10
-    
-    PLAYER INPUT:
-    - Action: "{player_action}"
-    - Consequence: "{archivist_log}"
-    
     YOUR TASK:
     1. Analyze if the Player's Action has ADVANCED or CHANGED the Current Objective.
     2. If the player is asking questions ("Who is here?", "Look around"), set the 'narrative_direction' to REVEAL details.
@@ -36,21 +14,52 @@ def update_story_state(current_state, player_action, archivist_log):
     - If the player is ignoring the objective -> ADAPT the objective to the players intent.
     
     OUTPUT SCHEMA:
-    {{
+    {
       "current_objective": "Updated short-term goal (Max 10 words)",
       "narrative_direction": "Instruction for the Narrator (e.g. 'Describe the monster appearing', 'Reveal a hidden door')",
       "global_tension": Integer (1-10),
       "world_events": [] 
-    }}
+    }
+    """
+
+def clamp_director_output(output):
+    """
+    Director fields with the gaps dropped and tension held to 1-10, whether
+    they came from the Director or from a fused Adjudicator reply.
+    """
+    output = {k: v for k, v in output.items() if v is not None}
+    if "global_tension" in output:
+        try:
+            output["global_tension"] = min(10, max(1, int(output["global_tension"])))
+        except (TypeError, ValueError):
+            del output["global_tension"]
+    return output
+
+def update_story_state(current_state, player_action, archivist_log):
+    story = current_state.get("story_state", {})
+    current_objective = story.get("current_objective", "Explore")
+    
+    # Slowest-changing lines first so consecutive prompts share a prefix
+    prompt = f"""
+    CURRENT STATE:
+    - Genre: {story.get("genre", "Unknown")}
+    - Story so far: {memory_text(current_state)}
+    - Objective: "{current_objective}"
+    - Tension Level: {story.get("global_tension", 1)}/10
+    
+    PLAYER INPUT:
+    - Action: "{player_action}"
+    - Consequence: "{archivist_log}"
     """
     
     try:
-        response = model.generate_content(system_prompt)
-        return json.loads(response.text)
+        output = generate_structured("director", prompt, DirectorOutput, system_instruction=DIRECTOR_INSTRUCTION)
+        return clamp_director_output(output)
     except Exception as e:
         print(f"Director Error: {e}")
+        # Keep the story where it was rather than resetting the pacing
         return {
             "current_objective": current_objective,
-            "narrative_direction": "Describe the scene.",
-            "global_tension": 1
+            "narrative_direction": story.get("narrative_direction", "Describe the scene."),
+            "global_tension": story.get("global_tension", 1)
         }
\ No newline at end of file
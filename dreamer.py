@@ -1,44 +1,126 @@
-import os
-import json
-import google.generativeai as genai
-from dotenv import load_dotenv
+import re
+import threading
+from creator import expected_latency
+from schemas import generate_structured, Dream
+from scheduler import start_worker
 
-load_dotenv()
-MODEL_NAME = 'models/gemini-2.5-flash' 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+QUEUE_LIMIT = 5
+MIN_MATCH = 0.6  # Share of the target's words a dream must carry to be claimed by it
+STOPWORDS = {"the", "and", "with", "into", "from", "towards", "back", "old", "some", "that", "this"}
 
-def dream_up_content(current_state):
-    model = genai.GenerativeModel(MODEL_NAME, 
-        generation_config={"response_mime_type": "application/json"})
+DREAM_STATS = {"dreams": 0, "hits": 0, "misses": 0, "latency_saved": 0.0}
+_queue_lock = threading.Lock()
 
-    # Extract context
-    location_id = current_state.get("current_location_id")
-    location = current_state["locations"].get(location_id, {})
-    story = current_state.get("story_state", {})
-    current_queue = current_state.get("shadow_queue", [])
-
-    if len(current_queue) >= 5: return []
-
-    system_prompt = """
+DREAMER_INSTRUCTION = """
     You are The Dreamer.
-    
+
     YOUR JOB:
     Predict what the player might encounter next based on the location and genre.
-    
+
     OUTPUT SCHEMA:
     Return a LIST of JSON objects (npcs, items, or locations).
     Add "keywords" list to each for matching.
+    [
+      {
+        "type": "location" | "npc" | "item",
+        "id": "dream_...",
+        "item_name": "...",
+        "data": { "name": "...", "description": "...", "exits": [], "suggested_exits": [] },
+        "keywords": ["lowercase", "words", "a player might use"]
+      }
+    ]
     """
 
+def dream_up_content(current_state):
+    # Extract context
+    location_id = current_state.get("current_location_id")
+    location = current_state["locations"].get(location_id, {})
+    story = current_state.get("story_state", {})
+    current_queue = current_state.get("shadow_queue", [])
+
+    if len(current_queue) >= QUEUE_LIMIT: return []
+
     prompt = f"""
-    {system_prompt}
     LOCATION: {location.get('name')}
     GENRE: {story.get('genre')}
     MOOD: {story.get('narrative_direction')}
     """
-    
+
     try:
-        response = model.generate_content(prompt)
-        return json.loads(response.text)
+        dreams = generate_structured("dreamer", prompt, Dream, many=True, system_instruction=DREAMER_INSTRUCTION)
+        return [d for d in dreams if d["type"] in ("location", "npc", "item")]
     except Exception as e:
-        return []
\ No newline at end of file
+        print(f"Dreamer Error: {e}")
+        return []
+
+# --- BACKGROUND WORKER ---
+def _dream(current_state):
+    dreams = dream_up_content(current_state)
+    with _queue_lock:
+        queue = current_state["shadow_queue"]
+        for dream in dreams[:QUEUE_LIMIT - len(queue)]:
+            queue.append(dream)
+            DREAM_STATS["dreams"] += 1
+
+def start_dreaming(current_state):
+    """
+    Tops up the shadow queue in a background thread while the player reads.
+    """
+    with _queue_lock:
+        current_state.setdefault("shadow_queue", [])
+        if len(current_state["shadow_queue"]) >= QUEUE_LIMIT:
+            return
+    start_worker("dreamer", current_state, _dream)
+
+# --- LOOKUP ---
+def _words(text):
+    return set(re.findall(r"[a-z0-9']{3,}", str(text).lower())) - STOPWORDS
+
+def _names(dream):
+    data = dream.get("data") or {}
+    return [str(t) for t in [dream.get("item_name"), data.get("name")] + list(dream.get("keywords", [])) if t]
+
+def match_score(target, names):
+    """
+    1.0 for an exact name, else the share of the target's words found among the names.
+    """
+    target = target.lower()
+    if any(target == name.lower() for name in names):
+        return 1.0
+    target_words = _words(target)
+    if not target_words:
+        return 0.0
+    return len(target_words & set().union(*(_words(n) for n in names))) / len(target_words)
+
+def claim_from_queue(current_state, target_name):
+    """
+    Pops the queued dream that best matches the target, or returns None.
+    An exact name wins; otherwise the dream must carry at least MIN_MATCH
+    of the target's words. Ties go to the oldest dream.
+    """
+    target = target_name.lower()
+    with _queue_lock:
+        queue = current_state.get("shadow_queue", [])
+        scored = [(match_score(target, _names(dream)), -i) for i, dream in enumerate(queue)]
+        score, neg_index = max(scored, default=(0.0, 0))
+        if score < MIN_MATCH:
+            DREAM_STATS["misses"] += 1
+            return None
+        match = -neg_index
+
+        DREAM_STATS["hits"] += 1
+        saved = expected_latency()
+        DREAM_STATS["latency_saved"] += saved
+        dream = queue.pop(match)
+        data = dream.setdefault("data", {})
+        data.setdefault("name", target_name)
+        data.setdefault("description", "")
+        if dream["type"] == "item":
+            dream.setdefault("item_name", data.get("name", target_name))
+        dream.setdefault("id", "dream_" + re.sub(r"[^a-z0-9]+", "_", target))
+        dream["latency_saved"] = saved
+        return dream
+
+def get_dream_stats():
+    lookups = DREAM_STATS["hits"] + DREAM_STATS["misses"]
+    return dict(DREAM_STATS, hit_rate=round(DREAM_STATS["hits"] / lookups, 2) if lookups else 0.0)
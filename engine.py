@@ -0,0 +1,187 @@
+import os
+import re
+import copy
+import time
+import hashlib
+import threading
+from utils import load_game, save_game, close_store, DEFAULT_STATE
+from creator import generate_full_scenario
+from pipeline import start_turn
+from dreamer import start_dreaming
+from neighborhood import start_forging
+from memory import start_compaction
+from world import WorldState
+
+SAVES_DIR = "saves"
+SESSION_IDLE = 30 * 60  # Seconds without a request before a session is saved and unloaded
+
+def build_scenario_state(scenario_data):
+    """
+    Turns the World Architect's output into a fresh, started game state.
+    """
+    start_id = "loc_genesis_start"
+    return {
+        "session_id": "custom_game",
+        "player": {
+            "name": scenario_data["player"]["name"],
+            "hp": 20, "max_hp": 20,
+            "inventory": scenario_data["player"]["inventory"],
+            "journal": [] # Ensure Journal is initialized
+        },
+        "current_location_id": start_id,
+        "world_flags": {"game_started": True},
+        "locations": {
+            start_id: scenario_data["location"]
+        },
+        "npcs": {},
+        "story_state": {
+            "current_act": 1,
+            "global_tension": 1,
+            "genre": scenario_data["genre"],
+            "current_objective": "Survive and explore.",
+            "narrative_direction": "Begin the adventure."
+        },
+        "world_events": []
+    }
+
+class GameEngine:
+    """
+    Headless game server. Holds one world per session id, each saved to its
+    own file, and serializes turns within a session with a per-session lock.
+    Different sessions play in parallel. Sessions left idle for idle_timeout
+    seconds are saved and unloaded by evict_idle().
+    """
+    def __init__(self, saves_dir=SAVES_DIR, idle_timeout=SESSION_IDLE):
+        self.saves_dir = saves_dir
+        self.idle_timeout = idle_timeout
+        os.makedirs(saves_dir, exist_ok=True)
+        self._states = {}
+        self._locks = {}
+        self._last_used = {}  # session id -> monotonic time of its last request
+        self._registry_lock = threading.Lock()
+
+    def save_path(self, session_id):
+        safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", session_id)
+        if safe_id != session_id:
+            # "a.b" and "a/b" would both be "a_b"; the '.' keeps them clear of ids that were already safe
+            safe_id += "." + hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.saves_dir, f"{safe_id}.json")
+
+    def lock_for(self, session_id):
+        with self._registry_lock:
+            return self._locks.setdefault(session_id, threading.Lock())
+
+    # --- STATE ---
+    def get_state(self, session_id, create=True):
+        """
+        The live state for a session: from memory, else from its save, else a
+        new game - or None with create=False.
+        """
+        with self._registry_lock:
+            state = self._states.get(session_id)
+            if state is not None:
+                self._last_used[session_id] = time.monotonic()
+                return state
+
+        path = self.save_path(session_id)
+        state = load_game(path)
+        if not state:
+            if not create:
+                close_store(path)
+                return None
+            state = copy.deepcopy(DEFAULT_STATE)
+            save_game(state, path)
+        with self._registry_lock:
+            self._last_used[session_id] = time.monotonic()
+            return self._states.setdefault(session_id, WorldState(state))
+
+    def _replace_state(self, session_id, state):
+        state = WorldState(state)
+        with self.lock_for(session_id):
+            with self._registry_lock:
+                self._states[session_id] = state
+                self._last_used[session_id] = time.monotonic()
+            save_game(state, self.save_path(session_id))
+        return state
+
+    def reset(self, session_id):
+        return self._replace_state(session_id, copy.deepcopy(DEFAULT_STATE))
+
+    def start_scenario(self, session_id, scenario_prompt):
+        """
+        Builds a new world from a theme. Returns the intro text, or None on failure.
+        """
+        scenario_data = generate_full_scenario(scenario_prompt)
+        if not scenario_data:
+            return None
+        self._replace_state(session_id, build_scenario_state(scenario_data))
+        return scenario_data["intro_text"]
+
+    def save_session(self, session_id, state):
+        """
+        Saves a state changed outside a turn, unless the session has moved on to another world.
+        """
+        with self.lock_for(session_id):
+            with self._registry_lock:
+                current = self._states.get(session_id)
+            if current is state:
+                save_game(state, self.save_path(session_id))
+
+    def close_session(self, session_id):
+        with self._registry_lock:
+            self._states.pop(session_id, None)
+            self._locks.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+        close_store(self.save_path(session_id))
+
+    def evict_idle(self):
+        """
+        Saves and unloads every session idle for longer than idle_timeout,
+        skipping any that is mid-turn. Returns the evicted session ids.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._registry_lock:
+            idle = [sid for sid, used in self._last_used.items() if used < cutoff]
+        evicted = []
+        for session_id in idle:
+            lock = self.lock_for(session_id)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                with self._registry_lock:
+                    if self._last_used.get(session_id, cutoff) >= cutoff:
+                        continue  # Used again meanwhile
+                    state = self._states.get(session_id)
+                if state is not None:
+                    save_game(state, self.save_path(session_id))
+                self.close_session(session_id)
+                evicted.append(session_id)
+            finally:
+                lock.release()
+        return evicted
+
+    # --- TURNS ---
+    def start_turn(self, session_id, action, mode=None):
+        """
+        Starts a turn in the background and returns its pipeline.Turn. The
+        session stays locked until the turn has finished and been saved.
+        """
+        state = self.get_state(session_id)
+        lock = self.lock_for(session_id)
+        lock.acquire()
+
+        def finish(turn):
+            lock.release()
+            if turn._error is None:
+                start_forging(state)
+                start_dreaming(state)
+                start_compaction(state, lock, lambda s: self.save_session(session_id, s))
+
+        try:
+            return start_turn(state, action, self.save_path(session_id), on_done=finish, mode=mode)
+        except Exception:
+            lock.release()
+            raise
+
+    def process_turn(self, session_id, action, mode=None):
+        return self.start_turn(session_id, action, mode).result()
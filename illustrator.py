@@ -1,19 +1,6 @@
-import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+from llm import generate
 
-load_dotenv()
-# We use the Pro model for good prompt engineering
-MODEL_NAME = 'models/gemini-2.5-flash' 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-def get_image_prompt(narrative_text):
-    """
-    Reads the story text and converts it into a stable diffusion/midjourney style prompt.
-    """
-    model = genai.GenerativeModel(MODEL_NAME)
-    
-    system_prompt = """
+ILLUSTRATOR_INSTRUCTION = """
     You are an AI Art Director. 
     Your job is to read a story segment and output a Single Image Prompt that captures the essence of the scene.
     
@@ -22,18 +9,23 @@ def get_image_prompt(narrative_text):
     - Format: purely descriptive keywords, comma-separated.
     - No filler text. Just the visual description.
     """
-    
+
+def get_image_prompt(narrative_text):
+    """
+    Reads the story text and converts it into a stable diffusion/midjourney style prompt.
+    """
     prompt = f"""
-    {system_prompt}
-    
     STORY SEGMENT:
     "{narrative_text}"
     
     IMAGE PROMPT:
     """
     
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    try:
+        return generate("illustrator", prompt, cache=True, system_instruction=ILLUSTRATOR_INSTRUCTION).strip()
+    except Exception as e:
+        print(f"Illustrator Error: {e}")
+        return ""
 
 def generate_image(image_prompt):
     """
@@ -0,0 +1,385 @@
+import os
+import json
+import time
+import datetime
+import threading
+from dotenv import load_dotenv
+from response_cache import ResponseCache, make_key
+from tracing import record_span
+from scheduler import get_scheduler
+
+MODEL_NAME = 'models/gemini-2.5-flash'
+EMBED_MODEL = 'models/text-embedding-004'
+JSON_CONFIG = {"response_mime_type": "application/json"}
+TIMEOUT = 60        # Seconds per request before we give up on it
+MAX_RETRIES = 3     # Extra attempts on transient errors (quota, overload, timeouts)
+BACKOFF_BASE = 1.0  # Seconds; doubles with each retry
+CACHE_ENABLED = os.getenv("LLM_CACHE", "on") != "off"
+BACKEND = os.getenv("LLM_BACKEND", "gemini")          # "gemini" or "stub"
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", "0"))  # Seconds the stub sleeps per call
+SYSTEM_INSTRUCTIONS = os.getenv("LLM_SYSTEM_INSTRUCTIONS", "on") != "off"  # "off" inlines them into the prompt
+CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "off") == "on"  # Explicit Gemini context caching of system instructions
+CONTEXT_CACHE_TTL = 3600  # Seconds
+CONTEXT_CACHE_MARGIN = 300  # Seconds before expiry at which a cached prefix is rebuilt
+CONTEXT_CACHE_RETRY = 60    # Seconds before a transiently failed upload is tried again; doubles per failure
+
+try:
+    from google.api_core import exceptions as api_errors
+    TRANSIENT_ERRORS = (
+        api_errors.ResourceExhausted,
+        api_errors.ServiceUnavailable,
+        api_errors.DeadlineExceeded,
+        api_errors.InternalServerError,
+    )
+    RATE_LIMIT_ERRORS = (api_errors.ResourceExhausted,)
+    # What a request against an expired or deleted CachedContent fails with
+    CACHE_EXPIRED_ERRORS = (api_errors.NotFound, api_errors.PermissionDenied, api_errors.FailedPrecondition)
+    # What an upload that can never succeed fails with (prefix too small, model without caching)
+    UNCACHEABLE_ERRORS = (api_errors.InvalidArgument, api_errors.NotFound, api_errors.FailedPrecondition)
+except ImportError:
+    TRANSIENT_ERRORS = ()
+    RATE_LIMIT_ERRORS = ()
+    CACHE_EXPIRED_ERRORS = ()
+    UNCACHEABLE_ERRORS = ()
+
+_lock = threading.Lock()
+_backend = None
+_response_cache = None
+METRICS = {}
+
+# --- BACKENDS ---
+class GeminiBackend:
+    """
+    The real thing. Configures the SDK once and pools GenerativeModel handles
+    per (model, generation_config, system_instruction).
+
+    With CONTEXT_CACHE on, each static system instruction is uploaded once as
+    a CachedContent and later models are built from it. The upload happens
+    outside the pool lock; callers that arrive meanwhile send the
+    instruction normally. Gemini only caches prefixes above a minimum size,
+    so an upload rejected outright is not tried again for that instruction;
+    one that failed on a timeout or quota is retried after a growing delay.
+    Cached models are rebuilt shortly before their TTL runs out, and a call
+    that still finds its cache gone is retried on a plain model.
+    """
+    name = "gemini"
+
+    def __init__(self):
+        import google.generativeai as genai
+        load_dotenv()
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        self.genai = genai
+        self._models = {}
+        self._uncacheable = set()
+        self._failures = {}    # system instruction -> transient upload failures in a row
+        self._uploading = set()  # pool keys with a CachedContent upload in flight
+        self._expires = {}     # pool key -> monotonic time its model is to be rebuilt
+        self._lock = threading.Lock()
+
+    def _cached_model(self, model_name, generation_config, system_instruction):
+        from google.generativeai import caching
+        cached = caching.CachedContent.create(
+            model=model_name, system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL)
+        )
+        return self.genai.GenerativeModel.from_cached_content(cached_content=cached, generation_config=generation_config)
+
+    def _plain_model(self, model_name, generation_config, system_instruction):
+        return self.genai.GenerativeModel(
+            model_name, generation_config=generation_config, system_instruction=system_instruction
+        )
+
+    def _pool_key(self, model_name, generation_config, system_instruction):
+        return (model_name, json.dumps(generation_config, sort_keys=True), system_instruction)
+
+    def get_model(self, model_name=MODEL_NAME, generation_config=None, system_instruction=None):
+        key = self._pool_key(model_name, generation_config, system_instruction)
+        with self._lock:
+            if key in self._models and time.monotonic() < self._expires.get(key, float("inf")):
+                return self._models[key]
+            upload = (CONTEXT_CACHE and system_instruction and system_instruction not in self._uncacheable
+                      and key not in self._uploading)
+            if upload:
+                self._uploading.add(key)
+            elif key in self._uploading:
+                # Someone else is uploading; don't wait on them
+                return self._models.get(key) or self._plain_model(model_name, generation_config, system_instruction)
+            else:
+                model = self._plain_model(model_name, generation_config, system_instruction)
+                self._models[key] = model
+                self._expires.pop(key, None)
+                return model
+
+        # The upload is a network call, so it runs without the pool lock
+        now = time.monotonic()
+        try:
+            model = self._cached_model(model_name, generation_config, system_instruction)
+            rebuild_at = now + CONTEXT_CACHE_TTL - CONTEXT_CACHE_MARGIN
+            failed = None
+        except Exception as e:
+            print(f"Context Cache Error: {e}")
+            model = self._plain_model(model_name, generation_config, system_instruction)
+            failed = e
+        with self._lock:
+            self._uploading.discard(key)
+            if failed is None:
+                self._failures.pop(system_instruction, None)
+            elif isinstance(failed, UNCACHEABLE_ERRORS):
+                self._uncacheable.add(system_instruction)
+                rebuild_at = float("inf")
+            else:
+                failures = self._failures[system_instruction] = self._failures.get(system_instruction, 0) + 1
+                rebuild_at = now + min(CONTEXT_CACHE_RETRY * 2 ** (failures - 1), CONTEXT_CACHE_TTL)
+            self._models[key] = model
+            self._expires[key] = rebuild_at
+            return model
+
+    def generate_content(self, agent, prompt, generation_config=None, model_name=MODEL_NAME, stream=False, system_instruction=None):
+        model = self.get_model(model_name, generation_config, system_instruction)
+        try:
+            return model.generate_content(prompt, stream=stream, request_options={"timeout": TIMEOUT})
+        except CACHE_EXPIRED_ERRORS as e:
+            if getattr(model, "cached_content", None) is None:
+                raise
+            # The cache went away early; drop it so the next call uploads a fresh one
+            print(f"Context Cache Error: {e}")
+            key = self._pool_key(model_name, generation_config, system_instruction)
+            with self._lock:
+                if self._models.get(key) is model:
+                    self._models.pop(key)
+                    self._expires.pop(key, None)
+            model = self._plain_model(model_name, generation_config, system_instruction)
+            return model.generate_content(prompt, stream=stream, request_options={"timeout": TIMEOUT})
+
+    def embed_content(self, texts, task_type="retrieval_document", model_name=EMBED_MODEL):
+        result = self.genai.embed_content(
+            model=model_name, content=list(texts), task_type=task_type,
+            request_options={"timeout": TIMEOUT}
+        )
+        return result["embedding"]
+
+    def embedding_model(self):
+        return EMBED_MODEL
+
+def get_backend():
+    global _backend
+    with _lock:
+        if _backend is None:
+            if BACKEND == "stub":
+                from stub_backend import StubBackend
+                _backend = StubBackend(latency=STUB_LATENCY)
+            else:
+                _backend = GeminiBackend()
+        return _backend
+
+def set_backend(backend):
+    """
+    Swaps the backend every agent talks to (e.g. StubBackend for offline runs).
+    """
+    global _backend
+    with _lock:
+        _backend = backend
+
+def get_response_cache():
+    global _response_cache
+    with _lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+# --- METRICS ---
+def _record(agent, latency, response=None, retries=0, error=None, prompt_chars=0, response_chars=0, ttft=None):
+    """
+    Counts one finished call (error is the exception, if it raised) and traces
+    it as an llm.<agent> span. Streamed calls also pass their time to first token.
+    """
+    if not error:
+        get_scheduler().on_success()
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = (getattr(usage, "prompt_token_count", 0) or 0) if usage else 0
+    response_tokens = (getattr(usage, "candidates_token_count", 0) or 0) if usage else 0
+    cached_tokens = (getattr(usage, "cached_content_token_count", 0) or 0) if usage else 0
+    record_span(
+        f"llm.{agent}", latency, error=type(error).__name__ if error else None, agent=agent,
+        retries=retries, prompt_chars=prompt_chars, response_chars=response_chars,
+        prompt_tokens=prompt_tokens, response_tokens=response_tokens, cached_tokens=cached_tokens, ttft=ttft
+    )
+    with _lock:
+        m = METRICS.setdefault(agent, {
+            "calls": 0, "errors": 0, "retries": 0, "latency_total": 0.0,
+            "prompt_tokens": 0, "response_tokens": 0, "cached_tokens": 0, "streams": 0, "ttft_total": 0.0
+        })
+        m["calls"] += 1
+        m["retries"] += retries
+        m["latency_total"] += latency
+        if error:
+            m["errors"] += 1
+        m["prompt_tokens"] += prompt_tokens
+        m["response_tokens"] += response_tokens
+        m["cached_tokens"] += cached_tokens
+        if ttft is not None:
+            m["streams"] += 1
+            m["ttft_total"] += ttft
+
+def get_metrics():
+    with _lock:
+        report = {}
+        for agent, m in METRICS.items():
+            report[agent] = dict(
+                m, latency_avg=round(m["latency_total"] / m["calls"], 3) if m["calls"] else 0.0,
+                ttft_avg=round(m["ttft_total"] / m["streams"], 3) if m["streams"] else None
+            )
+        return report
+
+def reset_metrics():
+    with _lock:
+        METRICS.clear()
+
+# --- CALLS ---
+def _backoff(attempt, error):
+    if isinstance(error, RATE_LIMIT_ERRORS):
+        get_scheduler().on_rate_limited()  # Everyone waits out the cooldown in acquire()
+    else:
+        time.sleep(BACKOFF_BASE * (2 ** attempt))
+
+def _instructed(prompt, system_instruction):
+    """
+    Folds the system instruction into the prompt when they are switched off.
+    """
+    if system_instruction and not SYSTEM_INSTRUCTIONS:
+        return f"{system_instruction}\n{prompt}", None
+    return prompt, system_instruction
+
+def _cache_key(model_name, generation_config, prompt, system_instruction):
+    # The backend is part of the key, so offline stub replies never answer a live run
+    backend = getattr(get_backend(), "name", type(get_backend()).__name__)
+    return make_key(backend, model_name, generation_config, f"{system_instruction or ''}\n{prompt}")
+
+def _usable(text, validate):
+    if validate is None:
+        return True
+    try:
+        validate(text)
+        return True
+    except Exception:
+        return False
+
+def generate(agent, prompt, generation_config=None, model_name=MODEL_NAME, cache=False, system_instruction=None, validate=None):
+    """
+    One blocking call. Returns the response text; retries transient errors
+    with exponential backoff and raises anything else.
+
+    Agents whose output only depends on the prompt can pass cache=True to
+    reuse earlier responses to the identical request. 'validate' raises on
+    a reply that is no use to the caller; such replies are neither cached
+    nor served from the cache. A static system_instruction is sent apart
+    from the prompt, so the model can reuse it as a cached prefix from call
+    to call.
+    """
+    prompt, system_instruction = _instructed(prompt, system_instruction)
+    if cache and CACHE_ENABLED:
+        cache_key = _cache_key(model_name, generation_config, prompt, system_instruction)
+        lookup_start = time.perf_counter()
+        cached = get_response_cache().get(agent, cache_key)
+        if cached is not None and _usable(cached, validate):
+            record_span(f"llm.{agent}", time.perf_counter() - lookup_start, agent=agent, cache_hit=True,
+                        prompt_chars=len(prompt), response_chars=len(cached))
+            return cached
+        text = _generate(agent, prompt, generation_config, model_name, system_instruction)
+        if _usable(text, validate):
+            get_response_cache().put(agent, cache_key, text)
+        return text
+    return _generate(agent, prompt, generation_config, model_name, system_instruction)
+
+def cache_reply(agent, prompt, text, generation_config=None, model_name=MODEL_NAME, system_instruction=None):
+    """
+    Stores a reply as the cached answer to 'prompt', e.g. a good reply that
+    took a corrective follow-up to get.
+    """
+    if CACHE_ENABLED:
+        prompt, system_instruction = _instructed(prompt, system_instruction)
+        get_response_cache().put(agent, _cache_key(model_name, generation_config, prompt, system_instruction), text)
+
+def _generate(agent, prompt, generation_config, model_name, system_instruction=None):
+    backend = get_backend()
+    start = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            get_scheduler().acquire(agent)
+            response = backend.generate_content(agent, prompt, generation_config, model_name,
+                                                system_instruction=system_instruction)
+            text = response.text
+        except TRANSIENT_ERRORS as e:
+            if attempt < MAX_RETRIES:
+                _backoff(attempt, e)
+                continue
+            _record(agent, time.perf_counter() - start, retries=attempt, error=e, prompt_chars=len(prompt))
+            raise
+        except Exception as e:
+            _record(agent, time.perf_counter() - start, retries=attempt, error=e, prompt_chars=len(prompt))
+            raise
+        _record(agent, time.perf_counter() - start, response, retries=attempt,
+                prompt_chars=len(prompt), response_chars=len(text))
+        return text
+
+def embed(texts, task_type="retrieval_document"):
+    """
+    Embedding vectors for a batch of texts, with the same retry policy as generate().
+    """
+    backend = get_backend()
+    start = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            get_scheduler().acquire("embedder")
+            vectors = backend.embed_content(texts, task_type)
+        except TRANSIENT_ERRORS as e:
+            if attempt < MAX_RETRIES:
+                _backoff(attempt, e)
+                continue
+            _record("embedder", time.perf_counter() - start, retries=attempt, error=e)
+            raise
+        except Exception as e:
+            _record("embedder", time.perf_counter() - start, retries=attempt, error=e)
+            raise
+        _record("embedder", time.perf_counter() - start, retries=attempt, prompt_chars=sum(len(t) for t in texts))
+        return vectors
+
+def embedding_model():
+    return get_backend().embedding_model()
+
+def generate_stream(agent, prompt, generation_config=None, model_name=MODEL_NAME, system_instruction=None):
+    """
+    Streaming variant of generate(): yields text chunks. Transient errors are
+    only retried before the first chunk has been handed out.
+    """
+    prompt, system_instruction = _instructed(prompt, system_instruction)
+    backend = get_backend()
+    start = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        emitted = 0
+        last = None
+        ttft = None
+        try:
+            get_scheduler().acquire(agent)
+            for chunk in backend.generate_content(agent, prompt, generation_config, model_name, stream=True,
+                                                  system_instruction=system_instruction):
+                last = chunk
+                if chunk.text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    emitted += len(chunk.text)
+                    yield chunk.text
+        except TRANSIENT_ERRORS as e:
+            if not emitted and attempt < MAX_RETRIES:
+                _backoff(attempt, e)
+                continue
+            _record(agent, time.perf_counter() - start, retries=attempt, error=e,
+                    prompt_chars=len(prompt), response_chars=emitted)
+            raise
+        except Exception as e:
+            _record(agent, time.perf_counter() - start, retries=attempt, error=e,
+                    prompt_chars=len(prompt), response_chars=emitted)
+            raise
+        _record(agent, time.perf_counter() - start, last, retries=attempt,
+                prompt_chars=len(prompt), response_chars=emitted, ttft=ttft)
+        return
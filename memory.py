@@ -0,0 +1,151 @@
+import threading
+from contextlib import nullcontext
+from llm import generate
+from scheduler import start_worker
+
+SUMMARIZE_EVERY = 8     # Turns folded into one chapter summary at a time
+RECENT_TURNS = 12       # Raw turns kept before the oldest are folded
+MAX_CHAPTERS = 6        # Chapter summaries kept before the oldest fold into the saga
+MAX_SUMMARY_CHARS = 600
+MAX_RESOLVED_EVENTS = 10
+PROMPT_RECENT_TURNS = 4
+PROMPT_CHAPTERS = 3
+
+_memory_lock = threading.Lock()
+
+def new_memory():
+    return {"turns": 0, "recent": [], "chapters": [], "saga": ""}
+
+def _clip(text, limit=MAX_SUMMARY_CHARS):
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 3].rsplit(" ", 1)[0] + "..."
+
+# --- RECORDING ---
+def record_turn(current_state, action, outcome):
+    """
+    Notes one finished turn in the 'recent' tier. Cheap; safe on the turn path.
+    """
+    with _memory_lock:
+        memory = current_state.setdefault("memory", new_memory())
+        memory["turns"] += 1
+        turn = {"turn": memory["turns"], "action": _clip(action, 200), "outcome": _clip(outcome, 300)}
+        memory["recent"] = memory["recent"] + [turn]
+
+def needs_compaction(current_state):
+    memory = current_state.get("memory", {})
+    resolved = [e for e in current_state.get("world_events", []) if e.get("status") != "active"]
+    return (
+        len(memory.get("recent", [])) >= RECENT_TURNS + SUMMARIZE_EVERY
+        or len(memory.get("chapters", [])) > MAX_CHAPTERS
+        or len(resolved) > MAX_RESOLVED_EVENTS
+    )
+
+# --- SUMMARIZING ---
+CHRONICLER_INSTRUCTION = """
+    You are the Chronicler. You keep the memory of a long adventure.
+
+    YOUR JOB:
+    Condense the EVENTS into a single paragraph (max 80 words) in past tense.
+    Keep names, places, promises, enemies made and items gained or lost. Drop atmosphere.
+    If an EARLIER SUMMARY is given, continue on from it.
+    """
+
+def summarize(lines, genre, existing=""):
+    """
+    Condenses lines of story into one short paragraph. Falls back to a clipped
+    join of the lines if the model is unavailable.
+    """
+    prompt = f"""
+    GENRE: {genre}
+    {f'EARLIER SUMMARY: "{existing}"' if existing else ''}
+
+    EVENTS:
+    {chr(10).join(lines)}
+    """
+    try:
+        return _clip(generate("chronicler", prompt, system_instruction=CHRONICLER_INSTRUCTION))
+    except Exception as e:
+        print(f"Chronicler Error: {e}")
+        return _clip(" ".join(lines))
+
+def _turn_line(turn):
+    return f"- Turn {turn['turn']}: {turn['action']} -> {turn['outcome']}"
+
+def compact(current_state, lock=None):
+    """
+    Folds the oldest raw turns into chapter summaries, the oldest chapters
+    into the saga, and resolved world events into the saga as well, so the
+    memory section stays bounded however long the game runs.
+
+    The summaries are written back under 'lock' (the session's lock, when
+    run beside live turns), so they never land halfway through a turn.
+    Returns True if anything was folded.
+    """
+    guard = lock or nullcontext()
+    genre = current_state.get("story_state", {}).get("genre", "adventure")
+    with _memory_lock:
+        memory = current_state.setdefault("memory", new_memory())
+        batch = list(memory["recent"][:SUMMARIZE_EVERY]) if len(memory["recent"]) >= RECENT_TURNS + SUMMARIZE_EVERY else []
+
+    # The model calls happen outside the lock; turns keep being recorded meanwhile
+    if batch:
+        chapter = {
+            "turns": [batch[0]["turn"], batch[-1]["turn"]],
+            "summary": summarize([_turn_line(t) for t in batch], genre)
+        }
+        with guard, _memory_lock:
+            # Swap in new lists rather than mutating, so a concurrent save never sees one change size
+            memory["recent"] = memory["recent"][len(batch):]
+            memory["chapters"] = memory["chapters"] + [chapter]
+
+    with _memory_lock:
+        overflow = memory["chapters"][:-MAX_CHAPTERS] if len(memory["chapters"]) > MAX_CHAPTERS else []
+        events = current_state.get("world_events", [])
+        resolved = [e for e in events if e.get("status") != "active"]
+        stale = resolved[:-MAX_RESOLVED_EVENTS] if len(resolved) > MAX_RESOLVED_EVENTS else []
+        saga = memory["saga"]
+
+    if overflow or stale:
+        lines = [c["summary"] for c in overflow] + [f"- Event: {e.get('description', e.get('name', e))}" for e in stale]
+        saga = summarize(lines, genre, existing=saga)
+        with guard, _memory_lock:
+            memory["saga"] = saga
+            memory["chapters"] = memory["chapters"][len(overflow):]
+            stale_ids = {id(e) for e in stale}
+            current_state["world_events"] = [e for e in current_state.get("world_events", []) if id(e) not in stale_ids]
+    return bool(batch or overflow or stale)
+
+# --- BACKGROUND WORKER ---
+def start_compaction(current_state, lock=None, on_done=None):
+    """
+    Compacts memory in a background thread once enough turns have piled up.
+    Results are applied under 'lock'; on_done(state) runs afterwards if
+    anything changed, e.g. to save.
+    """
+    def work(state):
+        if compact(state, lock) and on_done:
+            on_done(state)
+
+    with _memory_lock:
+        if not needs_compaction(current_state):
+            return
+    start_worker("chronicler", current_state, work)
+
+# --- PROMPTS ---
+def memory_context(current_state, recent_turns=PROMPT_RECENT_TURNS, chapters=PROMPT_CHAPTERS):
+    """
+    A fixed-size view of the story so far for prompts: the saga, the latest
+    chapter summaries and the last few raw turns.
+    """
+    with _memory_lock:
+        memory = current_state.get("memory") or new_memory()
+        return {
+            "saga": memory["saga"],
+            "chapters": [c["summary"] for c in memory["chapters"][-chapters:]],
+            "recent": [f"{t['action']} -> {t['outcome']}" for t in memory["recent"][-recent_turns:]]
+        }
+
+def memory_text(current_state, recent_turns=2, chapters=1):
+    context = memory_context(current_state, recent_turns, chapters)
+    parts = [context["saga"]] + context["chapters"] + context["recent"]
+    return " ".join(p for p in parts if p) or "The story has just begun."
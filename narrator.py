@@ -1,48 +1,66 @@
-import os
-import json
-import google.generativeai as genai
-from dotenv import load_dotenv
+from llm import generate_stream
+from world import WorldState
+from memory import memory_text
+from semantic_index import relevant_facts
 
-load_dotenv()
-MODEL_NAME = 'models/gemini-2.5-flash' 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+LORE_K = 3
 
-def narrate_scene(current_state, recent_action, archivist_log):
-    model = genai.GenerativeModel(MODEL_NAME)
+NARRATOR_INSTRUCTION = """
+    You are the Dungeon Master.
+    
+    GUIDELINES:
+    1. **PRIORITIZE THE OUTCOME:** The 'Critical Outcome' in each prompt comes from the game physics engine. If it says the player found 'Void Kin' lore, you MUST describe that discovery in detail. Do not summarize it away.
+    2. **ATMOSPHERE:** Be concrete. Describe sights, sounds, and smells.
+    3. **INTERACTIVITY:** End by hinting at what else the player can do.
+    4. **BREVITY:** Keep it punchy (3-4 sentences max), but do not cut out the Critical Outcome details.
+    """
 
+def build_narrator_prompt(current_state, recent_action, archivist_log):
+    """
+    The per-turn half of the Narrator's input; NARRATOR_INSTRUCTION is the static half.
+    The scene comes first and the turn last, so consecutive prompts share a prefix.
+    """
     visible_location = current_state.get("locations", {}).get(current_state.get("current_location_id"), {})
     story_state = current_state.get("story_state", {})
     direction = story_state.get("narrative_direction", "Describe the surroundings.")
     active_events = [e for e in current_state.get("world_events", []) if e.get("status") == "active"]
     
     visible_npcs = []
-    for n in current_state.get("npcs", {}).values():
-        if n["location_id"] == current_state.get("current_location_id"):
-            visible_npcs.append(f"- {n['name']} ({n.get('attitude', 'neutral')})")
+    for n in WorldState.wrap(current_state).npcs_at(current_state.get("current_location_id")).values():
+        visible_npcs.append(f"- {n['name']} ({n.get('attitude', 'neutral')})")
             
-    system_prompt = f"""
-    You are the Dungeon Master.
+    prompt = f"""
+    CONTEXT:
+    - Location: {visible_location.get("name", "Unknown")} ({visible_location.get("description", "")})
+    - Visible NPCs: {visible_npcs}
+    - Story so far: {memory_text(current_state)}
+    - Relevant lore: {relevant_facts(current_state, recent_action, LORE_K)}
+    - DM Instruction: "{direction}"
     
     PLAYER ACTION: "{recent_action}"
     
     *** CRITICAL OUTCOME (MUST INCLUDE THIS): ***
     "{archivist_log}"
     *********************************************
-    
-    CONTEXT:
-    - Location: {visible_location.get("name", "Unknown")} ({visible_location.get("description", "")})
-    - DM Instruction: "{direction}"
-    - Visible NPCs: {visible_npcs}
-    
-    GUIDELINES:
-    1. **PRIORITIZE THE OUTCOME:** The 'Critical Outcome' above comes from the game physics engine. If it says the player found 'Void Kin' lore, you MUST describe that discovery in detail. Do not summarize it away.
-    2. **ATMOSPHERE:** Be concrete. Describe sights, sounds, and smells.
-    3. **INTERACTIVITY:** End by hinting at what else the player can do.
-    4. **BREVITY:** Keep it punchy (3-4 sentences max), but do not cut out the Critical Outcome details.
     """
-    
+    return prompt
+
+def narrate_scene_stream(current_state, recent_action, archivist_log):
+    """
+    Yields the narration chunk by chunk as the model streams it.
+    """
+    prompt = build_narrator_prompt(current_state, recent_action, archivist_log)
+
+    emitted = False
     try:
-        response = model.generate_content(system_prompt)
-        return response.text
-    except Exception:
-        return "The world is silent."
\ No newline at end of file
+        for chunk in generate_stream("narrator", prompt, system_instruction=NARRATOR_INSTRUCTION):
+            emitted = True
+            yield chunk
+    except Exception as e:
+        print(f"Narrator Error: {e}")
+        if not emitted:
+            # The outcome is already decided; tell it plainly rather than losing it
+            yield archivist_log or "The world is silent."
+
+def narrate_scene(current_state, recent_action, archivist_log):
+    return "".join(narrate_scene_stream(current_state, recent_action, archivist_log))
\ No newline at end of file
@@ -0,0 +1,92 @@
+import threading
+from creator import forge_neighborhood, expected_latency
+from dreamer import match_score, MIN_MATCH
+from scheduler import start_worker
+from world import WorldState
+
+MAX_NEIGHBORS = 4    # Exits forged per batch
+PENDING_LIMIT = 24   # Forged locations kept waiting; the oldest are dropped first
+
+FORGE_STATS = {"batches": 0, "forged": 0, "hits": 0, "misses": 0, "latency_saved": 0.0}
+_pending_lock = threading.Lock()
+
+def _key(origin, exit_name):
+    return f"{origin}:{exit_name.lower()}"
+
+def unforged_exits(current_state):
+    """
+    Exits of the current location that lead nowhere yet: not a known
+    location, not a way back, and not already waiting in 'pending_world'.
+    """
+    world = WorldState.wrap(current_state)
+    here = current_state.get("current_location_id")
+    location = current_state.get("locations", {}).get(here, {})
+    pending = current_state.get("pending_world", {})
+    exits = []
+    for exit_name in location.get("exits", []) + location.get("suggested_exits", []):
+        key = exit_name.lower()
+        if exit_name.startswith("Back to ") or _key(here, exit_name) in pending or world.find("location", exit_name):
+            continue
+        if key not in (e.lower() for e in exits):
+            exits.append(exit_name)
+    return exits[:MAX_NEIGHBORS]
+
+# --- FORGING ---
+def refresh_neighborhood(current_state):
+    """
+    Forges every unmapped neighbor of the current location in one Creator
+    call and parks the results in current_state['pending_world'], keyed by
+    "<origin id>:<exit>". Returns the number of locations forged.
+    """
+    exits = unforged_exits(current_state)
+    if not exits:
+        return 0
+    origin = current_state.get("current_location_id")
+    entities = forge_neighborhood(current_state, exits)
+    with _pending_lock:
+        pending = dict(current_state.get("pending_world", {}))
+        for entity in entities:
+            pending[_key(origin, entity["exit"])] = dict(entity, origin=origin)
+        while len(pending) > PENDING_LIMIT:
+            pending.pop(next(iter(pending)))
+        current_state["pending_world"] = pending
+        FORGE_STATS["batches"] += 1
+        FORGE_STATS["forged"] += len(entities)
+    return len(entities)
+
+def start_forging(current_state):
+    """
+    Forges the current location's neighborhood in a background thread while the player reads.
+    """
+    if unforged_exits(current_state):
+        start_worker("forger", current_state, refresh_neighborhood)
+
+# --- LOOKUP ---
+def claim_pending(current_state, target_name):
+    """
+    Pops the forged neighbor of the current location the target refers to,
+    or returns None. Its exit text or location name is scored against the
+    target the same way dreams are; ties go to the oldest.
+    """
+    here = current_state.get("current_location_id")
+    with _pending_lock:
+        pending = current_state.get("pending_world", {})
+        scored = [(match_score(target_name, [e["exit"], e["data"]["name"]]), -i, k)
+                  for i, (k, e) in enumerate(pending.items()) if e.get("origin") == here]
+        score, _, key = max(scored, default=(0.0, 0, None))
+        if score < MIN_MATCH:
+            FORGE_STATS["misses"] += 1
+            return None
+
+        FORGE_STATS["hits"] += 1
+        saved = expected_latency()
+        FORGE_STATS["latency_saved"] += saved
+        pending = dict(pending)
+        entity = pending.pop(key)
+        current_state["pending_world"] = pending
+        entity["latency_saved"] = saved
+        return entity
+
+def get_forge_stats():
+    lookups = FORGE_STATS["hits"] + FORGE_STATS["misses"]
+    return dict(FORGE_STATS, hit_rate=round(FORGE_STATS["hits"] / lookups, 2) if lookups else 0.0)
@@ -0,0 +1,384 @@
+import os
+import re
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils import save_game, STATE_FILE
+from archivist import get_archivist_response, update_world_state
+from director import update_story_state, clamp_director_output
+from adjudicator import get_adjudication, split_director_output
+from narrator import narrate_scene_stream
+from creator import create_new_entity
+from scribe import scan_story_for_entities
+from dreamer import claim_from_queue
+from neighborhood import claim_pending
+from tts import start_narration_audio
+from memory import record_turn
+from semantic_index import index_world
+from world import WorldState
+from tracing import span
+
+EXIT_ALIASES = ["outside", "exit", "door", "leave", "out"]
+ADJUDICATOR_MODES = ("split", "fused")
+ADJUDICATOR_MODE = os.getenv("ADJUDICATOR_MODE", "split")  # "fused" asks Archivist and Director in one call
+
+class TurnPipeline:
+    """
+    Runs a set of stages as a dependency graph on a thread pool.
+    A stage starts as soon as every stage it runs 'after' has finished.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.results = {}
+        self.timings = {}
+        self.lock = threading.Lock()  # Guards mutations of the shared world state
+        self._started_at = None
+
+    def add_stage(self, name, fn, after=()):
+        self.stages[name] = (fn, tuple(after))
+
+    def _run_stage(self, name, fn):
+        start = time.perf_counter()
+        try:
+            with span(f"stage.{name}"):
+                return fn(self)
+        finally:
+            end = time.perf_counter()
+            self.timings[name] = {
+                "start": round(start - self._started_at, 3),
+                "duration": round(end - start, 3)
+            }
+
+    def run(self):
+        pending = dict(self.stages)
+        running = {}
+        self._started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, (fn, after) in list(pending.items()):
+                    if all(dep in self.results for dep in after):
+                        running[pool.submit(self._run_stage, name, fn)] = name
+                        del pending[name]
+                if not running:
+                    raise RuntimeError(f"Unresolvable stage dependencies: {list(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.results[running.pop(future)] = future.result()
+        self.wall_time = time.perf_counter() - self._started_at
+        return self.results
+
+    def report(self):
+        """
+        Per-stage timings plus what the same stages would have cost run back to back.
+        """
+        serial = sum(t["duration"] for t in self.timings.values())
+        return {
+            "stages": dict(self.timings),
+            "wall": round(self.wall_time, 3),
+            "serial": round(serial, 3),
+            "saved": round(serial - self.wall_time, 3)
+        }
+
+# --- DISCOVERY (CREATOR) ---
+def discovery_cue(entity, data):
+    """
+    Outcome cue for a discovery when the Creator (or a queued dream) didn't write one.
+    """
+    name = data.get("name") or entity.get("item_name")
+    if not name:
+        return "You find something new."
+    if entity.get("type") == "location":
+        return f"You arrive at {name}. {data.get('description', '')}".strip()
+    if entity.get("type") == "npc":
+        return f"You come upon {name}. {data.get('description', '')}".strip()
+    return f"You found a {entity.get('item_name') or name}."
+
+def resolve_discovery(current_state, prompt, updates, notices):
+    """
+    Makes the missing target real and turns it into the Archivist's outcome.
+    The cue comes from the Creator's output, so a discovery costs the
+    Archivist call that noticed it plus one Creator call (none when the
+    neighborhood was forged ahead or the Dreamer imagined it).
+    """
+    missing_name = updates.get("target_name", "Unknown Area")
+    if missing_name.lower() in EXIT_ALIASES:
+        missing_name = "The Surrounding Area"
+
+    curr_loc = current_state.get("current_location_id", "unknown")
+    # The neighborhood may already be forged, or the Dreamer may have imagined it while the player was reading
+    new_entity, source = claim_pending(current_state, missing_name), "forge"
+    if not new_entity:
+        new_entity, source = claim_from_queue(current_state, missing_name), "dreamer"
+    if new_entity:
+        updates["discovery"] = {"source": source, "latency_saved": new_entity["latency_saved"]}
+    else:
+        new_entity = create_new_entity(missing_name, curr_loc, current_state)
+        updates["discovery"] = {"source": "creator", "latency_saved": 0.0}
+    if not new_entity:
+        updates["narrative_cue"] = f"You look for {missing_name}, but it is nowhere to be found."
+        return updates
+
+    data = new_entity.get("data") or {}
+    cue = new_entity.get("narrative_cue") or discovery_cue(new_entity, data)
+
+    if new_entity["type"] == "location":
+        loc_id = new_entity["id"]
+        loc_data = data
+        clean_exits = [e for e in loc_data.get("exits", []) if e.lower() != loc_data["name"].lower()]
+        loc_data["exits"] = clean_exits
+        if not current_state.add_location(loc_id, loc_data):
+            loc_data = current_state["locations"][loc_id]  # Already forged on an earlier visit
+
+        old_loc_id = current_state["current_location_id"]
+        old_loc = current_state["locations"].get(old_loc_id)
+        if old_loc:
+            if "exits" not in old_loc: old_loc["exits"] = []
+            if loc_data["name"] not in old_loc["exits"]:
+                old_loc["exits"].append(loc_data["name"])
+            back_exit = f"Back to {old_loc['name']}"
+            if back_exit not in loc_data["exits"]:
+                loc_data["exits"].append(back_exit)
+
+        for npc in new_entity.get("npcs", []):
+            # Scoped to the location, so two places can each have their own "Old Guard"
+            nid = f"forged_npc_{loc_id}_" + re.sub(r"[^a-z0-9]+", "_", npc["name"].lower()).strip("_")
+            current_state.add_npc(nid, dict(npc, location_id=loc_id))
+
+        current_state["current_location_id"] = loc_id
+        if loc_data.get("suggested_exits"):
+            cue = f"{cue} Visible paths: {'; '.join(loc_data['suggested_exits'])}."
+        notices.append(f"✨ Discovered: {loc_data['name']}")
+
+    elif new_entity["type"] == "npc":
+        data.setdefault("location_id", curr_loc)
+        current_state.add_npc(new_entity["id"], data)
+        notices.append(f"✨ Met NPC: {data['name']}")
+
+    elif new_entity["type"] == "item":
+        item_obj = {"name": new_entity["item_name"], "description": "Discovered.", "state": "found"}
+        current_state.add_item(item_obj, dedupe=False)
+        notices.append(f"✨ Found Item: {new_entity['item_name']}")
+
+    updates["narrative_cue"] = cue
+    return updates
+
+# --- DIRECTOR / SCRIBE MERGES ---
+def apply_director_output(state, director_output):
+    director_output = clamp_director_output(director_output)
+    if "story_state" not in state: state["story_state"] = {}
+    if "narrative_direction" in director_output:
+        state["story_state"]["narrative_direction"] = director_output["narrative_direction"]
+    if "global_tension" in director_output:
+        state["story_state"]["global_tension"] = director_output["global_tension"]
+    if "current_objective" in director_output:
+        state["story_state"]["current_objective"] = director_output["current_objective"]
+    if "world_events" in director_output:
+        state["world_events"] = director_output["world_events"]
+
+def apply_scribe_entities(state, new_entities, notices):
+    # Items
+    if "new_items" in new_entities and new_entities["new_items"]:
+        for item_name in new_entities["new_items"]:
+            if state.add_item({"name": item_name, "description": "Added by Scribe.", "state": "acquired"}):
+                notices.append(f"📝 Scribe added item: {item_name}")
+
+    # NPCs
+    if "new_npcs" in new_entities and new_entities["new_npcs"]:
+        for npc in new_entities["new_npcs"]:
+            if npc.get("presence") == "physical":
+                nid = f"scribe_npc_{npc['name'].lower().replace(' ', '_')}"
+                if state.add_npc(nid, {
+                    "name": npc['name'],
+                    "location_id": state["current_location_id"],
+                    "status": npc.get("status", "alive"),
+                    "attitude": "unknown"
+                }):
+                    notices.append(f"📝 Scribe recorded NPC: {npc['name']}")
+
+    # Locations
+    if "new_locations" in new_entities and new_entities["new_locations"]:
+        for loc in new_entities["new_locations"]:
+            lid = f"scribe_loc_{loc['name'].lower().replace(' ', '_')}"
+            if state.add_location(lid, {"name": loc['name'], "description": loc.get("description", "A location."), "exits": []}):
+                curr_id = state.get("current_location_id")
+                if curr_id in state["locations"]:
+                    if loc["name"] not in state["locations"][curr_id]["exits"]:
+                        state["locations"][curr_id]["exits"].append(loc["name"])
+                notices.append(f"📝 Scribe mapped: {loc['name']}")
+
+    # Journal
+    if "new_lore" in new_entities and new_entities["new_lore"]:
+        for entry in new_entities["new_lore"]:
+            if state.add_journal_entry(entry):
+                notices.append(f"📖 Journal Updated: {entry['topic']}")
+
+# --- THE TURN ---
+class Turn:
+    """
+    A turn running in the background. The narration can be consumed chunk by
+    chunk with stream_narration(), and its audio sentence by sentence with
+    stream_audio(), while the rest of the graph finishes; result() waits for
+    everything and returns the full outcome.
+    """
+    def __init__(self, current_state, prompt, save_path=STATE_FILE, on_done=None, mode=None):
+        self.current_state = WorldState.wrap(current_state)
+        self.prompt = prompt
+        self.save_path = save_path
+        self.mode = mode or ADJUDICATOR_MODE
+        if self.mode not in ADJUDICATOR_MODES:
+            raise ValueError(f"Unknown adjudicator mode: {self.mode}")
+        self.on_done = on_done
+        self.notices = []
+        self.pipeline = TurnPipeline()
+        self._chunks = queue.Queue()
+        self.narration_audio = start_narration_audio()
+        self._first_chunk_at = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _emit(self, chunk):
+        if self._first_chunk_at is None:
+            self._first_chunk_at = time.perf_counter()
+        self._chunks.put(chunk)
+
+    def _run(self):
+        try:
+            self._build_graph()
+            self.pipeline.run()
+        except Exception as e:
+            print(f"Turn Error: {e}")
+            self._error = e
+        finally:
+            try:
+                if self.on_done:
+                    self.on_done(self)
+            finally:
+                self._chunks.put(None)  # Always release the readers
+                self.narration_audio.close()
+
+    def stream_narration(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def stream_audio(self):
+        """
+        Yields the audio key of each narrated sentence once its clip is playable.
+        """
+        return self.narration_audio.ready_segments()
+
+    def result(self):
+        self._thread.join()
+        if self._error:
+            raise self._error
+        results = self.pipeline.results
+        timings = self.pipeline.report()
+        if self._first_chunk_at is not None:
+            timings["time_to_first_token"] = round(self._first_chunk_at - self.pipeline._started_at, 3)
+        return {
+            "state": results["archivist"]["state"],
+            "updates": results["archivist"]["updates"],
+            "story": results["narrator"],
+            "audio_key": results["audio"],
+            "notices": self.notices,
+            "mode": self.mode,
+            "timings": timings
+        }
+
+    def _build_graph(self):
+        """
+        Graph:
+            archivist -> director ----------> save
+                      -> narrator -> scribe -> save
+                                  -> audio
+        The Narrator drafts from the Archivist's cue with the current narrative
+        direction while the Director works out the next one.
+
+        In "fused" mode the archivist stage asks the Adjudicator for both
+        rulings at once and the director stage only applies its half, falling
+        back to a Director call when the fused answer has none (e.g. after a
+        discovery, whose cue comes from resolve_discovery() - the forged
+        neighborhood, a dream or a fresh Creator call - rather than the
+        Adjudicator).
+        """
+        current_state, prompt, notices = self.current_state, self.prompt, self.notices
+
+        def archivist_stage(p):
+            if self.mode == "fused":
+                updates = get_adjudication(current_state, prompt)
+            else:
+                updates = get_archivist_response(current_state, prompt)
+            if updates.get("error") == "target_missing":
+                updates = resolve_discovery(current_state, prompt, updates, notices)
+            log_msg = updates.get("narrative_cue", "Events unfold...")
+            return {"updates": updates, "log_msg": log_msg, "state": update_world_state(current_state, updates)}
+
+        def director_stage(p):
+            turn = p.results["archivist"]
+            # A discovery replaced the outcome the fused reply paced, so the Director looks again
+            fused = self.mode == "fused" and "discovery" not in turn["updates"]
+            director_output = split_director_output(turn["updates"]) if fused else None
+            if director_output is None:
+                director_output = update_story_state(turn["state"], prompt, turn["log_msg"])
+            with p.lock:
+                apply_director_output(turn["state"], director_output)
+            return director_output
+
+        narration_audio = self.narration_audio
+
+        def narrator_stage(p):
+            turn = p.results["archivist"]
+            parts = []
+            for chunk in narrate_scene_stream(turn["state"], prompt, turn["log_msg"]):
+                parts.append(chunk)
+                self._emit(chunk)
+                narration_audio.feed(chunk)  # Finished sentences start synthesizing right away
+            return "".join(parts)
+
+        def scribe_stage(p):
+            story = p.results["narrator"]
+            if not story:
+                return {}
+            turn = p.results["archivist"]
+            state = turn["state"]
+            acquired = turn["updates"].get("player_update", {}).get("inventory_add", [])
+            new_entities = scan_story_for_entities(story, state, acquired)
+            with p.lock:
+                apply_scribe_entities(state, new_entities, notices)
+            index_world(state)  # Embedded in the background, ready for the next turn's queries
+            return new_entities
+
+        def audio_stage(p):
+            story = p.results["narrator"]
+            # Only queues the last sentence; clips land in the audio cache later
+            return narration_audio.finish() if story else None
+
+        def save_stage(p):
+            turn = p.results["archivist"]
+            with p.lock:
+                record_turn(turn["state"], prompt, turn["log_msg"])
+                save_game(turn["state"], self.save_path)
+
+        self.pipeline.add_stage("archivist", archivist_stage)
+        self.pipeline.add_stage("director", director_stage, after=["archivist"])
+        self.pipeline.add_stage("narrator", narrator_stage, after=["archivist"])
+        self.pipeline.add_stage("scribe", scribe_stage, after=["narrator"])
+        self.pipeline.add_stage("audio", audio_stage, after=["narrator"])
+        self.pipeline.add_stage("save", save_stage, after=["director", "scribe"])
+
+def start_turn(current_state, prompt, save_path=STATE_FILE, on_done=None, mode=None):
+    return Turn(current_state, prompt, save_path, on_done, mode).start()
+
+def run_turn(current_state, prompt, save_path=STATE_FILE, mode=None):
+    """
+    Plays one turn of the game and waits for all of it.
+    """
+    return start_turn(current_state, prompt, save_path, mode=mode).result()
@@ -0,0 +1,108 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_FILE = "llm_cache.sqlite"
+MAX_ENTRIES = 5000        # Rows kept on disk; least recently used go first
+TTL = 7 * 24 * 3600       # Seconds before a cached response is considered stale
+MEMORY_ENTRIES = 256      # Hot entries kept in-process so repeat hits skip SQLite
+TOUCH_BATCH = 64          # Memory hits whose access time is written to SQLite in one go
+
+def make_key(backend, model_name, generation_config, prompt):
+    payload = json.dumps([backend, model_name, generation_config, prompt], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Content-addressed LLM response cache: an in-memory LRU in front of a
+    SQLite table, with TTL expiry and per-agent hit/miss counters. Access
+    times of memory hits are written back in batches, before any eviction.
+    """
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = {}
+        self._memory = OrderedDict()  # key -> (created, response)
+        self._touched = {}            # key -> access time not yet written to SQLite
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                agent TEXT,
+                response TEXT,
+                created REAL,
+                accessed REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def _count(self, agent, field):
+        counters = self.stats.setdefault(agent, {"hits": 0, "misses": 0})
+        counters[field] += 1
+
+    def _remember(self, key, created, response):
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def get(self, agent, key):
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and now - cached[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._flush_touched()
+                    self._conn.commit()
+                self._count(agent, "hits")
+                return cached[1]
+
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                self._count(agent, "misses")
+                return None
+
+            self._touched[key] = now
+            self._flush_touched()
+            self._conn.commit()
+            self._remember(key, row[1], row[0])
+            self._count(agent, "hits")
+            return row[0]
+
+    def put(self, agent, key, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, agent, response, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, agent, response, now, now)
+            )
+            # Expired rows first, then anything beyond the LRU limit
+            self._flush_touched()
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+            self._remember(key, now, response)
+
+    def get_stats(self):
+        with self._lock:
+            return {agent: dict(c) for agent, c in self.stats.items()}
@@ -0,0 +1,172 @@
+import os
+import time
+import heapq
+import threading
+import itertools
+
+RATE_LIMIT = float(os.getenv("LLM_RATE", "4"))  # Requests per second across all sessions; 0 = unlimited
+BURST = int(os.getenv("LLM_BURST", "8"))
+MIN_RATE = 0.25             # Floor for the adaptive rate after repeated 429s
+RECOVERY_STEP = 0.1         # Requests/second regained per successful call
+COOLDOWN_BASE = 1.0         # Seconds every caller pauses after a 429; doubles while they keep coming
+COOLDOWN_MAX = 30.0
+SHED_DEPTH = 8              # Queue depth at which optional agents are turned away
+OPTIONAL_MAX_WAIT = 10.0    # Seconds an optional call may queue before it is shed
+
+# Lower runs first. Everything from OPTIONAL_PRIORITY down can be shed.
+PRIORITIES = {
+    "archivist": 0, "adjudicator": 0, "narrator": 0,
+    "creator": 1, "director": 1, "architect": 1, "muse": 1, "embedder": 1,
+    "scribe": 2, "illustrator": 2,
+    "dreamer": 3, "forger": 3, "chronicler": 3
+}
+OPTIONAL_PRIORITY = 2
+CRITICAL_RESERVE = 1.0      # Tokens held back from optional agents for the critical path
+
+class Overloaded(Exception):
+    """
+    Raised instead of queueing an optional call when the scheduler is saturated.
+    """
+
+class Scheduler:
+    """
+    Token bucket in front of every model call, shared by all agents and
+    sessions. Waiting callers are served by priority, so the Archivist and
+    Narrator jump ahead of background work; optional agents are shed when the
+    queue is deep, and a 429 halves the rate and pauses everyone briefly
+    (recovering a little with each success).
+    """
+    def __init__(self, rate=RATE_LIMIT, burst=BURST):
+        self.max_rate = rate or None
+        self.rate = self.max_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._cooldown = COOLDOWN_BASE
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {"granted": 0, "shed": 0, "rate_limited": 0, "wait_total": 0.0}
+
+    def priority(self, agent):
+        return PRIORITIES.get(agent, 1)
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def depth(self):
+        with self._cond:
+            return len(self._waiting)
+
+    def should_shed(self, agent):
+        return self.priority(agent) >= OPTIONAL_PRIORITY and self.depth() >= SHED_DEPTH
+
+    def acquire(self, agent):
+        """
+        Blocks until this agent may call the model. Raises Overloaded for
+        optional agents when the queue is deep or they have waited too long.
+        """
+        priority = self.priority(agent)
+        optional = priority >= OPTIONAL_PRIORITY
+        if self.max_rate is None:
+            # No bucket, but a 429 still holds everyone for the cooldown
+            with self._cond:
+                while time.monotonic() < self._paused_until:
+                    self._cond.wait(timeout=self._paused_until - time.monotonic())
+                self.stats["granted"] += 1
+            return
+        start = time.monotonic()
+        with self._cond:
+            if optional and len(self._waiting) >= SHED_DEPTH:
+                self.stats["shed"] += 1
+                raise Overloaded(f"{agent} shed: {len(self._waiting)} calls queued")
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    needed = 1.0 + (CRITICAL_RESERVE if optional else 0.0)
+                    if self._waiting[0] == entry and now >= self._paused_until and self.tokens >= needed:
+                        self.tokens -= 1.0
+                        self.stats["granted"] += 1
+                        self.stats["wait_total"] += now - start
+                        return
+                    if optional and now - start > OPTIONAL_MAX_WAIT:
+                        self.stats["shed"] += 1
+                        raise Overloaded(f"{agent} shed after {now - start:.1f}s in queue")
+                    delay = max(self._paused_until - now, (needed - self.tokens) / self.rate, 0.005)
+                    self._cond.wait(timeout=delay)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self._cooldown = COOLDOWN_BASE
+            if self.rate and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + RECOVERY_STEP)
+
+    def on_rate_limited(self):
+        """
+        A 429 came back: halve the rate and hold every caller for a cooldown.
+        """
+        with self._cond:
+            self.stats["rate_limited"] += 1
+            if self.rate:
+                self.rate = max(MIN_RATE, self.rate / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + self._cooldown)
+            self._cooldown = min(COOLDOWN_MAX, self._cooldown * 2)
+            self._cond.notify_all()
+
+    def get_stats(self):
+        with self._cond:
+            return dict(self.stats, rate=self.rate, queued=len(self._waiting))
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+def set_scheduler(scheduler):
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+
+# --- BACKGROUND WORKERS ---
+_workers = set()  # (agent, id of state) pairs with a worker in flight
+_workers_lock = threading.Lock()
+
+def _run_worker(key, agent, current_state, work):
+    try:
+        work(current_state)
+    except Exception as e:
+        print(f"{agent.capitalize()} Error: {e}")
+    finally:
+        with _workers_lock:
+            _workers.discard(key)
+
+def start_worker(agent, current_state, work):
+    """
+    Runs work(current_state) in a background thread while the player reads:
+    at most one per agent and state, and none while that agent is being shed.
+    Returns True if a worker was started.
+    """
+    if get_scheduler().should_shed(agent):
+        return False
+    key = (agent, id(current_state))
+    with _workers_lock:
+        if key in _workers:
+            return False
+        _workers.add(key)
+    threading.Thread(target=_run_worker, args=(key, agent, current_state, work), daemon=True).start()
+    return True
@@ -0,0 +1,278 @@
+import re
+import json
+import threading
+import typing
+from dataclasses import dataclass, field, fields, is_dataclass, MISSING
+from typing import Dict, List, Optional, Union
+from llm import generate, cache_reply, JSON_CONFIG
+
+PARSE_STATS = {}  # agent -> {"ok", "repaired", "retried", "failed"}
+_stats_lock = threading.Lock()
+
+class SchemaError(ValueError):
+    """
+    The model's reply could not be read as the agent's schema, even after repair.
+    """
+
+# --- SCHEMAS ---
+# Fields without a default are required; a list item missing one is dropped,
+# a top-level reply missing one is a parse failure. Optional fields left at
+# None are omitted from the result, so callers can still test "key in output".
+
+@dataclass
+class ArchivistOutput:
+    narrative_cue: Optional[str] = None
+    npc_updates: Dict[str, dict] = field(default_factory=dict)
+    location_updates: Dict[str, dict] = field(default_factory=dict)
+    item_updates: Dict[str, dict] = field(default_factory=dict)
+    error: Optional[str] = None
+    target_name: Optional[str] = None
+
+@dataclass
+class DirectorOutput:
+    current_objective: Optional[str] = None
+    narrative_direction: Optional[str] = None
+    global_tension: Optional[int] = None
+    world_events: Optional[List[dict]] = None
+
+@dataclass
+class AdjudicatorOutput(ArchivistOutput, DirectorOutput):
+    pass
+
+@dataclass
+class EntityData:
+    name: str = ""  # Items often come back with only an item_name; callers fill it in
+    description: str = ""
+    exits: List[str] = field(default_factory=list)
+    suggested_exits: List[str] = field(default_factory=list)
+
+@dataclass
+class CreatorOutput:
+    data: EntityData
+    type: str = "location"
+    id: str = ""
+    item_name: str = ""
+    narrative_cue: Optional[str] = None
+
+@dataclass
+class ForgedNpc:
+    name: str
+    description: str = ""
+    attitude: str = "neutral"
+
+@dataclass
+class ForgedLocation:
+    exit: str
+    data: EntityData
+    id: str = ""
+    narrative_cue: Optional[str] = None
+    npcs: List[ForgedNpc] = field(default_factory=list)
+
+@dataclass
+class NeighborhoodOutput:
+    locations: List[ForgedLocation] = field(default_factory=list)
+
+@dataclass
+class Dream:
+    type: str
+    data: Optional[dict] = None
+    id: Optional[str] = None
+    item_name: Optional[str] = None
+    keywords: List[str] = field(default_factory=list)
+
+@dataclass
+class ScribeNpc:
+    name: str
+    description: str = ""
+    presence: str = "physical"
+
+@dataclass
+class ScribeLocation:
+    name: str
+    description: str = ""
+
+@dataclass
+class LoreEntry:
+    topic: str
+    entry: str = ""
+
+@dataclass
+class ScribeOutput:
+    new_items: List[str] = field(default_factory=list)
+    new_npcs: List[ScribeNpc] = field(default_factory=list)
+    new_locations: List[ScribeLocation] = field(default_factory=list)
+    new_lore: List[LoreEntry] = field(default_factory=list)
+
+@dataclass
+class InventoryItem:
+    name: str
+    description: str = ""
+    state: str = "default"
+
+@dataclass
+class ScenarioPlayer:
+    name: str = "Traveler"
+    inventory: List[InventoryItem] = field(default_factory=list)
+
+@dataclass
+class ScenarioOutput:
+    location: EntityData
+    intro_text: str
+    genre: str = "adventure"
+    player: ScenarioPlayer = field(default_factory=ScenarioPlayer)
+
+# --- REPAIR ---
+FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.I)
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+PY_LITERALS = re.compile(r"(?<=[\s:\[,])(True|False|None)(?=\s*[,}\]])")
+
+def _outermost(text):
+    """
+    The span from the first opening bracket to its matching close, ignoring prose around it.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    start = min(starts)
+    close = "}" if text[start] == "{" else "]"
+    end = text.rfind(close)
+    return text[start:end + 1] if end > start else text[start:]
+
+def repair_json(text):
+    """
+    Parses a model reply, fixing the usual slips on the way: code fences,
+    prose around the object, trailing commas, smart quotes and Python literals.
+    Returns (value, repaired) or raises SchemaError.
+    """
+    try:
+        return json.loads(text), False
+    except (TypeError, json.JSONDecodeError):
+        pass
+    candidate = _outermost(FENCE.sub("", str(text or "")))
+    for fix in (
+        lambda t: t,
+        lambda t: TRAILING_COMMA.sub(r"\1", t),
+        lambda t: t.translate(SMART_QUOTES),
+        lambda t: PY_LITERALS.sub(lambda m: {"True": "true", "False": "false", "None": "null"}[m.group(1)], t),
+    ):
+        candidate = fix(candidate)
+        try:
+            return json.loads(candidate), True
+        except json.JSONDecodeError:
+            continue
+    raise SchemaError(f"Unparseable JSON: {str(text)[:80]!r}")
+
+# --- COERCION ---
+def _coerce(value, hint):
+    origin = typing.get_origin(hint)
+    args = typing.get_args(hint)
+    if origin is Union:  # Optional[X]
+        if value is None:
+            return None
+        return _coerce(value, next(a for a in args if a is not type(None)))
+    if is_dataclass(hint):
+        return coerce(value, hint)
+    if origin in (list, List):
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            value = list(value.values()) if isinstance(value, dict) else [value]
+        items = []
+        for item in value:
+            try:
+                items.append(_coerce(item, args[0]) if args else item)
+            except SchemaError:
+                continue  # One bad entry shouldn't sink the rest
+        return items
+    if origin in (dict, Dict) or hint is dict:
+        if not value:
+            return {}  # null, "" or [] where an empty object was meant
+        if not isinstance(value, dict):
+            raise SchemaError(f"Expected an object, got {type(value).__name__}")
+        return value
+    if hint is str:
+        if isinstance(value, dict) and "name" in value:
+            return str(value["name"])  # e.g. new_items given as objects
+        if isinstance(value, (dict, list)):
+            raise SchemaError(f"Expected text, got {type(value).__name__}")
+        return str(value)
+    if hint is int:
+        try:
+            return int(float(str(value).split("/")[0]))  # "7", 7.0 and "7/10" all read as 7
+        except ValueError:
+            raise SchemaError(f"Expected a number, got {value!r}")
+    return value
+
+def coerce(obj, schema):
+    """
+    Validates a parsed reply against a schema dataclass: converts types, fills
+    defaults and keeps unknown keys as they are. Returns a plain dict.
+    """
+    if not isinstance(obj, dict):
+        raise SchemaError(f"Expected an object for {schema.__name__}, got {type(obj).__name__}")
+    hints = typing.get_type_hints(schema)
+    result = dict(obj)
+    for f in fields(schema):
+        value = obj.get(f.name)
+        required = f.default is MISSING and f.default_factory is MISSING
+        if value is None or (required and value == ""):
+            if required:
+                raise SchemaError(f"{schema.__name__} is missing '{f.name}'")
+            value = f.default_factory() if f.default is MISSING else f.default
+        value = _coerce(value, hints[f.name])
+        if value is None:
+            result.pop(f.name, None)
+        else:
+            result[f.name] = value
+    return result
+
+# --- CALLS ---
+def _count(agent, outcome):
+    with _stats_lock:
+        stats = PARSE_STATS.setdefault(agent, {"ok": 0, "repaired": 0, "retried": 0, "failed": 0})
+        stats[outcome] += 1
+
+def get_parse_stats():
+    with _stats_lock:
+        report = {}
+        for agent, s in PARSE_STATS.items():
+            total = s["ok"] + s["repaired"] + s["retried"] + s["failed"]
+            report[agent] = dict(s, failure_rate=round((s["repaired"] + s["retried"] + s["failed"]) / total, 3) if total else 0.0)
+        return report
+
+def parse_reply(text, schema, many=False):
+    value, repaired = repair_json(text)
+    if many:
+        if isinstance(value, dict):
+            # Some replies wrap the list: {"dreams": [...]}
+            value = next((v for v in value.values() if isinstance(v, list)), [value])
+        return _coerce(value, List[schema]), repaired
+    return coerce(value, schema), repaired
+
+def generate_structured(agent, prompt, schema, many=False, generation_config=JSON_CONFIG, cache=False, system_instruction=None):
+    """
+    generate() for JSON agents: the reply is repaired locally and validated
+    against 'schema' (a list of them if many=True). Only if that fails is the
+    model asked once more. Raises SchemaError if the second reply is no better.
+    With cache=True only a reply that validates is cached, under the original prompt.
+    """
+    text = generate(agent, prompt, generation_config, cache=cache, system_instruction=system_instruction,
+                    validate=lambda reply: parse_reply(reply, schema, many))
+    try:
+        result, repaired = parse_reply(text, schema, many)
+        _count(agent, "repaired" if repaired else "ok")
+        return result
+    except SchemaError as e:
+        print(f"{agent.title()} Parse Error: {e}")
+    retry_prompt = f"{prompt}\n    Your previous reply was not valid JSON for the schema above. Reply with the JSON object only.\n"
+    text = generate(agent, retry_prompt, generation_config, system_instruction=system_instruction)
+    try:
+        result, _ = parse_reply(text, schema, many)
+    except SchemaError:
+        _count(agent, "failed")
+        raise
+    _count(agent, "retried")
+    if cache:
+        cache_reply(agent, prompt, text, generation_config, system_instruction=system_instruction)
+    return result
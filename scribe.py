@@ -1,42 +1,195 @@
-import os
-import json
-import google.generativeai as genai
-from dotenv import load_dotenv
+import re
+import threading
+from schemas import generate_structured, ScribeOutput
+from scheduler import get_scheduler
+from world import WorldState
 
-load_dotenv()
-MODEL_NAME = 'models/gemini-2.5-flash' 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+CONFIDENCE_THRESHOLD = 0.75  # Below this share of resolved names, ask the LLM
 
-def scan_story_for_entities(story_text, current_state):
+SCRIBE_STATS = {"local": 0, "llm": 0, "llm_calls_avoided": 0}
+_stats_lock = threading.Lock()
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+")
+CAPITALIZED = re.compile(r"[A-Z][\w'’-]*(?:\s+(?:of|the|de|von)?\s*[A-Z][\w'’-]*)*")
+
+# Capitalized for grammar, not because they name anything
+COMMON_CAPS = {
+    "the", "a", "an", "you", "your", "yours", "i", "he", "she", "it", "they", "we", "his", "her",
+    "their", "its", "this", "that", "these", "those", "there", "here", "but", "and", "or", "as",
+    "in", "on", "at", "to", "of", "with", "from", "for", "if", "when", "while", "then", "now",
+    "somewhere", "something", "someone", "nothing", "no", "yes", "not", "what", "who", "where",
+    "why", "how", "suddenly", "slowly", "finally", "still", "yet", "before", "after", "behind",
+    "beyond", "above", "below", "inside", "outside"
+}
+PLACE_WORDS = {
+    "hall", "tower", "keep",
+    "castle", "forest", "wood", "woods", "cave", "caves", "cavern", "temple", "shrine", "inn",
+    "tavern", "road", "bridge", "river", "lake", "sea", "mountain", "mountains", "peak", "valley",
+    "village", "town", "city", "district", "quarter", "square", "harbor", "harbour", "docks",
+    "port", "crypt", "tomb", "library", "chapel", "cathedral", "garden", "gardens", "vault",
+    "mine", "mines", "ruins", "station", "deck", "bay", "sector", "lab", "laboratory", "street",
+    "alley", "plaza", "fortress", "citadel", "palace", "manor", "camp", "outpost", "swamp",
+    "marsh", "desert", "wastes", "pass", "canyon", "island", "isle", "well", "cellar", "room"
+}
+ACQUIRED = re.compile(
+    r"\byou (?:pick up|take|grab|pocket|receive|collect|find|are handed|now hold)\s+"
+    r"(?:a|an|the|some)\s+([a-z][\w' -]{1,40}?)(?=[.,;:!?]|\s+(?:and|from|off|out)\b)", re.I
+)
+LORE_CUES = re.compile(
+    r"\b(?:it is said|legend|legends|long ago|centuries|ancient|prophecy|secret|rumou?r|"
+    r"history|once (?:was|were)|they say|the code is|password|sworn|curse[ds]?|forbidden)\b|\d{3,}", re.I
+)
+
+def _record(source):
+    with _stats_lock:
+        SCRIBE_STATS[source] += 1
+        if source == "local":
+            SCRIBE_STATS["llm_calls_avoided"] += 1
+
+def get_scribe_stats():
+    total = SCRIBE_STATS["local"] + SCRIBE_STATS["llm"]
+    return dict(SCRIBE_STATS, local_rate=round(SCRIBE_STATS["local"] / total, 2) if total else 0.0)
+
+# --- LOCAL EXTRACTION ---
+def build_gazetteer(current_state):
     """
-    Reads the narrative text and extracts new entities AND LORE.
+    Lowercase name -> kind for things the world expects to appear: queued
+    Dreamer content, forged neighbors waiting in 'pending_world' and named
+    exits that have not been mapped yet. Known world names are left to
+    WorldState.find.
+    """
+    gazetteer = {}
+    for forged in current_state.get("pending_world", {}).values():
+        gazetteer[forged["data"]["name"].lower()] = "location"
+        for npc in forged.get("npcs", []):
+            gazetteer[npc["name"].lower()] = "npc"
+    for dream in current_state.get("shadow_queue", []):
+        data = dream.get("data") or {}
+        name = dream.get("item_name") if dream.get("type") == "item" else data.get("name")
+        if name:
+            gazetteer[str(name).lower()] = dream["type"]
+    for loc in current_state.get("locations", {}).values():
+        for exit_name in loc.get("exits", []) + loc.get("suggested_exits", []):
+            if exit_name[:1].isupper() and not exit_name.startswith("Back to "):
+                gazetteer.setdefault(exit_name.lower(), "location")
+    return gazetteer
+
+def _forged_here(current_state):
+    """
+    Lowercase names of the NPCs forged with the current location's neighbors.
+    """
+    here = current_state.get("current_location_id")
+    return {npc["name"].lower() for forged in current_state.get("pending_world", {}).values()
+            if forged.get("origin") == here for npc in forged.get("npcs", [])}
+
+def _candidates(sentence):
+    """
+    Capitalized phrases in a sentence as (phrase, sentence_initial).
+    """
+    for match in CAPITALIZED.finditer(sentence):
+        words = match.group(0).split()
+        # Peel grammatical capitals off the front ("The Void Kin" -> "Void Kin")
+        skipped = 0
+        while words and words[0].lower() in COMMON_CAPS:
+            words.pop(0)
+            skipped += 1
+        if not words:
+            continue
+        initial = not re.search(r"\w", sentence[:match.start()]) and skipped == 0
+        yield " ".join(words).strip("'’-"), initial
+
+def _classify(phrase, gazetteer):
+    """
+    The kind of a new name, or None if the text alone can't tell. People are
+    only recognized from the gazetteer: a bare name may be a town, an ale or
+    a portrait on the wall, and only the LLM can tell whether someone is present.
+    """
+    key = phrase.lower()
+    if key in gazetteer:
+        return gazetteer[key]
+    if key.split()[-1] in PLACE_WORDS:
+        return "location"
+    return None
+
+def _item_name(item):
+    return str(item.get("name", "") if isinstance(item, dict) else item).lower()
+
+def extract_entities_locally(story_text, current_state, expected_items=()):
+    """
+    Finds new names with capitalized-phrase chunking and a gazetteer.
+    Returns (entities, confidence, lore_detected), entities in the Scribe schema.
+
+    "You take the X" only adds X if the world expects such an item (queued
+    dreams, or 'expected_items' such as the Archivist's inventory_add);
+    otherwise it counts as unresolved ("you take the stairs"). Likewise an
+    NPC is only marked physically present if it was forged with the current
+    location's neighbors; any other is passed on without a presence and
+    counts as unresolved, leaving that call to the LLM.
     """
-    model = genai.GenerativeModel(MODEL_NAME, 
-        generation_config={"response_mime_type": "application/json"})
+    world = WorldState.wrap(current_state)
+    gazetteer = build_gazetteer(current_state)
+    forged_here = _forged_here(current_state)
+    expected = {_item_name(i) for i in expected_items}
+    player_name = str(current_state.get("player", {}).get("name", "")).lower()
+    sentences = [s for s in SENTENCE_END.split(story_text) if s.strip()]
 
-    # --- INVENTORY HANDLING ---
-    raw_inventory = current_state['player'].get('inventory', [])
-    existing_items = []
-    for item in raw_inventory:
-        if isinstance(item, dict):
-            existing_items.append(item.get("name", "").lower())
-        else:
-            existing_items.append(str(item).lower())
-    # --------------------------
+    # A sentence-initial word only counts if it also shows up as a name elsewhere
+    mid_sentence = {p.lower() for s in sentences for p, initial in _candidates(s.strip()) if not initial}
 
-    existing_npcs = [n['name'].lower() for n in current_state['npcs'].values()]
-    existing_locs = [l['name'].lower() for l in current_state['locations'].values()]
+    found = {"new_items": [], "new_npcs": [], "new_locations": [], "new_lore": []}
+    seen, resolved, total = set(), 0, 0
+    for sentence in sentences:
+        sentence = sentence.strip()
+        for phrase, initial in _candidates(sentence):
+            key = phrase.lower()
+            if key in seen or key == player_name:
+                continue
+            if initial and " " not in phrase and key not in gazetteer and key not in mid_sentence:
+                continue
+            seen.add(key)
+            if any(world.find(kind, phrase) for kind in ("npc", "location", "item")):
+                continue
+            total += 1
+            kind = _classify(phrase, gazetteer)
+            if kind is None:
+                continue
+            if kind == "npc" and key not in forged_here:
+                found["new_npcs"].append({"name": phrase, "description": sentence})
+                continue
+            resolved += 1
+            if kind == "npc":
+                found["new_npcs"].append({"name": phrase, "description": sentence, "presence": "physical"})
+            elif kind == "location":
+                found["new_locations"].append({"name": phrase, "description": sentence})
+            else:
+                found["new_items"].append(phrase)
 
-    system_prompt = """
+        for item in ACQUIRED.findall(sentence):
+            name = item.strip().title()
+            key = name.lower()
+            if key in seen or world.has_item(name):
+                continue
+            seen.add(key)
+            total += 1
+            if gazetteer.get(key) == "item" or key in expected:
+                resolved += 1
+                found["new_items"].append(name)
+
+    confidence = resolved / total if total else 1.0
+    lore_detected = bool(LORE_CUES.search(story_text))
+    return found, confidence, lore_detected
+
+# --- LLM ---
+SCRIBE_INSTRUCTION = """
     You are The Scribe. You synchronize the Story with the Database.
-    
+
     YOUR JOB:
     Read the provided STORY TEXT. Identify new Items, NPCs, Locations, AND IMPORTANT LORE.
-    
+
     RULES:
     1. **Items/NPCs/Locations:** Only add if PHYSICALLY PRESENT.
     2. **LORE (New!):** If the text reveals specific plot information, secrets, or history (e.g., "The Void Kin hate light", "The code is 0451"), extract it.
-    
+
     OUTPUT SCHEMA:
     {
       "new_items": ["Item Name"],
@@ -46,18 +199,38 @@ def scan_story_for_entities(story_text, current_state):
     }
     """
 
+def _scan_with_llm(story_text, current_state):
+    # Lowercased names come straight from the world's name index
+    world = WorldState.wrap(current_state)
+    existing_items = world.names("item")
+    existing_npcs = world.names("npc")
+    existing_locs = world.names("location")
+
     prompt = f"""
-    {system_prompt}
-    
     EXISTING ENTITIES (Ignore): {existing_items}, {existing_npcs}, {existing_locs}
-    
+
     STORY TEXT TO SCAN:
     "{story_text}"
     """
-    
+
     try:
-        response = model.generate_content(prompt)
-        return json.loads(response.text)
+        return generate_structured("scribe", prompt, ScribeOutput, system_instruction=SCRIBE_INSTRUCTION)
     except Exception as e:
         print(f"Scribe Error: {e}")
-        return {}
\ No newline at end of file
+        return None
+
+def scan_story_for_entities(story_text, current_state, expected_items=()):
+    """
+    Reads the narrative text and extracts new entities AND LORE.
+    Plain scenes are handled locally; the LLM is only asked when the local
+    pass can't place some of the names or the text looks like it reveals lore,
+    and the local result stands in if that call is shed or fails.
+    """
+    found, confidence, lore_detected = extract_entities_locally(story_text, current_state, expected_items)
+    # Under load the LLM pass is optional; the local reading is still correct, just less complete
+    if (confidence >= CONFIDENCE_THRESHOLD and not lore_detected) or get_scheduler().should_shed("scribe"):
+        _record("local")
+        return found
+    _record("llm")
+    scanned = _scan_with_llm(story_text, current_state)
+    return found if scanned is None else scanned
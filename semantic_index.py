@@ -0,0 +1,326 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
+import llm
+from utils import write_atomic
+from world import WorldState
+from scheduler import start_worker
+
+INDEX_DIR = "embeddings"
+INITIAL_ROWS = 1024     # Matrix capacity; doubles when full
+MAX_ROWS = 50000        # Embeddings kept; past this the least recently used are pruned
+PRUNE_TO = 0.75         # Share of MAX_ROWS left after a prune
+QUERY_CACHE_SIZE = 128
+QUERY_TIMEOUT = 1.0     # Seconds a turn waits for its query embedding before going on without facts
+TOP_K = 5
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+# --- DOCUMENTS ---
+def _journal_text(entry):
+    return f"{entry.get('topic')}: {entry.get('entry', '')}"
+
+def _location_text(lid, loc):
+    return f"{loc.get('name', lid)}: {loc.get('description', '')}"
+
+def _npc_text(nid, npc):
+    details = ", ".join(f"{k} {v}" for k, v in npc.items() if k not in ("name", "location_id") and isinstance(v, str))
+    return f"{npc.get('name', nid)} ({details})"
+
+def world_documents(current_state):
+    """
+    The facts worth retrieving, as {key: text}: journal lore, location
+    descriptions and NPC records.
+    """
+    docs = {}
+    for entry in current_state.get("player", {}).get("journal", []):
+        docs[f"journal:{entry.get('topic')}"] = _journal_text(entry)
+    for lid, loc in current_state.get("locations", {}).items():
+        docs[f"location:{lid}"] = _location_text(lid, loc)
+    for nid, npc in current_state.get("npcs", {}).items():
+        docs[f"npc:{nid}"] = _npc_text(nid, npc)
+    return docs
+
+def world_document(current_state, kind, id):
+    """
+    The text of one document, or None if it is no longer in the world.
+    """
+    if kind == "journal":
+        for entry in current_state.get("player", {}).get("journal", []):
+            if entry.get("topic") == id:
+                return _journal_text(entry)
+    elif kind == "location" and id in current_state.get("locations", {}):
+        return _location_text(id, current_state["locations"][id])
+    elif kind == "npc" and id in current_state.get("npcs", {}):
+        return _npc_text(id, current_state["npcs"][id])
+    return None
+
+class SemanticIndex:
+    """
+    Embedding store shared by every session. Each distinct text is embedded
+    once and kept, keyed by content hash, as a row of a float32 matrix that
+    lives in a memory-mapped file; a query embeds the action and takes cosine
+    similarity against the rows for the facts the world currently holds.
+
+    Each session's documents are kept with their hashes and only the ones
+    its WorldState reports changed are rebuilt. Documents are embedded in
+    the background (index_world, or a query that meets facts not embedded
+    yet); until then a fact is simply not among the results. The query
+    itself is embedded on the turn's path, but a turn waits at most
+    QUERY_TIMEOUT for it and goes on without facts past that. Rows not
+    searched or indexed for longest are pruned once there are more than
+    MAX_ROWS.
+    """
+    def __init__(self, index_dir=None, model=None):
+        self.model = model or llm.embedding_model()
+        self.dir = os.path.join(index_dir or INDEX_DIR, re.sub(r"[^A-Za-z0-9_-]+", "_", self.model))
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.meta_path = os.path.join(self.dir, "index.json")
+        self._lock = threading.Lock()
+        self._queries = OrderedDict()
+        self._pending_queries = {}   # query text -> future of its embedding
+        self._query_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="query-embed")
+        self._docs_lock = threading.Lock()
+        self._sessions = {}  # id(WorldState) -> {document key: (text, content hash)}
+        self.rows = {}       # content hash -> row
+        self.used = {}       # content hash -> time it was last searched or indexed
+        self._clock = 0
+        self.dim = None
+        self.matrix = None
+        self._load()
+
+    # --- STORAGE ---
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.rows = {h: i for i, h in enumerate(meta["hashes"])}
+        self.used = dict(zip(meta["hashes"], meta.get("used", [0] * len(self.rows))))
+        self._clock = max(self.used.values(), default=0)
+        capacity = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _capacity_for(self, needed, capacity=0):
+        capacity = max(INITIAL_ROWS, capacity)
+        while capacity < needed:
+            capacity *= 2
+        return capacity
+
+    def _ensure_capacity(self, needed):
+        capacity = 0 if self.matrix is None else self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = self._capacity_for(needed, capacity)
+        if self.matrix is not None:
+            self.matrix.flush()
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+
+    def _prune(self):
+        """
+        Rewrites the matrix with only the most recently used rows. Searches
+        already holding the old matrix keep reading it until they finish.
+        """
+        keep = sorted(self.rows, key=self.used.get, reverse=True)[:int(MAX_ROWS * PRUNE_TO)]
+        keep.sort(key=self.rows.get)
+        vectors = np.asarray(self.matrix[[self.rows[h] for h in keep]])
+        capacity = self._capacity_for(len(keep))
+        tmp_path = f"{self.vectors_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(vectors.tobytes())
+            f.truncate(capacity * self.dim * 4)
+        os.replace(tmp_path, self.vectors_path)
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.rows = {h: i for i, h in enumerate(keep)}
+        self.used = {h: self.used[h] for h in keep}
+
+    def _touch(self, hashes):
+        self._clock += 1
+        for h in hashes:
+            self.used[h] = self._clock
+
+    def _save_meta(self):
+        hashes = sorted(self.rows, key=self.rows.get)
+        write_atomic(self.meta_path, json.dumps({
+            "model": self.model, "dim": self.dim, "hashes": hashes, "used": [self.used.get(h, 0) for h in hashes]
+        }))
+
+    # --- INDEXING ---
+    def add(self, texts):
+        """
+        Embeds whichever texts have not been seen before, in one batch.
+        Returns the number of new embeddings.
+        """
+        return self._add_hashed({content_hash(t): t for t in texts})
+
+    def _add_hashed(self, hashes):
+        with self._lock:
+            missing = [h for h in hashes if h not in self.rows]
+        if not missing:
+            return 0
+        vectors = _normalize(llm.embed([hashes[h] for h in missing]))
+        with self._lock:
+            fresh = [(h, v) for h, v in zip(missing, vectors) if h not in self.rows]
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            self._ensure_capacity(len(self.rows) + len(fresh))
+            for h, vector in fresh:
+                row = len(self.rows)
+                self.matrix[row] = vector
+                self.rows[h] = row
+            self._touch(hashes)
+            if len(self.rows) > MAX_ROWS:
+                self._prune()
+            self.matrix.flush()
+            self._save_meta()
+        return len(fresh)
+
+    def documents(self, current_state, kinds=None):
+        """
+        The world's documents as {key: (text, content hash)}. For a
+        WorldState only the documents changed since the last call are
+        rebuilt and rehashed; a plain dict is read in full every time.
+        """
+        tracked = isinstance(current_state, WorldState)
+        with self._docs_lock:
+            docs = self._sessions.get(id(current_state)) if tracked else None
+            changes = current_state.take_changes() if tracked else None
+            if docs is None or changes is None:
+                docs = self._rebuild_documents(current_state, docs or {})
+            elif changes:
+                docs = dict(docs)  # Searches already holding the old set keep it
+                for kind, ident in changes:
+                    key = f"{kind}:{ident}"
+                    text = world_document(current_state, kind, ident)
+                    if text is None:
+                        docs.pop(key, None)
+                    elif key not in docs or docs[key][0] != text:
+                        docs[key] = (text, content_hash(text))
+            if tracked:
+                if id(current_state) not in self._sessions:
+                    weakref.finalize(current_state, self._forget, id(current_state))
+                self._sessions[id(current_state)] = docs
+        if kinds:
+            return {key: doc for key, doc in docs.items() if key.split(":", 1)[0] in kinds}
+        return docs
+
+    def _rebuild_documents(self, current_state, previous):
+        docs = {}
+        for key, text in world_documents(current_state).items():
+            cached = previous.get(key)
+            docs[key] = cached if cached is not None and cached[0] == text else (text, content_hash(text))
+        return docs
+
+    def _forget(self, session):
+        with self._docs_lock:
+            self._sessions.pop(session, None)
+
+    def index_state(self, current_state):
+        return self._add_hashed({h: text for text, h in self.documents(current_state).values()})
+
+    # --- QUERIES ---
+    def _query_vector(self, text, timeout=QUERY_TIMEOUT):
+        """
+        The query's embedding, or None if it is not ready within the timeout.
+        A late embedding still lands in the cache for the next time.
+        """
+        with self._lock:
+            if text in self._queries:
+                self._queries.move_to_end(text)
+                return self._queries[text]
+            future = self._pending_queries.get(text)
+            if future is None:
+                future = self._pending_queries[text] = self._query_pool.submit(self._embed_query, text)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            print(f"Semantic Index: query embedding took over {timeout}s, going on without facts")
+            return None
+
+    def _embed_query(self, text):
+        try:
+            vector = _normalize(llm.embed([text], task_type="retrieval_query"))[0]
+            with self._lock:
+                self._queries[text] = vector
+                while len(self._queries) > QUERY_CACHE_SIZE:
+                    self._queries.popitem(last=False)
+            return vector
+        finally:
+            with self._lock:
+                self._pending_queries.pop(text, None)
+
+    def search(self, current_state, query, k=TOP_K, kinds=None):
+        """
+        Top-k world facts for a query as [(key, text, score)], best first.
+        'kinds' limits the search to e.g. ("journal",).
+        """
+        docs = self.documents(current_state, kinds)
+        if not docs or not query:
+            return []
+        with self._lock:
+            keys = [key for key, (_, h) in docs.items() if h in self.rows]
+            rows = np.fromiter((self.rows[docs[key][1]] for key in keys), dtype=np.int64, count=len(keys))
+            self._touch(docs[key][1] for key in keys)
+            matrix = self.matrix
+        if len(keys) < len(docs):
+            start_worker("embedder", current_state, self.index_state)  # Ready for a later query
+        if not keys:
+            return []
+        vector = self._query_vector(query)
+        if vector is None:
+            return []
+        scores = matrix[rows] @ vector
+        top = np.argsort(-scores)[:k]
+        return [(keys[i], docs[keys[i]][0], round(float(scores[i]), 4)) for i in top]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None or _index.model != llm.embedding_model():
+            _index = SemanticIndex()
+        return _index
+
+def set_index(index):
+    global _index
+    with _index_lock:
+        _index = index
+
+def relevant_facts(current_state, query, k=TOP_K, kinds=None):
+    """
+    Texts of the k facts most related to the query; empty if retrieval is unavailable.
+    """
+    try:
+        return [text for _, text, _ in get_index().search(current_state, query, k, kinds)]
+    except Exception as e:
+        print(f"Semantic Index Error: {e}")
+        return []
+
+def index_world(current_state):
+    """
+    Embeds anything new in the world in the background, ahead of the next
+    query (e.g. fresh Scribe lore). Returns True if a worker was started.
+    """
+    try:
+        return start_worker("embedder", current_state, get_index().index_state)
+    except Exception as e:
+        print(f"Semantic Index Error: {e}")
+        return False
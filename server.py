@@ -0,0 +1,210 @@
+"""
+Asyncio JSON-over-HTTP entry point for the headless GameEngine.
+
+    python server.py --port 8081
+
+    POST /sessions/<id>/turn      {"action": "..."}      -> turn result
+    POST /sessions/<id>/turn?stream=1                    -> NDJSON: narration chunks and sentence audio keys, then the result
+    POST /sessions/<id>/scenario  {"prompt": "..."}      -> {"intro_text": ...}
+    POST /sessions/<id>/reset                            -> new game state
+    GET  /sessions/<id>/state                            -> current game state (404 if never played)
+    GET  /audio/<audio_key>                              -> narration or sentence MP3 once synthesized
+    GET  /metrics                                        -> Prometheus counters and latency histograms
+    GET  /traces                                         -> recent spans as JSONL
+
+Turn bodies may also carry "mode": "split" or "fused" to pick the adjudicator mode.
+"""
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from engine import GameEngine
+from tts import audio_path
+from tracing import prometheus_text, recent_spans, RECENT_SPANS
+
+MAX_WORKERS = 256     # Blocking turn threads; each mostly waits on the network
+MAX_BODY = 64 * 1024
+EVICT_INTERVAL = 60   # Seconds between sweeps for idle sessions
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+class GameServer:
+    def __init__(self, engine=None):
+        self.engine = engine or GameEngine()
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self._session_locks = {}  # Queue a session's requests here instead of on worker threads
+
+    def session_lock(self, session_id):
+        return self._session_locks.setdefault(session_id, asyncio.Lock())
+
+    async def evict_idle(self):
+        """
+        Unloads idle sessions from the engine and drops their request locks.
+        """
+        for session_id in await self.run_blocking(self.engine.evict_idle):
+            lock = self._session_locks.get(session_id)
+            if lock is not None and not lock.locked():
+                del self._session_locks[session_id]
+
+    async def evict_forever(self):
+        while True:
+            await asyncio.sleep(EVICT_INTERVAL)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                print(f"Eviction Error: {e}")
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # --- HTTP PLUMBING ---
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = min(int(headers.get("content-length", 0) or 0), MAX_BODY)
+            body = json.loads(await reader.readexactly(length)) if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("Request body must be a JSON object.")
+            path, _, query = target.partition("?")
+            await self.route(writer, method, path.strip("/").split("/"), query, body)
+        except ConnectionError:
+            pass  # Client went away; a started turn still finishes and saves
+        except (ValueError, json.JSONDecodeError) as e:
+            await self.respond(writer, 400, {"error": str(e)})
+        except Exception as e:
+            print(f"Server Error: {e}")
+            await self.respond(writer, 500, {"error": str(e)})
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def send_event(self, writer, payload):
+        # One NDJSON line per chunked-transfer chunk
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+    async def respond_file(self, writer, path, content_type):
+        with open(path, "rb") as f:
+            await self.respond_bytes(writer, f.read(), content_type)
+
+    async def respond_bytes(self, writer, data, content_type):
+        writer.write(
+            f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    # --- ROUTES ---
+    async def route(self, writer, method, parts, query, body):
+        if parts == ["metrics"] and method == "GET":
+            return await self.respond_bytes(writer, prometheus_text().encode("utf-8"), "text/plain; version=0.0.4")
+        if parts == ["traces"] and method == "GET":
+            lines = "".join(json.dumps(s) + "\n" for s in recent_spans(RECENT_SPANS))
+            return await self.respond_bytes(writer, lines.encode("utf-8"), "application/x-ndjson")
+        if len(parts) == 2 and parts[0] == "audio" and method == "GET":
+            clip = audio_path(parts[1]) if parts[1].isalnum() else None
+            if not clip:
+                return await self.respond(writer, 404, {"error": "Audio not ready."})
+            return await self.respond_file(writer, clip, "audio/mpeg")
+        if len(parts) != 3 or parts[0] != "sessions":
+            return await self.respond(writer, 404, {"error": "Unknown route."})
+        session_id, action = parts[1], parts[2]
+
+        if action == "state" and method == "GET":
+            state = await self.run_blocking(self.engine.get_state, session_id, False)
+            if state is None:
+                return await self.respond(writer, 404, {"error": "No such session."})
+            return await self.respond(writer, 200, state)
+        if method != "POST":
+            return await self.respond(writer, 405, {"error": "Use POST."})
+        if action not in ("turn", "scenario", "reset"):
+            return await self.respond(writer, 404, {"error": "Unknown route."})
+
+        async with self.session_lock(session_id):
+            if action == "turn":
+                if "stream=1" in query.split("&"):
+                    return await self.stream_turn(writer, session_id, body.get("action", ""), body.get("mode"))
+                result = await self.run_blocking(self.engine.process_turn, session_id, body.get("action", ""), body.get("mode"))
+                return await self.respond(writer, 200, result)
+            if action == "scenario":
+                intro = await self.run_blocking(self.engine.start_scenario, session_id, body.get("prompt", ""))
+                return await self.respond(writer, 200 if intro else 500, {"intro_text": intro})
+            if action == "reset":
+                state = await self.run_blocking(self.engine.reset, session_id)
+                return await self.respond(writer, 200, state)
+
+    async def stream_turn(self, writer, session_id, action, mode=None):
+        """
+        Streams narration chunks, an {"audio": key} event as each sentence's
+        clip becomes playable (fetch it from /audio/<key>), and the result.
+        The stream ends once the last sentence has been voiced.
+        """
+        turn = await self.run_blocking(self.engine.start_turn, session_id, action, mode)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+        )
+        send_lock = asyncio.Lock()
+
+        async def send(payload):
+            async with send_lock:
+                await self.send_event(writer, payload)
+
+        async def relay(events, event):
+            while True:
+                item = await self.run_blocking(next, events, None)
+                if item is None:
+                    return
+                await send({event: item})
+
+        audio = asyncio.create_task(relay(turn.stream_audio(), "audio"))
+        try:
+            await relay(turn.stream_narration(), "chunk")
+            try:
+                result = await self.run_blocking(turn.result)
+                await send({"result": result})
+            except Exception as e:
+                await send({"error": str(e)})
+            await audio
+        finally:
+            audio.cancel()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+async def serve(host, port):
+    server = GameServer()
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Dungeon Master listening on http://{host}:{port}")
+    sweeper = asyncio.create_task(server.evict_forever())  # Held so the task is not garbage-collected
+    async with listener:
+        await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the game engine over HTTP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+if __name__ == "__main__":
+    main()
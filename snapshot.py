@@ -0,0 +1,276 @@
+"""
+Compact, versioned binary snapshots of a world state.
+
+    header   magic "DSNP", format version, schema version, codec, flags, section count
+    index    per section: name, offset, stored length, raw length, compressed?
+    keys     the interned-key table (its own section)
+    data     one blob per top-level key of the state ("player", "locations", ...)
+
+Each section is encoded with msgpack when it is installed (JSON otherwise)
+and zlib-compressed. Sections are decoded only when read, so a reader can
+pull 'locations' without touching a long journal.
+
+With SNAPSHOT_INTERN=on, dict keys that repeat across the world ("name",
+"description", "exits", ...) are also replaced by one-character codes listed
+in the key table. It is off by default: zlib already folds the repeats (the
+file shrinks ~1%), both decoders already share key strings, and mapping the
+codes back costs a Python call per object, roughly doubling load time.
+
+    write_snapshot("save.snap", state)
+    state = read_snapshot("save.snap")                      # everything
+    reader = SnapshotReader("save.snap"); reader["npcs"]    # one section
+    export_json("save.snap", "save.json")                   # for debugging
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+from collections import Counter
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = b"DSNP"
+FORMAT_VERSION = 1  # Layout of the file itself
+SCHEMA_VERSION = 1  # Shape of the world state inside it; bump with a @migration
+CODECS = {"json": 0, "msgpack": 1}
+CODEC = os.getenv("SNAPSHOT_CODEC", "msgpack" if msgpack else "json")
+COMPRESS_LEVEL = 6
+MIN_COMPRESS = 128  # Bytes; smaller sections are stored as they are
+INTERN_KEYS = os.getenv("SNAPSHOT_INTERN", "off") == "on"
+INTERN_MIN_USES = 2
+KEY_BASE = 0xE000   # Key codes are Unicode private-use characters
+KEYS_SECTION = "\0keys"
+FLAG_INTERNED = 1
+
+HEADER = struct.Struct("<4sHHBBH")  # magic, format, schema, codec, flags, sections
+ENTRY = struct.Struct("<QIIB")      # offset, stored length, raw length, compressed
+
+class SnapshotError(ValueError):
+    """
+    The file is not a snapshot this code can read.
+    """
+
+# --- MIGRATIONS ---
+MIGRATIONS = {}  # schema version -> fn(state) returning the state at version + 1
+
+def migration(from_version):
+    """
+    Registers an upgrade from one schema version to the next:
+
+        @migration(1)
+        def _add_factions(state):
+            state.setdefault("factions", {})
+            return state
+    """
+    def register(fn):
+        MIGRATIONS[from_version] = fn
+        return fn
+    return register
+
+def migrate(state, version):
+    while version < SCHEMA_VERSION:
+        if version not in MIGRATIONS:
+            raise SnapshotError(f"No migration from schema version {version}")
+        state = MIGRATIONS[version](state)
+        version += 1
+    return state
+
+# --- KEY INTERNING ---
+def _count_keys(obj, counts):
+    if isinstance(obj, dict):
+        counts.update(obj.keys())
+        for value in obj.values():
+            _count_keys(value, counts)
+    elif isinstance(obj, list):
+        for value in obj:
+            _count_keys(value, counts)
+
+def build_key_table(state):
+    """
+    Keys used at least INTERN_MIN_USES times, most used first. Empty if the
+    state already has a key that could be mistaken for a code.
+    """
+    counts = Counter()
+    _count_keys(state, counts)
+    if any(len(k) == 1 and ord(k) >= KEY_BASE for k in counts):
+        return []
+    return [k for k, n in counts.most_common() if n >= INTERN_MIN_USES and len(k) > 1]
+
+def _encode_keys(obj, codes):
+    if isinstance(obj, dict):
+        return {codes.get(k, k): _encode_keys(v, codes) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_encode_keys(v, codes) for v in obj]
+    return obj
+
+def _pairs_hook(table):
+    """
+    Decoder hook turning codes back into (interned) keys as each object is built.
+    """
+    def hook(pairs):
+        return {table.get(k, k): v for k, v in pairs}
+    return hook
+
+# --- CODECS ---
+def _encode(value, codec):
+    if codec == "msgpack":
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+def _decode(blob, codec, hook=None):
+    if codec == "msgpack":
+        if msgpack is None:
+            raise SnapshotError("This snapshot needs msgpack (pip install msgpack)")
+        return msgpack.unpackb(blob, raw=False, strict_map_key=False, object_pairs_hook=hook)
+    return json.loads(blob.decode("utf-8"), object_pairs_hook=hook)
+
+# --- WRITING ---
+def dumps(state, codec=None, intern_keys=None):
+    """
+    The snapshot of a state as bytes.
+    """
+    codec = codec or CODEC
+    if codec not in CODECS:
+        raise SnapshotError(f"Unknown codec '{codec}'")
+    if codec == "msgpack" and msgpack is None:
+        codec = "json"
+    table = build_key_table(state) if (INTERN_KEYS if intern_keys is None else intern_keys) else []
+    codes = {k: chr(KEY_BASE + i) for i, k in enumerate(table)}
+
+    sections = [(KEYS_SECTION, table)] + [(name, _encode_keys(value, codes)) for name, value in state.items()]
+    index, blobs, offset = [], [], 0
+    for name, value in sections:
+        raw = _encode(value, codec)
+        packed = zlib.compress(raw, COMPRESS_LEVEL) if len(raw) >= MIN_COMPRESS else raw
+        compressed = len(packed) < len(raw)
+        blob = packed if compressed else raw
+        index.append((name.encode("utf-8"), offset, len(blob), len(raw), compressed))
+        blobs.append(blob)
+        offset += len(blob)
+
+    flags = FLAG_INTERNED if table else 0
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, SCHEMA_VERSION, CODECS[codec], flags, len(index))
+    entries = b"".join(struct.pack("<H", len(name)) + name + ENTRY.pack(off, size, raw, comp)
+                       for name, off, size, raw, comp in index)
+    return header + entries + b"".join(blobs)
+
+def write_snapshot(path, state, codec=None, intern_keys=None):
+    """
+    Writes the snapshot atomically. Returns its size in bytes.
+    """
+    data = dumps(state, codec, intern_keys)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(data)
+
+# --- READING ---
+def is_snapshot(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+class SnapshotReader:
+    """
+    Reads the header and section index up front and each section only when
+    it is asked for, then caches it. Outdated schema versions are migrated,
+    which needs the whole state, so those are decoded on open.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = f.read()
+        if len(self._data) < HEADER.size or self._data[:len(MAGIC)] != MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot")
+        _, self.format_version, self.schema_version, codec_id, self.flags, count = HEADER.unpack_from(self._data)
+        if self.format_version > FORMAT_VERSION:
+            raise SnapshotError(f"Snapshot format {self.format_version} is newer than this reader")
+        self.codec = next(name for name, cid in CODECS.items() if cid == codec_id)
+
+        self._index = {}
+        pos = HEADER.size
+        for _ in range(count):
+            (name_len,) = struct.unpack_from("<H", self._data, pos)
+            name = self._data[pos + 2:pos + 2 + name_len].decode("utf-8")
+            pos += 2 + name_len
+            self._index[name] = ENTRY.unpack_from(self._data, pos)
+            pos += ENTRY.size
+        self._base = pos
+        self._cache = {}
+        self._migrated = False
+
+        table = [sys.intern(k) for k in self._section(KEYS_SECTION)] if self.flags & FLAG_INTERNED else []
+        self._hook = _pairs_hook({chr(KEY_BASE + i): k for i, k in enumerate(table)}) if table else None
+        if self.schema_version < SCHEMA_VERSION:
+            self._cache = migrate(self._load_sections(self.sections), self.schema_version)
+            self._migrated = True
+
+    def _section(self, name, hook=None):
+        offset, size, raw_len, compressed = self._index[name]
+        blob = self._data[self._base + offset:self._base + offset + size]
+        if compressed:
+            blob = zlib.decompress(blob, bufsize=raw_len)
+        return _decode(blob, self.codec, hook)
+
+    def _load_sections(self, names):
+        return {name: self._section(name, self._hook) for name in names}
+
+    @property
+    def sections(self):
+        if self._migrated:
+            return list(self._cache)
+        return [name for name in self._index if name != KEYS_SECTION]
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            if name not in self:
+                raise KeyError(name)
+            self._cache[name] = self._section(name, self._hook)
+        return self._cache[name]
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def load(self, sections=None):
+        """
+        The state as a dict: every section, or only the ones named.
+        """
+        return {name: self[name] for name in (self.sections if sections is None else sections) if name in self}
+
+def read_snapshot(path, sections=None):
+    return SnapshotReader(path).load(sections)
+
+def export_json(path, json_path=None):
+    """
+    The snapshot as indented JSON, written to json_path if given.
+    """
+    text = json.dumps(read_snapshot(path), indent=4)
+    if json_path:
+        with open(json_path, "w") as f:
+            f.write(text)
+    return text
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert between JSON saves and snapshots.")
+    parser.add_argument("command", choices=["export", "import"], help="export: snapshot -> JSON; import: JSON -> snapshot")
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args()
+    if args.command == "export":
+        export_json(args.source, args.target)
+    else:
+        with open(args.source) as f:
+            print(f"{write_snapshot(args.target, json.load(f))} bytes written")
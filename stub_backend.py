@@ -0,0 +1,201 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+
+NAMES = ["Mira", "Osric", "Tobin", "Vess", "Halloran", "Ysolde", "Brannoc", "Quill"]
+PLACES = ["Sunken Archive", "Ash Market", "Lantern Gate", "Hollow Stair", "Glass Orchard", "Iron Ferry"]
+THINGS = ["Brass Key", "Lantern", "Coil of Rope", "Sealed Letter", "Bone Flute", "Silver Coin"]
+EMBED_DIM = 256
+
+class StubUsage:
+    def __init__(self, prompt, text, cached=0):
+        self.prompt_token_count = len(prompt) // 4 + 1
+        self.candidates_token_count = len(text) // 4 + 1
+        self.cached_content_token_count = cached // 4
+
+class StubResponse:
+    def __init__(self, prompt, text, cached=0):
+        self.text = text
+        self.usage_metadata = StubUsage(prompt, text, cached)
+
+def _between(prompt, pattern, default=""):
+    match = re.search(pattern, prompt)
+    return match.group(1).strip() if match else default
+
+def _slug(name):
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+class StubBackend:
+    """
+    Offline stand-in for Gemini. Answers each agent with deterministic,
+    schema-valid output derived from a hash of the prompt, after sleeping
+    'latency' seconds to imitate a network round-trip. 'malformed_rate'
+    makes that share of JSON replies arrive fenced and with a trailing comma.
+
+    Usage numbers imitate implicit prefix caching: whatever an agent's input
+    (system instruction, then prompt) shares with its previous input is
+    reported as cached, and a cached prefix is not paid for in latency.
+    """
+    name = "stub"
+
+    def __init__(self, latency=0.0, malformed_rate=0.0):
+        self.latency = latency
+        self.malformed_rate = malformed_rate  # Share of JSON replies sent back the way models fumble them
+        self._last_input = {}  # agent -> last system instruction + prompt
+
+    def _cached_prefix(self, agent, full):
+        previous = self._last_input.get(agent, "")
+        self._last_input[agent] = full
+        return len(os.path.commonprefix([previous, full]))
+
+    def generate_content(self, agent, prompt, generation_config=None, model_name=None, stream=False, system_instruction=None):
+        full = f"{system_instruction}\n{prompt}" if system_instruction else prompt
+        cached = self._cached_prefix(agent, full)
+        if self.latency:
+            time.sleep(self.latency * (1 - 0.5 * cached / len(full)))
+        rng = random.Random(hashlib.sha1(prompt.encode("utf-8")).hexdigest())
+        handler = getattr(self, f"_{agent}", None)
+        text = handler(prompt, rng) if handler else "{}"
+        if self.malformed_rate and text[:1] in "{[" and random.Random(prompt + "#").random() < self.malformed_rate:
+            text = f"```json\n{text[:-1]},{text[-1]}\n```"  # Code fence plus a trailing comma
+        if not stream:
+            return StubResponse(full, text, cached)
+        # Word-sized chunks, the last one carrying the usage numbers
+        words = text.split(" ")
+        chunks = [StubResponse("", w + " ") for w in words[:-1]] + [StubResponse(full, words[-1], cached)]
+        return iter(chunks)
+
+    def embed_content(self, texts, task_type="retrieval_document"):
+        """
+        Feature-hashed bag of words: texts sharing words land close together,
+        which is all the retrieval code needs offline.
+        """
+        vectors = []
+        for text in texts:
+            vector = [0.0] * EMBED_DIM
+            for word in re.findall(r"[a-z0-9']+", text.lower()):
+                h = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16)
+                vector[h % EMBED_DIM] += 1.0 if (h >> 8) & 1 else -1.0
+            vectors.append(vector)
+        return vectors
+
+    def embedding_model(self):
+        return f"stub-hash-{EMBED_DIM}"
+
+    # --- AGENTS ---
+    def _archivist(self, prompt, rng):
+        action = _between(prompt, r'PLAYER ACTION: "(.*)"')
+        target = _between(action, r"(?i)^(?:go to|enter|walk to|travel to)\s+(?:the\s+)?(.+)", None)
+        if target:
+            return json.dumps({"error": "target_missing", "target_name": target.title()})
+        return json.dumps({
+            "narrative_cue": f"You {action.lower().removeprefix('i ')}. It works, mostly.",
+            "npc_updates": {},
+            "location_updates": {},
+            "item_updates": {}
+        })
+
+    def _adjudicator(self, prompt, rng):
+        ruling = json.loads(self._archivist(prompt, rng))
+        if "error" in ruling:
+            return json.dumps(ruling)
+        return json.dumps(dict(ruling, **json.loads(self._director(prompt, rng))))
+
+    def _director(self, prompt, rng):
+        return json.dumps({
+            "current_objective": f"Find the {rng.choice(THINGS)}",
+            "narrative_direction": rng.choice(["Reveal a hidden detail.", "Raise the stakes.", "Resolve the action."]),
+            "global_tension": rng.randint(1, 10),
+            "world_events": []
+        })
+
+    def _narrator(self, prompt, rng):
+        name, place = rng.choice(NAMES), rng.choice(PLACES)
+        return (
+            f"Dust drifts through the air as the moment settles. "
+            f"{name} watches you from the far side of the room, saying nothing. "
+            f"Somewhere beyond, the {place} waits. "
+            f"You could follow the draught, or ask {name} what they saw."
+        )
+
+    def _scribe(self, prompt, rng):
+        topic = f"{rng.choice(PLACES)} Rumour {rng.randint(1, 999)}"
+        return json.dumps({
+            "new_items": [rng.choice(THINGS)] if rng.random() < 0.3 else [],
+            "new_npcs": [{"name": rng.choice(NAMES), "description": "A watcher.", "presence": "physical"}],
+            "new_locations": [{"name": rng.choice(PLACES), "description": "Glimpsed in the distance."}],
+            "new_lore": [{"topic": topic, "entry": "It is said the old paths shift at night."}]
+        })
+
+    def _creator(self, prompt, rng):
+        target = _between(prompt, r"interact with '(.*)'", "The Surrounding Area")
+        return json.dumps({
+            "type": "location",
+            "id": f"gen_{_slug(target)}",
+            "item_name": "",
+            "data": {
+                "name": target,
+                "description": f"{target} is quiet, and older than it looks.",
+                "exits": [],
+                "suggested_exits": ["a narrow stair going down", "a door banded with iron"]
+            },
+            "narrative_cue": f"You step into {target}. The air is still."
+        })
+
+    def _forger(self, prompt, rng):
+        exits = json.loads(_between(prompt, r"EXITS: (\[.*\])", "[]"))
+        locations = []
+        for exit_name in exits:
+            name = re.sub(r"^(?:a|an|the)\s+", "", exit_name, flags=re.I).title()
+            locations.append({
+                "exit": exit_name,
+                "id": f"gen_{_slug(name)}",
+                "data": {
+                    "name": name,
+                    "description": f"{name} lies beyond {exit_name}, quiet and watchful.",
+                    "exits": [],
+                    "suggested_exits": rng.sample(["a crumbling archway", "a rope bridge", "a low tunnel", "a spiral stair"], 2)
+                },
+                "narrative_cue": f"You make your way through {exit_name} into {name}.",
+                "npcs": [{"name": rng.choice(NAMES), "description": "Keeps to the shadows.", "attitude": "wary"}] if rng.random() < 0.5 else []
+            })
+        return json.dumps({"locations": locations})
+
+    def _architect(self, prompt, rng):
+        return json.dumps({
+            "genre": "stub fantasy",
+            "location": {
+                "name": "Crossroads Inn",
+                "description": "A smoky common room at the meeting of four roads.",
+                "exits": [],
+                "suggested_exits": ["the front door", "a creaking staircase"]
+            },
+            "player": {
+                "name": rng.choice(NAMES),
+                "inventory": [{"name": t, "description": "Standard kit.", "state": "default"} for t in THINGS[:3]]
+            },
+            "intro_text": "Rain hammers the shutters of the Crossroads Inn as your story begins."
+        })
+
+    def _dreamer(self, prompt, rng):
+        return json.dumps([
+            {
+                "type": "npc",
+                "id": f"dream_{_slug(name)}",
+                "data": {"name": name, "description": "Someone waiting to be met.", "attitude": "neutral"},
+                "keywords": [name.lower()]
+            }
+            for name in rng.sample(NAMES, 2)
+        ])
+
+    def _chronicler(self, prompt, rng):
+        return f"You wandered between the {rng.choice(PLACES)} and the {rng.choice(PLACES)}, and {rng.choice(NAMES)} took note."
+
+    def _muse(self, prompt, rng):
+        return "A lamplighter who keeps a city of ghosts from forgetting itself."
+
+    def _illustrator(self, prompt, rng):
+        return "dim tavern, candlelight, oil painting, heavy shadows, dark fantasy"
@@ -1,4 +1,4 @@
-from utils import load_game, save_game, get_formatted_state
+from utils import load_game, save_game
 
 def main():
     # 1. Load the initial state
@@ -1,4 +1,4 @@
-from utils import load_game
+from utils import load_game, save_game
 from archivist import get_archivist_response, update_world_state
 
 def main():
@@ -20,7 +20,8 @@ def main():
     print(updates)
     
     # 4. Apply Updates
-    new_state = update_world_state(updates)
+    new_state = update_world_state(state, updates)
+    save_game(new_state)
     
     print("\n--- Resulting World State ---")
     print(f"Barkeep Status: {new_state['npcs']['barkeep']['status']}")
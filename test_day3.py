@@ -18,7 +18,7 @@ def main():
     log_msg = updates.get("narrative_cue", "Something happened.")
     
     # 3. Update State
-    new_state = update_world_state(updates)
+    new_state = update_world_state(state, updates)
     
     # 4. Narrator (Story)
     print("... Narrator is writing ...")
@@ -0,0 +1,10 @@
+from pipeline import discovery_cue
+
+def test_discovery_cue_for_each_kind():
+    assert discovery_cue({"type": "location"}, {"name": "The Vault", "description": "Cold stone."}) == "You arrive at The Vault. Cold stone."
+    assert discovery_cue({"type": "npc"}, {"name": "Mira"}) == "You come upon Mira."
+    assert discovery_cue({"type": "item", "item_name": "Brass Key"}, {}) == "You found a Brass Key."
+
+def test_discovery_cue_without_item_name():
+    assert discovery_cue({"type": "item"}, {"name": "Silver Locket"}) == "You found a Silver Locket."
+    assert discovery_cue({"type": "lore"}, {}) == "You find something new."
@@ -0,0 +1,30 @@
+import pytest
+from schemas import repair_json, parse_reply, SchemaError, ScribeOutput
+
+def test_clean_json_is_not_repaired():
+    assert repair_json('{"a": 1}') == ({"a": 1}, False)
+
+@pytest.mark.parametrize("reply", [
+    '```json\n{"a": 1, "b": [true]}\n```',
+    'Sure! Here it is: {"a": 1, "b": [true]} Hope that helps.',
+    '{"a": 1, "b": [true,],}',
+    '{“a”: 1, “b”: [true]}',
+    '{"a": 1, "b": [True]}',
+])
+def test_usual_slips_are_repaired(reply):
+    assert repair_json(reply) == ({"a": 1, "b": [True]}, True)
+
+def test_python_literals_inside_strings_are_left_alone():
+    value, _ = repair_json('{"note": "True story", "ok": None}')
+    assert value == {"note": "True story", "ok": None}
+
+@pytest.mark.parametrize("reply", ["", None, "no json here", '{"a": '])
+def test_hopeless_replies_raise(reply):
+    with pytest.raises(SchemaError):
+        repair_json(reply)
+
+def test_parse_reply_fills_schema_defaults():
+    parsed, repaired = parse_reply('{"new_items": ["Lamp"]}', ScribeOutput)
+    assert not repaired
+    assert parsed["new_items"] == ["Lamp"]
+    assert parsed["new_npcs"] == [] and parsed["new_lore"] == []
@@ -0,0 +1,56 @@
+import copy
+import pytest
+from utils import DEFAULT_STATE
+from scribe import extract_entities_locally, CONFIDENCE_THRESHOLD
+
+def new_state():
+    return copy.deepcopy(DEFAULT_STATE)
+
+@pytest.mark.parametrize("story", [
+    "You take the stairs down into the dark.",
+    "You find a way out, squeezing between the rocks.",
+    "You receive a warning from the wind.",
+])
+def test_acquired_phrase_is_not_an_item_unless_expected(story):
+    found, confidence, _ = extract_entities_locally(story, new_state())
+    assert found["new_items"] == []
+    # Unresolved, so the LLM pass gets to read it
+    assert confidence < CONFIDENCE_THRESHOLD
+
+def test_acquired_item_the_archivist_granted_is_kept():
+    found, confidence, _ = extract_entities_locally(
+        "You pick up the brass key, cold in your palm.", new_state(), ["Brass Key"])
+    assert found["new_items"] == ["Brass Key"]
+    assert confidence == 1.0
+
+def test_acquired_item_that_was_dreamed_is_kept():
+    state = new_state()
+    state["shadow_queue"] = [{"type": "item", "item_name": "Silver Locket", "data": {"name": "Silver Locket"}}]
+    found, _, _ = extract_entities_locally("You find a silver locket, tarnished.", state)
+    assert found["new_items"] == ["Silver Locket"]
+
+def test_plain_scene_stays_local():
+    found, confidence, lore = extract_entities_locally("You walk on. The wind is cold.", new_state())
+    assert found == {"new_items": [], "new_npcs": [], "new_locations": [], "new_lore": []}
+    assert confidence == 1.0 and not lore
+
+def _forged(origin, npc_name):
+    return {"exit": "North Gate", "origin": origin, "data": {"name": "North Gate"}, "npcs": [{"name": npc_name}]}
+
+def test_npc_forged_next_door_is_present():
+    state = new_state()
+    state["pending_world"] = {"loc_start:north gate": _forged("loc_start", "Old Garrick")}
+    found, confidence, _ = extract_entities_locally("Old Garrick waves you over.", state)
+    assert found["new_npcs"] == [{"name": "Old Garrick", "description": "Old Garrick waves you over.", "presence": "physical"}]
+    assert confidence == 1.0
+
+@pytest.mark.parametrize("source", ["elsewhere", "dream"])
+def test_other_known_npcs_leave_presence_to_the_llm(source):
+    state = new_state()
+    if source == "elsewhere":
+        state["pending_world"] = {"loc_far:north gate": _forged("loc_far", "Old Garrick")}
+    else:
+        state["shadow_queue"] = [{"type": "npc", "data": {"name": "Old Garrick"}}]
+    found, confidence, _ = extract_entities_locally("They still speak of Old Garrick.", state)
+    assert found["new_npcs"] == [{"name": "Old Garrick", "description": "They still speak of Old Garrick."}]
+    assert confidence < CONFIDENCE_THRESHOLD
@@ -0,0 +1,65 @@
+import copy
+import json
+import pytest
+import snapshot
+from utils import DEFAULT_STATE
+
+STATE = dict(copy.deepcopy(DEFAULT_STATE), npcs={
+    "npc_a": {"name": "Mira", "location_id": "loc_start", "status": "alive"},
+    "npc_b": {"name": "Oswin", "location_id": "loc_start", "status": "dead"},
+})
+
+CODECS = ["json"] + (["msgpack"] if snapshot.msgpack else [])
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("intern", [False, True])
+def test_round_trip(tmp_path, codec, intern):
+    path = str(tmp_path / "save.snap")
+    snapshot.write_snapshot(path, STATE, codec, intern)
+    assert snapshot.is_snapshot(path)
+    assert snapshot.read_snapshot(path) == STATE
+
+def test_sections_are_read_on_their_own(tmp_path):
+    path = str(tmp_path / "save.snap")
+    snapshot.write_snapshot(path, STATE)
+    reader = snapshot.SnapshotReader(path)
+    assert set(reader.sections) == set(STATE)
+    assert reader["npcs"] == STATE["npcs"]
+    assert list(reader._cache) == ["npcs"]
+    assert reader.load(["player"]) == {"player": STATE["player"]}
+    with pytest.raises(KeyError):
+        reader["missing"]
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / "save.json"
+    path.write_text(json.dumps(STATE))
+    assert not snapshot.is_snapshot(str(path))
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.SnapshotReader(str(path))
+
+def test_newer_format_is_refused(tmp_path):
+    path = tmp_path / "save.snap"
+    data = bytearray(snapshot.dumps(STATE))
+    data[4:6] = (snapshot.FORMAT_VERSION + 1).to_bytes(2, "little")
+    path.write_bytes(bytes(data))
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.SnapshotReader(str(path))
+
+def test_older_schema_is_migrated(tmp_path, monkeypatch):
+    path = str(tmp_path / "save.snap")
+    snapshot.write_snapshot(path, STATE)
+    monkeypatch.setattr(snapshot, "SCHEMA_VERSION", snapshot.SCHEMA_VERSION + 1)
+    monkeypatch.setattr(snapshot, "MIGRATIONS", {})
+
+    @snapshot.migration(snapshot.SCHEMA_VERSION - 1)
+    def add_factions(state):
+        state["factions"] = {}
+        return state
+
+    assert snapshot.read_snapshot(path) == dict(STATE, factions={})
+
+def test_export_json(tmp_path):
+    path = str(tmp_path / "save.snap")
+    snapshot.write_snapshot(path, STATE)
+    assert json.loads(snapshot.export_json(path, str(tmp_path / "out.json"))) == STATE
+    assert json.loads((tmp_path / "out.json").read_text()) == STATE
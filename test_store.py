@@ -0,0 +1,81 @@
+import copy
+import json
+import os
+from utils import StateStore, DEFAULT_STATE, GENERATION_KEY, COMPACT_EVERY
+
+def new_state():
+    return copy.deepcopy(DEFAULT_STATE)
+
+def write_snapshot(path, state, generation):
+    with open(path, "w") as f:
+        json.dump(dict(state, **{GENERATION_KEY: generation}), f)
+
+def test_round_trip_through_the_log(tmp_path):
+    path = str(tmp_path / "save.json")
+    store = StateStore(path)
+    state = new_state()
+    store.save(state)  # First save writes the snapshot
+    state["player"]["hp"] = 7
+    state["player"]["journal"].append({"topic": "Gate", "entry": "It opens at dusk."})
+    del state["npcs"]
+    store.save(state)
+
+    loaded = StateStore(path).load()
+    assert loaded == state
+    assert GENERATION_KEY not in loaded
+
+def test_new_log_starts_with_a_generation_header(tmp_path):
+    path = str(tmp_path / "save.json")
+    write_snapshot(path, new_state(), 3)
+    store = StateStore(path)
+    state = store.load()
+    state["player"]["hp"] = 4
+    store.save(state)
+
+    with open(f"{path}.log") as f:
+        assert json.loads(f.readline()) == {GENERATION_KEY: 3}
+    assert StateStore(path).load()["player"]["hp"] == 4
+
+def test_stale_log_is_not_replayed_after_a_crash(tmp_path):
+    path = str(tmp_path / "save.json")
+    store = StateStore(path)
+    state = new_state()
+    store.save(state)
+    state["player"]["hp"] = 5
+    store.save(state)
+    # Compaction wrote a newer snapshot, then crashed before resetting the log
+    state["player"]["hp"] = 9
+    write_snapshot(path, state, store._generation + 1)
+
+    reloaded = StateStore(path)
+    assert reloaded.load()["player"]["hp"] == 9
+    assert reloaded._log_entries == COMPACT_EVERY  # Both get rewritten on the next save
+
+def test_headerless_log_is_not_replayed_over_a_later_generation(tmp_path):
+    path = str(tmp_path / "save.json")
+    state = new_state()
+    state["player"]["hp"] = 9
+    write_snapshot(path, state, 1)
+    with open(f"{path}.log", "w") as f:
+        f.write(json.dumps({"set": [[["player", "hp"], 5]]}) + "\n")
+    assert StateStore(path).load()["player"]["hp"] == 9
+
+def test_headerless_log_from_before_generations_still_replays(tmp_path):
+    path = str(tmp_path / "save.json")
+    with open(path, "w") as f:
+        json.dump(new_state(), f)
+    with open(f"{path}.log", "w") as f:
+        f.write(json.dumps({"set": [[["player", "hp"], 5]]}) + "\n")
+    assert StateStore(path).load()["player"]["hp"] == 5
+
+def test_torn_tail_is_ignored(tmp_path):
+    path = str(tmp_path / "save.json")
+    store = StateStore(path)
+    state = new_state()
+    store.save(state)
+    state["player"]["hp"] = 6
+    store.save(state)
+    with open(f"{path}.log", "a") as f:
+        f.write('{"set": [[["player", "hp"], 1')
+    assert StateStore(path).load()["player"]["hp"] == 6
+    assert not os.path.exists(f"{path}.tmp")
@@ -0,0 +1,51 @@
+import copy
+from utils import DEFAULT_STATE
+from world import WorldState
+from archivist import update_world_state
+
+def new_world():
+    world = WorldState(copy.deepcopy(DEFAULT_STATE))
+    world.add_npc("npc_mira", {"name": "Mira", "location_id": "loc_start"})
+    return world
+
+def test_update_npc_moves_and_renames():
+    world = new_world()
+    assert world.find("npc", "mira").id == "npc_mira"
+    world.update_npc("npc_mira", {"name": "Mira the Bold", "location_id": "loc_hall"})
+    assert world.find("npc", "Mira") is None
+    assert world.find("npc", "mira the bold").id == "npc_mira"
+    assert world.npcs_at("loc_start") == {}
+    assert list(world.npcs_at("loc_hall")) == ["npc_mira"]
+
+def test_direct_edit_followed_by_invalidate():
+    world = new_world()
+    world.names("npc")  # Build the indexes
+    world["npcs"]["npc_mira"]["name"] = "Wren"
+    world.invalidate()
+    assert world.find("npc", "wren").id == "npc_mira"
+    assert world.find("npc", "mira") is None
+
+def test_replacing_a_section_marks_indexes_stale():
+    world = new_world()
+    assert world.has_item("Dagger")
+    world["player"] = dict(world["player"], inventory=[{"name": "Lantern"}, {"name": "Rope"}])
+    assert not world.has_item("Dagger")
+    assert world.has_item("lantern")
+
+def test_archivist_swapping_an_inventory_entry_keeps_the_same_size():
+    world = new_world()
+    assert world.has_item("Old Map")
+    update_world_state(world, {"player": {"inventory": [{"name": "Torn Map"}, {"name": "Dagger"}]}})
+    assert not world.has_item("Old Map")
+    assert world.has_item("torn map")
+
+def test_changes_are_reported_once():
+    world = new_world()
+    assert world.take_changes() is None  # A fresh wrapper: anything may have changed
+    world.update_npc("npc_mira", {"mood": "wary"})
+    world.add_journal_entry({"topic": "The Flood", "entry": "The hall was sealed."})
+    update_world_state(world, {"location_updates": {"current": {"description": "Ash and embers."}}})
+    assert world.take_changes() == {("npc", "npc_mira"), ("journal", "The Flood"), ("location", "loc_start")}
+    assert world.take_changes() == set()
+    world.invalidate()
+    assert world.take_changes() is None
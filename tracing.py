@@ -0,0 +1,187 @@
+"""
+Lightweight spans around agent calls, pipeline stages and saves/loads.
+
+    with span("llm.narrator", agent="narrator") as s:
+        ...
+        s.set(prompt_chars=len(prompt), retries=1)
+
+Finished spans are aggregated per name, kept in a bounded ring for the UI,
+and optionally appended to a JSONL file (TRACE_FILE). prometheus_text()
+renders the aggregates in the Prometheus text exposition format.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+
+TRACE_FILE = os.getenv("TRACE_FILE")  # JSONL sink; unset keeps spans in memory only
+RECENT_SPANS = 2000
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNTED = ("prompt_chars", "response_chars", "prompt_tokens", "response_tokens", "cached_tokens", "retries")
+
+_lock = threading.Lock()
+_local = threading.local()
+_recent = deque(maxlen=RECENT_SPANS)
+_stats = {}
+
+class Span:
+    __slots__ = ("name", "parent", "started", "duration", "attrs", "error")
+
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.parent = parent
+        self.started = time.time()
+        self.duration = None
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "name": self.name, "parent": self.parent, "ts": round(self.started, 6),
+            "duration": round(self.duration, 6), "error": self.error, **self.attrs
+        }
+
+class span:
+    """
+    Context manager timing one unit of work. Exceptions are recorded on the
+    span and re-raised.
+    """
+    def __init__(self, name, **attrs):
+        parent = current_span()
+        self.span = Span(name, parent.name if parent else None, attrs)
+
+    def __enter__(self):
+        _local.__dict__.setdefault("stack", []).append(self.span)
+        self._start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration = time.perf_counter() - self._start
+        if exc is not None:
+            self.span.error = type(exc).__name__
+        _local.stack.pop()
+        _finish(self.span)
+        return False
+
+def current_span():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+def record_span(name, duration, error=None, **attrs):
+    """
+    Records an operation that was timed elsewhere (e.g. a streamed call whose
+    start and end don't sit in one 'with' block).
+    """
+    parent = current_span()
+    s = Span(name, parent.name if parent else None, attrs)
+    s.started = time.time() - duration
+    s.duration = duration
+    s.error = error
+    _finish(s)
+
+def _finish(s):
+    with _lock:
+        stats = _stats.setdefault(s.name, {
+            "count": 0, "errors": 0, "seconds": 0.0, "max": 0.0, "cache_hits": 0,
+            "buckets": [0] * len(BUCKETS), **{k: 0 for k in COUNTED}
+        })
+        stats["count"] += 1
+        stats["seconds"] += s.duration
+        stats["max"] = max(stats["max"], s.duration)
+        if s.error:
+            stats["errors"] += 1
+        if s.attrs.get("cache_hit"):
+            stats["cache_hits"] += 1
+        for k in COUNTED:
+            stats[k] += s.attrs.get(k) or 0
+        for i, bound in enumerate(BUCKETS):
+            if s.duration <= bound:
+                stats["buckets"][i] += 1
+        _recent.append(s)
+    if TRACE_FILE:
+        try:
+            with open(TRACE_FILE, "a") as f:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+        except OSError as e:
+            print(f"Trace Error: {e}")
+
+# --- READING ---
+def get_trace_summary():
+    """
+    Per-span aggregates, slowest total first, with the average and p95 of the recent window.
+    """
+    with _lock:
+        recent = {}
+        for s in _recent:
+            recent.setdefault(s.name, []).append(s.duration)
+        summary = {}
+        for name, stats in _stats.items():
+            durations = sorted(recent.get(name, []))
+            p95 = durations[max(0, -(-len(durations) * 95 // 100) - 1)] if durations else 0.0
+            summary[name] = {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "avg": round(stats["seconds"] / stats["count"], 4),
+                "p95": round(p95, 4),
+                "total": round(stats["seconds"], 3),
+                "cache_hits": stats["cache_hits"],
+                **{k: stats[k] for k in COUNTED}
+            }
+    return dict(sorted(summary.items(), key=lambda kv: kv[1]["total"], reverse=True))
+
+def recent_spans(limit=100):
+    with _lock:
+        return [s.to_dict() for s in list(_recent)[-limit:]]
+
+def export_jsonl(path):
+    """
+    Writes the recent span window to a JSONL file. Returns the number written.
+    """
+    spans = recent_spans(RECENT_SPANS)
+    with open(path, "w") as f:
+        for s in spans:
+            f.write(json.dumps(s, default=str) + "\n")
+    return len(spans)
+
+def reset_traces():
+    with _lock:
+        _recent.clear()
+        _stats.clear()
+
+def prometheus_text(prefix="dungeon"):
+    """
+    The aggregates as Prometheus counters and a duration histogram per span.
+    """
+    with _lock:
+        stats = {name: dict(s, buckets=list(s["buckets"])) for name, s in _stats.items()}
+    lines = [
+        f"# HELP {prefix}_span_seconds Wall time of traced operations.",
+        f"# TYPE {prefix}_span_seconds histogram"
+    ]
+    for name, s in sorted(stats.items()):
+        for bound, count in zip(BUCKETS, s["buckets"]):
+            lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+        lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="+Inf"}} {s["count"]}')
+        lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {s["seconds"]:.6f}')
+        lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {s["count"]}')
+    for metric, key, help_text in (
+        ("span_errors_total", "errors", "Traced operations that raised."),
+        ("llm_cache_hits_total", "cache_hits", "LLM calls answered from the response cache."),
+        ("llm_retries_total", "retries", "Retries of transient LLM errors."),
+    ):
+        lines += [f"# HELP {prefix}_{metric} {help_text}", f"# TYPE {prefix}_{metric} counter"]
+        lines += [f'{prefix}_{metric}{{span="{name}"}} {s[key]}' for name, s in sorted(stats.items())]
+    for metric, unit in (("chars", "Characters"), ("tokens", "Tokens")):
+        lines += [f"# HELP {prefix}_llm_{metric}_total {unit} sent to and received from the model.",
+                  f"# TYPE {prefix}_llm_{metric}_total counter"]
+        for name, s in sorted(stats.items()):
+            if s[f"prompt_{metric}"] or s[f"response_{metric}"]:
+                lines.append(f'{prefix}_llm_{metric}_total{{span="{name}",direction="prompt"}} {s[f"prompt_{metric}"]}')
+                lines.append(f'{prefix}_llm_{metric}_total{{span="{name}",direction="response"}} {s[f"response_{metric}"]}')
+                if metric == "tokens" and s["cached_tokens"]:
+                    lines.append(f'{prefix}_llm_tokens_total{{span="{name}",direction="cached"}} {s["cached_tokens"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,309 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+AUDIO_DIR = "audio_cache"
+MAX_CACHE_BYTES = 200 * 1024 * 1024  # Oldest clips are evicted past this
+MAX_NARRATIONS = 1024  # Narrations whose segments and timings are remembered; oldest go first
+TTS_WORKERS = 4
+SEGMENT_WAIT = 30.0  # Seconds to wait for one sentence's clip before giving up on it
+LANG = "en"
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")  # "gtts", "edge" or "none"
+EDGE_VOICE = os.getenv("EDGE_VOICE", "en-GB-RyanNeural")
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+")
+
+def audio_key(text, lang=LANG):
+    return hashlib.sha256(f"{lang}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_END.split(text) if s.strip()]
+
+# --- BACKENDS ---
+def synthesize_gtts(text, path, lang=LANG):
+    from gtts import gTTS
+    gTTS(text=text, lang=lang, slow=False).save(path)
+
+def synthesize_edge(text, path, lang=LANG):
+    import edge_tts
+    # edge-tts is asyncio-native; each worker thread drives its own short-lived loop
+    asyncio.run(edge_tts.Communicate(text, EDGE_VOICE).save(path))
+
+def synthesize_none(text, path, lang=LANG):
+    # Offline runs: an empty clip, so the cache still goes through its motions without the network
+    open(path, "wb").close()
+
+BACKENDS = {"gtts": synthesize_gtts, "edge": synthesize_edge, "none": synthesize_none}
+
+class NarrationAudio:
+    """
+    Feeds a narration into the cache sentence by sentence as it is written,
+    so the first sentence is being synthesized while the rest still streams.
+    ready_segments() hands each sentence's clip out as soon as it is playable.
+    """
+    def __init__(self, cache, lang=LANG):
+        self.cache = cache
+        self.lang = lang
+        self.started_at = time.perf_counter()
+        self.text = ""
+        self._buffer = ""
+        self.segment_keys = []
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _add_segment(self, sentence):
+        key = self.cache.request_segment(sentence, self.lang)
+        with self._cond:
+            self.segment_keys.append(key)
+            self._cond.notify_all()
+
+    def feed(self, chunk):
+        self.text += chunk
+        self._buffer += chunk
+        sentences = SENTENCE_END.split(self._buffer)
+        # The last piece may still be mid-sentence
+        self._buffer = sentences.pop()
+        for sentence in sentences:
+            if sentence.strip():
+                self._add_segment(sentence.strip())
+
+    def finish(self):
+        """
+        Flushes the last sentence and returns the key for the whole narration.
+        """
+        if self._buffer.strip():
+            self._add_segment(self._buffer.strip())
+            self._buffer = ""
+        self.close()
+        return self.cache.assemble(audio_key(self.text, self.lang), self.segment_keys, self.started_at)
+
+    def close(self):
+        """
+        No more sentences are coming; releases ready_segments().
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def ready_segments(self):
+        """
+        Yields segment keys in order, each once its clip is on disk. A clip
+        that fails or takes longer than SEGMENT_WAIT is skipped. Ends after
+        close() (or finish()) once every segment has been handed out.
+        """
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.segment_keys) and not self._closed:
+                    self._cond.wait()
+                if index >= len(self.segment_keys):
+                    return
+                key = self.segment_keys[index]
+            index += 1
+            if self.cache.wait_segment(key):
+                yield key
+
+class AudioCache:
+    """
+    Content-hashed MP3 cache on disk. Narration is split into sentences that
+    are synthesized in parallel on a worker pool; each sentence is playable
+    as soon as it lands, and the full clip is stitched together once all of
+    them have. Identical text is only ever synthesized once. Segment lists
+    and timings are forgotten with their clip, and past MAX_NARRATIONS.
+    """
+    def __init__(self, audio_dir=AUDIO_DIR, max_bytes=MAX_CACHE_BYTES, workers=TTS_WORKERS, backend=TTS_BACKEND):
+        self.audio_dir = audio_dir
+        self.max_bytes = max_bytes
+        self.synthesize = BACKENDS.get(backend, synthesize_gtts)
+        os.makedirs(audio_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._assembler = ThreadPoolExecutor(max_workers=1)  # Waits on segments; kept off the worker pool
+        self._futures = {}    # segment key -> Future
+        self._manifests = OrderedDict()  # narration key -> [segment keys]
+        self._pending = set()
+        self.timings = OrderedDict()     # narration key -> {"first_audio": s, "complete": s}
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.audio_dir, f"{key}.mp3")
+
+    # --- REQUESTS ---
+    def start_narration(self, lang=LANG):
+        return NarrationAudio(self, lang)
+
+    def request(self, text, lang=LANG):
+        """
+        Returns the key for a complete narration, queueing synthesis if needed.
+        """
+        narration = self.start_narration(lang)
+        narration.feed(text)
+        return narration.finish()
+
+    def request_segment(self, text, lang=LANG):
+        key = audio_key(text, lang)
+        path = self.path_for(key)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)  # Recently used; keep it away from eviction
+                return key
+            if key not in self._futures or self._futures[key].done():
+                self._futures[key] = self._pool.submit(self._synthesize, key, text, lang)
+        return key
+
+    def assemble(self, key, segment_keys, started_at):
+        with self._lock:
+            self._manifests[key] = list(segment_keys)
+            self._manifests.move_to_end(key)
+            while len(self._manifests) > MAX_NARRATIONS:
+                self._forget(next(iter(self._manifests)))
+            if os.path.exists(self.path_for(key)):
+                os.utime(self.path_for(key))
+                return key
+            self._pending.add(key)
+            futures = [self._futures[k] for k in segment_keys if k in self._futures]
+        self._assembler.submit(self._assemble, key, segment_keys, futures, started_at)
+        return key
+
+    # --- LOOKUPS ---
+    def get_path(self, key):
+        path = self.path_for(key)
+        return path if os.path.exists(path) else None
+
+    def segment_paths(self, key):
+        """
+        Playable segments in order, stopping at the first one still being made.
+        """
+        paths = []
+        for segment_key in self._manifests.get(key, []):
+            path = self.get_path(segment_key)
+            if not path:
+                break
+            paths.append(path)
+        return paths
+
+    def wait_segment(self, key, timeout=SEGMENT_WAIT):
+        """
+        The clip's path once it has been synthesized, or None if it failed or timed out.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                return None
+        return self.get_path(key)
+
+    def is_pending(self, key):
+        with self._lock:
+            return key in self._pending
+
+    # --- WORKERS ---
+    def _synthesize(self, key, text, lang):
+        path = self.path_for(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            self.synthesize(text, tmp_path, lang)
+            os.replace(tmp_path, path)
+            return time.perf_counter()  # When this clip became playable
+        except Exception as e:
+            print(f"TTS Error: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _assemble(self, key, segment_keys, futures, started_at):
+        try:
+            first = self._futures.get(segment_keys[0]) if segment_keys else None
+            first_ready = first.result() if first else None  # None when it was already cached
+            first_audio = (first_ready - started_at) if first_ready else 0.0
+            wait(futures)
+
+            parts = [self.get_path(k) for k in segment_keys]
+            if not segment_keys or not all(parts):
+                return
+            # MP3 frames are self-delimiting, so clips concatenate into one playable file
+            tmp_path = f"{self.path_for(key)}.tmp"
+            with open(tmp_path, "wb") as out:
+                for part in parts:
+                    with open(part, "rb") as f:
+                        out.write(f.read())
+            os.replace(tmp_path, self.path_for(key))
+            with self._lock:
+                if key in self._manifests:
+                    self.timings[key] = {
+                        "first_audio": round(first_audio, 3),
+                        "complete": round(time.perf_counter() - started_at, 3)
+                    }
+            self._evict()
+        except Exception as e:
+            print(f"TTS Error: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+                for k in segment_keys:
+                    if k in self._futures and self._futures[k].done():
+                        del self._futures[k]
+
+    def _evict(self):
+        clips = []
+        for name in os.listdir(self.audio_dir):
+            if name.endswith(".mp3"):
+                stat = os.stat(os.path.join(self.audio_dir, name))
+                clips.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in clips)
+        for _, size, name in sorted(clips):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.audio_dir, name))
+                total -= size
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self._forget(name[:-len(".mp3")])
+
+    def _forget(self, key):
+        # Called with the lock held; a no-op for segment keys
+        self._manifests.pop(key, None)
+        self.timings.pop(key, None)
+
+_audio_cache = None
+_cache_lock = threading.Lock()
+
+def get_audio_cache():
+    global _audio_cache
+    with _cache_lock:
+        if _audio_cache is None:
+            _audio_cache = AudioCache()
+        return _audio_cache
+
+def set_audio_cache(cache):
+    """
+    Swaps the cache narration is synthesized into (e.g. a "none" backend for offline runs).
+    """
+    global _audio_cache
+    with _cache_lock:
+        _audio_cache = cache
+
+def request_audio(text):
+    return get_audio_cache().request(text)
+
+def start_narration_audio():
+    return get_audio_cache().start_narration()
+
+def audio_path(key):
+    return get_audio_cache().get_path(key)
+
+def audio_segments(key):
+    return get_audio_cache().segment_paths(key)
+
+def audio_timing(key):
+    return get_audio_cache().timings.get(key)
+
+def is_audio_pending(key):
+    return get_audio_cache().is_pending(key)
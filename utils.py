@@ -1,17 +1,249 @@
 import json
 import os
+import threading
+from tracing import span
+from snapshot import write_snapshot, read_snapshot, is_snapshot
 
 STATE_FILE = "world_state.json"
+COMPACT_EVERY = 50  # Patch-log entries to accumulate before folding them into the snapshot
+SPLIT_SECTIONS = ("player", "locations", "npcs")  # Stored per child, so one NPC change writes one NPC
+GENERATION_KEY = "_generation"  # Stamped on snapshots; matched by the log's header line
+SAVE_FORMAT = os.getenv("SAVE_FORMAT", "json")  # "snapshot" compacts to a binary '<save>.snap' (see snapshot.py)
 
-def load_game():
-    if not os.path.exists(STATE_FILE):
-        return None
-    with open(STATE_FILE, 'r') as f:
-        return json.load(f)
+# --- CONSTANTS: DEFAULT STATE ---
+DEFAULT_STATE = {
+  "session_id": "new_game",
+  "player": {
+    "name": "Traveler",
+    "hp": 20,
+    "max_hp": 20,
+    "inventory": [
+        {"name": "Old Map", "description": "A faded, brittle map fragment.", "state": "default"},
+        {"name": "Dagger", "description": "A simple iron blade.", "state": "dull"}
+    ],
+    "journal": [] # NEW: Stores Lore/Clues
+  },
+  "current_location_id": "loc_start",
+  "world_flags": {
+    "game_started": False 
+  },
+  "locations": {
+    "loc_start": {
+      "name": "The Void",
+      "description": "The unformed nothingness before creation.",
+      "exits": []
+    }
+  },
+  "npcs": {},
+  "story_state": {
+    "current_act": 1,
+    "global_tension": 1,
+    "genre": "adaptive",
+    "current_objective": "Establish the setting.",
+    "narrative_direction": "Observe the player's tone to determine the genre."
+  },
+  "world_events": []
+}
 
-def save_game(state_data):
+# --- SUB-DOCUMENTS ---
+def _flatten(state):
+    """
+    Splits the state into {path: value} sub-documents. Split sections get a
+    container entry ({}) plus one entry per child.
+    """
+    docs = {}
+    for key, value in state.items():
+        if key in SPLIT_SECTIONS and isinstance(value, dict):
+            docs[(key,)] = {}
+            for child_key, child in value.items():
+                docs[(key, child_key)] = child
+        else:
+            docs[(key,)] = value
+    return docs
+
+def _fingerprint(value):
+    # Lists are remembered item by item so growth can be logged as an append
+    if isinstance(value, list):
+        return tuple(json.dumps(v, sort_keys=True) for v in value)
+    return json.dumps(value, sort_keys=True)
+
+def _walk(state, path, create=False):
+    node = state
+    for key in path:
+        if key not in node:
+            if not create:
+                return None
+            node[key] = {}
+        node = node[key]
+    return node
+
+def _apply_patch(state, patch):
+    """
+    Replays one log entry. Entries are positional, so they only apply on top
+    of the snapshot generation the log was started for.
+    """
+    for path in patch.get("del", []):
+        parent = _walk(state, path[:-1])
+        if isinstance(parent, dict):
+            parent.pop(path[-1], None)
+    for path, value in patch.get("set", []):
+        _walk(state, path[:-1], create=True)[path[-1]] = value
+    for path, start, items in patch.get("append", []):
+        parent = _walk(state, path[:-1], create=True)
+        current = parent.get(path[-1])
+        if not isinstance(current, list):
+            current = parent[path[-1]] = []
+        del current[start:]
+        current.extend(items)
+
+def write_atomic(path, text):
+    """
+    Writes through a temp file, so readers see the old file or the new one, never half of either.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# --- STORE ---
+class StateStore:
+    """
+    Snapshot + append-only patch log for one save file.
+
+    The snapshot is the plain JSON save, or with SAVE_FORMAT=snapshot a
+    binary '.snap' beside it; loading takes whichever is newer. Each save
+    appends only the changed sub-documents to '<save>.log'; every
+    COMPACT_EVERY entries the log is folded back into a fresh snapshot.
+
+    Snapshot and log both carry a generation number (the '_generation' key
+    and the log's header line, written whenever a log is started). A log
+    older than its snapshot - left behind by a crash between writing the
+    snapshot and truncating the log - is ignored rather than replayed over
+    newer data. A log without a header counts as generation 0.
+    """
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.snapshot_path = f"{os.path.splitext(path)[0]}.snap"
+        self.log_path = f"{path}.log"
+        self.lock = threading.Lock()
+        self._saved = None  # path -> fingerprint of what is on disk
+        self._log_entries = 0
+        self._generation = 0
+
+    def _remember(self, state):
+        self._saved = {path: _fingerprint(value) for path, value in _flatten(state).items()}
+
+    def _read_snapshot(self):
+        has_json = os.path.exists(self.path)
+        if is_snapshot(self.snapshot_path) and (
+                not has_json or os.path.getmtime(self.snapshot_path) >= os.path.getmtime(self.path)):
+            return read_snapshot(self.snapshot_path)
+        if not has_json:
+            return None
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def load(self):
+        with self.lock:
+            state = self._read_snapshot()
+            if state is None:
+                return None
+            self._generation = state.pop(GENERATION_KEY, 0)
+
+            self._log_entries = 0
+            if os.path.exists(self.log_path):
+                log_generation = 0
+                with open(self.log_path, 'r') as f:
+                    for line in f:
+                        try:
+                            patch = json.loads(line)
+                        except json.JSONDecodeError:
+                            break  # Torn tail from an interrupted write
+                        if GENERATION_KEY in patch:
+                            log_generation = patch[GENERATION_KEY]
+                        if log_generation != self._generation:
+                            # Stale log from before the snapshot; rewrite both on the next save
+                            self._log_entries = COMPACT_EVERY
+                            break
+                        if GENERATION_KEY not in patch:
+                            _apply_patch(state, patch)
+                            self._log_entries += 1
+
+            self._remember(state)
+            return state
+
+    def _diff(self, docs):
+        patch = {"set": [], "append": [], "del": []}
+        for path, value in docs.items():
+            new_print = _fingerprint(value)
+            old_print = self._saved.get(path)
+            if new_print == old_print:
+                continue
+            if (isinstance(new_print, tuple) and isinstance(old_print, tuple)
+                    and new_print[:len(old_print)] == old_print):
+                patch["append"].append([list(path), len(old_print), value[len(old_print):]])
+            else:
+                patch["set"].append([list(path), value])
+        # Shallow paths first: a new container must exist before its children
+        patch["set"].sort(key=lambda p: len(p[0]))
+        patch["del"] = sorted((list(p) for p in self._saved if p not in docs), key=len, reverse=True)
+        return {k: v for k, v in patch.items() if v}
+
+    def save(self, state):
+        with self.lock:
+            if self._saved is None or self._log_entries >= COMPACT_EVERY:
+                self._compact(state)
+                return
+
+            patch = self._diff(_flatten(state))
+            if not patch:
+                return
+            fresh = not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0
+            with open(self.log_path, 'a') as f:
+                if fresh:
+                    f.write(json.dumps({GENERATION_KEY: self._generation}) + "\n")
+                f.write(json.dumps(patch) + "\n")
+            self._log_entries += 1
+            self._remember(state)
+
+    def _compact(self, state):
+        generation = self._generation + 1
+        stamped = dict(state, **{GENERATION_KEY: generation})
+        if SAVE_FORMAT == "snapshot":
+            write_snapshot(self.snapshot_path, stamped)
+        else:
+            write_atomic(self.path, json.dumps(stamped, indent=4))
+        # The old log is now redundant; if we crash before this, its stale header keeps it from being replayed
+        write_atomic(self.log_path, json.dumps({GENERATION_KEY: generation}) + "\n")
+        self._generation = generation
+        self._log_entries = 0
+        self._remember(state)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(path=STATE_FILE):
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = StateStore(path)
+        return _stores[path]
+
+def close_store(path=STATE_FILE):
+    """
+    Forgets the store for a save file; the next load reads it from disk again.
+    """
+    with _stores_lock:
+        _stores.pop(path, None)
+
+def load_game(path=STATE_FILE):
+    with span("store.load"):
+        return get_store(path).load()
+
+def save_game(state_data, path=STATE_FILE):
     try:
-        with open(STATE_FILE, 'w') as f:
-            json.dump(state_data, f, indent=4)
+        with span("store.save"):
+            get_store(path).save(state_data)
     except Exception as e:
-        print(f"Error saving game: {e}")
\ No newline at end of file
+        print(f"Error saving game: {e}")
@@ -0,0 +1,189 @@
+class EntityRef:
+    """
+    Index record for one named thing in the world. Slots keep these small
+    when a world has thousands of them; the entities themselves stay plain
+    dicts, since they are the JSON save.
+    """
+    __slots__ = ("kind", "id", "name")
+
+    def __init__(self, kind, id, name):
+        self.kind = kind
+        self.id = id
+        self.name = name
+
+    def __repr__(self):
+        return f"EntityRef({self.kind!r}, {self.id!r}, {self.name!r})"
+
+def _item_name(item):
+    return item.get("name", "") if isinstance(item, dict) else str(item)
+
+class WorldState(dict):
+    """
+    The game state dict plus secondary indexes for the lookups every turn makes:
+    NPCs by location, lowercase names of items/NPCs/locations, and journal topics.
+
+    It is still a plain dict to everything else (JSON, save_game, prompts).
+    Mutate through the methods below to keep the indexes current. Replacing
+    'player', 'npcs' or 'locations' outright marks them stale; any other
+    edit made straight to an entity dict (renaming an NPC, swapping an
+    inventory entry) must be followed by invalidate(). Indexes are built
+    lazily on first use after that, and as a backstop whenever the number
+    of NPCs, locations, items or journal entries changed behind their back.
+
+    The methods also note which NPCs, locations and journal entries changed,
+    for the semantic index to pick up with take_changes().
+    """
+    __slots__ = ("_npcs_by_location", "_names", "_journal_topics", "_signature", "_changed", "__weakref__")
+
+    INDEXED = ("player", "npcs", "locations")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._signature = None
+        self._changed = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if key in self.INDEXED:
+            self.invalidate()
+
+    @classmethod
+    def wrap(cls, state):
+        return state if isinstance(state, cls) else cls(state)
+
+    def invalidate(self):
+        """
+        Marks the indexes stale after an edit that bypassed the methods below.
+        """
+        self._signature = None
+        self._changed = None
+
+    def mark_changed(self, kind, id):
+        """
+        Notes an edit to one NPC, location or journal entry (by topic) made outside the methods below.
+        """
+        changed = getattr(self, "_changed", None)
+        if changed is not None:
+            changed.add((kind, id))
+
+    def take_changes(self):
+        """
+        The (kind, id) pairs changed since the last call, or None if anything
+        may have (a new wrapper, or after invalidate()).
+        """
+        changed = getattr(self, "_changed", None)
+        self._changed = set()
+        return changed
+
+    # --- INDEXES ---
+    def _sizes(self):
+        player = self.get("player", {})
+        return (
+            len(self.get("npcs", {})), len(self.get("locations", {})),
+            len(player.get("inventory", [])), len(player.get("journal", []))
+        )
+
+    def _ensure(self):
+        if self._signature != self._sizes():
+            self.rebuild()
+
+    def rebuild(self):
+        self._npcs_by_location = {}
+        self._names = {"item": {}, "npc": {}, "location": {}}
+        self._journal_topics = set()
+        for nid, npc in self.get("npcs", {}).items():
+            self._index_npc(nid, npc)
+        for lid, loc in self.get("locations", {}).items():
+            self._index_name("location", lid, loc.get("name", ""))
+        for item in self.get("player", {}).get("inventory", []):
+            self._index_name("item", _item_name(item), _item_name(item))
+        for entry in self.get("player", {}).get("journal", []):
+            self._journal_topics.add(entry.get("topic"))
+        self._signature = self._sizes()
+
+    def _index_name(self, kind, id, name):
+        if name:
+            self._names[kind].setdefault(name.lower(), EntityRef(kind, id, name))
+
+    def _index_npc(self, nid, npc):
+        self._npcs_by_location.setdefault(npc.get("location_id"), set()).add(nid)
+        self._index_name("npc", nid, npc.get("name", ""))
+
+    # --- LOOKUPS ---
+    def npcs_at(self, loc_id):
+        self._ensure()
+        npcs = self.get("npcs", {})
+        return {nid: npcs[nid] for nid in self._npcs_by_location.get(loc_id, ()) if nid in npcs}
+
+    def find(self, kind, name):
+        """
+        Returns the EntityRef for a name (case-insensitive), or None.
+        """
+        self._ensure()
+        return self._names[kind].get(str(name).lower())
+
+    def names(self, kind):
+        self._ensure()
+        return list(self._names[kind])
+
+    def has_item(self, name):
+        return self.find("item", name) is not None
+
+    def has_journal_topic(self, topic):
+        self._ensure()
+        return topic in self._journal_topics
+
+    # --- MUTATIONS ---
+    def add_item(self, item, dedupe=True):
+        self._ensure()
+        name = _item_name(item)
+        if dedupe and self.has_item(name):
+            return False
+        self.setdefault("player", {}).setdefault("inventory", []).append(item)
+        self._index_name("item", name, name)
+        self._signature = self._sizes()
+        return True
+
+    def add_npc(self, nid, npc):
+        self._ensure()
+        if nid in self.get("npcs", {}):
+            return False
+        self.setdefault("npcs", {})[nid] = npc
+        self._index_npc(nid, npc)
+        self.mark_changed("npc", nid)
+        self._signature = self._sizes()
+        return True
+
+    def update_npc(self, nid, changes):
+        self._ensure()
+        npc = self.get("npcs", {}).get(nid)
+        if npc is None:
+            return False
+        self._npcs_by_location.get(npc.get("location_id"), set()).discard(nid)
+        old_ref = self._names["npc"].get(str(npc.get("name", "")).lower())
+        if old_ref is not None and old_ref.id == nid:
+            del self._names["npc"][old_ref.name.lower()]
+        npc.update(changes)
+        self._index_npc(nid, npc)
+        self.mark_changed("npc", nid)
+        return True
+
+    def add_location(self, lid, location):
+        self._ensure()
+        if lid in self.get("locations", {}):
+            return False
+        self.setdefault("locations", {})[lid] = location
+        self._index_name("location", lid, location.get("name", ""))
+        self.mark_changed("location", lid)
+        self._signature = self._sizes()
+        return True
+
+    def add_journal_entry(self, entry):
+        self._ensure()
+        if entry.get("topic") in self._journal_topics:
+            return False
+        self.setdefault("player", {}).setdefault("journal", []).append(entry)
+        self._journal_topics.add(entry.get("topic"))
+        self.mark_changed("journal", entry.get("topic"))
+        self._signature = self._sizes()
+        return True
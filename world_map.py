@@ -0,0 +1,108 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from world import WorldState
+
+NEIGHBORHOOD_THRESHOLD = 40  # Worlds bigger than this default to the local view
+DEFAULT_HOPS = 2
+CACHE_SIZE = 64
+
+_rendered = OrderedDict()  # digest -> (dot source, svg or None)
+_lock = threading.Lock()
+
+def _exit_target(exit_name):
+    return exit_name[len("Back to "):] if exit_name.startswith("Back to ") else exit_name
+
+def exit_edges(state):
+    """
+    (from_id, to_id) pairs for every exit whose name matches a known location.
+    Exits that are still just visual descriptions have nowhere to point yet.
+    """
+    world = WorldState.wrap(state)
+    edges = set()
+    for loc_id, loc in state.get("locations", {}).items():
+        for exit_name in loc.get("exits", []):
+            ref = world.find("location", _exit_target(exit_name))
+            if ref and ref.id != loc_id:
+                edges.add((loc_id, ref.id))
+    return sorted(edges)
+
+def neighborhood(state, edges, hops):
+    """
+    Location ids within 'hops' exits of the player, following exits both ways.
+    """
+    start = state.get("current_location_id")
+    adjacent = {}
+    for a, b in edges:
+        adjacent.setdefault(a, set()).add(b)
+        adjacent.setdefault(b, set()).add(a)
+    seen = {start}
+    frontier = deque([(start, 0)])
+    while frontier:
+        loc_id, depth = frontier.popleft()
+        if depth == hops:
+            continue
+        for nxt in adjacent.get(loc_id, ()):
+            if nxt not in seen:
+                seen.add(nxt)
+                frontier.append((nxt, depth + 1))
+    return seen
+
+def map_digest(state, hops=None):
+    """
+    Hash of everything the drawing depends on: the shown locations' names,
+    the exits between them, where the player is and the view radius.
+    """
+    edges = exit_edges(state)
+    locations = state.get("locations", {})
+    shown = set(locations) if hops is None else neighborhood(state, edges, hops)
+    payload = json.dumps([
+        sorted((lid, locations[lid].get("name", "")) for lid in shown if lid in locations),
+        [e for e in edges if e[0] in shown and e[1] in shown],
+        state.get("current_location_id"),
+        hops
+    ])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest(), shown, edges
+
+def _build_graph(state, shown, edges):
+    import graphviz
+    graph = graphviz.Digraph()
+    graph.attr(rankdir='LR', size='10', bgcolor='transparent')
+    current = state.get("current_location_id")
+    for loc_id, loc_data in state.get("locations", {}).items():
+        if loc_id not in shown:
+            continue
+        if loc_id == current:
+            graph.node(loc_id, label=loc_data.get("name", loc_id), style='filled', fillcolor='#ffcccc', shape='box')
+        else:
+            graph.node(loc_id, label=loc_data.get("name", loc_id), shape='ellipse', style='filled', fillcolor='#f0f2f6')
+    for a, b in edges:
+        if a in shown and b in shown:
+            graph.edge(a, b)
+    return graph
+
+def render_map(state, hops=None):
+    """
+    Returns (dot_source, svg) for the map, memoized by map_digest. svg is None
+    when the Graphviz binaries are missing; the DOT source can still be drawn
+    client-side.
+    """
+    digest, shown, edges = map_digest(state, hops)
+    with _lock:
+        if digest in _rendered:
+            _rendered.move_to_end(digest)
+            return _rendered[digest]
+
+    graph = _build_graph(state, shown, edges)
+    try:
+        svg = graph.pipe(format="svg").decode("utf-8")
+        svg = svg[svg.find("<svg"):]  # Drop the XML prolog so it can be inlined
+    except Exception:
+        svg = None
+
+    with _lock:
+        _rendered[digest] = (graph.source, svg)
+        while len(_rendered) > CACHE_SIZE:
+            _rendered.popitem(last=False)
+    return graph.source, svg